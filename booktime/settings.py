@@ -127,6 +127,30 @@ MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media/")
 
 
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+
+# Local memory is only shared within a process, use a shared one in production
+# e.g. CACHE_BACKEND=django.core.cache.backends.memcached.MemcachedCache
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
+# Which of the caches above is used for the product pages (and how long)
+PRODUCT_PAGE_CACHE = "default"
+PRODUCT_PAGE_CACHE_TIMEOUT = 60 * 10
+
+
+# Product image renditions (True: generate them right away, no worker thread)
+
+RENDITIONS_EAGER = False
+
+
 # Email
 
 EMAIL_BACKEND = os.getenv("CURRENT_EMAIL_BACKEND")
@@ -178,6 +202,16 @@ AUTH_USER_MODEL = "main.User"
 LOGIN_REDIRECT_URL = "/"
 
 
+# Product listing (the amount of products per page)
+
+PRODUCT_LIST_PAGE_SIZE = int(os.getenv("PRODUCT_LIST_PAGE_SIZE", 3))
+
+
+# Basket (more copies of a product than that are refused)
+
+MAX_BASKET_QUANTITY = 100
+
+
 # Third-party library - django-debug-toolbar
 
 
@@ -226,6 +260,11 @@ REST_FRAMEWORK = {
     "PAGE_SIZE": 3,
 }
 
+# The dispatch API (`PaidOrderLineViewSet`) is paged by a cursor, a client
+# may ask for up to `DISPATCH_API_MAX_PAGE_SIZE` lines with '?page_size='
+DISPATCH_API_PAGE_SIZE = int(os.getenv("DISPATCH_API_PAGE_SIZE", 100))
+DISPATCH_API_MAX_PAGE_SIZE = 1000
+
 
 # Third-party library - channels
 
@@ -248,3 +287,25 @@ CHANNEL_LAYERS = {
         }
     }
 }
+
+
+# Presence (who is online in the customer-service chats, see main/presence.py)
+
+# 'main.presence.RedisPresence' once there's more than one worker
+PRESENCE_BACKEND = os.getenv(
+    "PRESENCE_BACKEND", "main.presence.InMemoryPresence"
+)
+PRESENCE_REDIS_ADDRESS = (
+    f"redis://{os.getenv('REDIS_URL', 'localhost')}:"
+    f"{os.getenv('REDIS_PORT', '6379')}"
+)
+PRESENCE_REDIS_POOL_SIZE = 4  # connections per worker
+PRESENCE_TIMEOUT = 30  # seconds, three missed heartbeats
+PRESENCE_COALESCE = 5  # seconds
+
+
+# Chat history (see main/chat.py)
+
+CHAT_HISTORY_SIZE = 50  # messages sent on connect, and per page of the API
+CHAT_FLUSH_INTERVAL = 1  # seconds
+CHAT_FLUSH_SIZE = 100  # messages
@@ -7,6 +7,23 @@ var imageStyle = {
     display: 'inline-block',
 };
 
+// The WebP rendition for the browsers that support it, the JPEG otherwise
+function picture(webp, imageProps) {
+    if (!webp) {
+        return e('img', imageProps);
+    }
+
+    return e(
+        'picture',
+        null,
+        e('source', {
+            type: 'image/webp',
+            srcSet: webp,
+        }),
+        e('img', imageProps)
+    );
+}
+
 class ImageBox extends React.Component {
     constructor(props) {
         super(props);
@@ -33,7 +50,7 @@ class ImageBox extends React.Component {
                     className: 'image',
                     key: i.image,
                 },
-                e('img', {
+                picture(i.thumbnail_webp, {
                     onClick: this.click.bind(this, i),
                     width: imagesize_thumnail,
                     src: i.thumbnail,
@@ -51,7 +68,7 @@ class ImageBox extends React.Component {
                 {
                     className: 'current-image',
                 },
-                e('img', {
+                picture(this.state.currentImage.image_webp, {
                     src: this.state.currentImage.image,
                     width: imagesize_fullres,
                 })
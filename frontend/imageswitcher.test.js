@@ -47,3 +47,52 @@ test('ImageBox switches images correctly', () => {
 
     expect(currentImage).not.toEqual(newImage);
 });
+
+test('ImageBox serves the WebP renditions with the JPEG as a fallback', () => {
+    var images = [
+        {
+            image: '1.jpg',
+            image_webp: '1.webp',
+            thumbnail: '1.thumb.jpg',
+            thumbnail_webp: '1.thumb.webp',
+        },
+        {
+            image: '2.jpg',
+            image_webp: '',
+            thumbnail: '2.thumb.jpg',
+            thumbnail_webp: '',
+        },
+    ];
+
+    const wrapper = Enzyme.shallow(
+        React.createElement(ImageBox, {
+            images: images,
+            imageStart: images[0],
+        })
+    );
+
+    const current = wrapper.find('.current-image > picture').first();
+    expect(current.find('source').prop('srcSet')).toEqual('1.webp');
+    expect(current.find('img').prop('src')).toEqual('1.jpg');
+    expect(
+        wrapper
+            .find('div.image')
+            .at(0)
+            .find('source')
+            .prop('srcSet')
+    ).toEqual('1.thumb.webp');
+
+    wrapper
+        .find('div.image')
+        .at(1)
+        .find('img')
+        .simulate('click');
+
+    expect(wrapper.find('.current-image picture').exists()).toBe(false);
+    expect(
+        wrapper
+            .find('.current-image > img')
+            .first()
+            .prop('src')
+    ).toEqual('2.jpg');
+});
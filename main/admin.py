@@ -1,22 +1,20 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
 import logging
-import tempfile
 
 from django.contrib import admin
+from django.contrib.admin.widgets import ForeignKeyRawIdWidget
 from django.utils.html import format_html
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
-from django.db.models.functions import TruncDay
+from django.utils import timezone
 from django.db.models import Avg, Count, Min, Sum  # noqa
-from django.urls import path
+from django.urls import NoReverseMatch, path, reverse
 from django.template.response import TemplateResponse
 from django import forms
 from django.shortcuts import get_object_or_404, render
 from django.http import HttpResponse
-from django.template.loader import render_to_string
-
-
-from weasyprint import HTML
+from django.utils.text import Truncator
 
+from . import invoices
 from . import models
 
 
@@ -152,25 +150,92 @@ class ProductImageAdmin(admin.ModelAdmin):
             )
         return "-"
 
+    list_select_related = ("product",)
+
     def product_name(self, obj):
         return obj.product.name
 
     thumbnail_tag.short_description = "Thumbnail"
 
 
-class BasketLineInLine(admin.TabularInline):
+class ProductRawIdWidget(ForeignKeyRawIdWidget):
+    """
+    The raw id widget of Django looks its object up to show it next to the
+    id, that's a query per line of an inline. The lines hand it their product
+    instead (see `ProductLineForm`).
+    """
+
+    product = None
+
+    def label_and_url_for_value(self, value):
+        product = self.product
+        if product is None or str(product.pk) != str(value):
+            return super().label_and_url_for_value(value)
+
+        try:
+            url = reverse(
+                f"{self.admin_site.name}:main_product_change",
+                args=(product.pk,),
+            )
+        except NoReverseMatch:
+            url = ""
+
+        return Truncator(product).words(14), url
+
+
+class ProductLineForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Every form has its own copy of the fields (and widgets)
+        field = self.fields.get("product")
+        if field and isinstance(field.widget, ProductRawIdWidget):
+            if self.instance.product_id is not None:
+                field.widget.product = self.instance.product
+
+
+class ProductLineInline(admin.TabularInline):
+    """
+    The lines (of baskets or orders) come with their products, one query for
+    all of them rather than one per line.
+    """
+
+    form = ProductLineForm
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("product")
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == "product" and "product" in self.raw_id_fields:
+            kwargs["widget"] = ProductRawIdWidget(
+                db_field.remote_field,
+                self.admin_site,
+                using=kwargs.get("using"),
+            )
+
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class BasketLineInLine(ProductLineInline):
     model = models.BasketLine
     raw_id_fields = ("product",)
 
 
 class BasketAdmin(admin.ModelAdmin):
-    list_display = ("id", "user", "status", "count")
+    """
+    The summary columns are maintained by the signals, listing them won't
+    cost a query per row.
+    """
+
+    list_display = ("id", "user", "status", "item_count", "total")
+    list_select_related = ("user",)
     list_editable = ("status",)
     list_filter = ("status",)
+    readonly_fields = ("item_count", "line_count", "total")
     inlines = (BasketLineInLine,)
 
 
-class OrderLineInline(admin.TabularInline):
+class OrderLineInline(ProductLineInline):
     model = models.OrderLine
     raw_id_fields = ("product",)
 
@@ -227,9 +292,9 @@ class AddressAdmin(admin.ModelAdmin):
 """ The role-specific classes """
 
 
-class CentralOfficeOrderLineInline(admin.TabularInline):
+class CentralOfficeOrderLineInline(ProductLineInline):
     model = models.OrderLine
-    readonly_fields = ("product",)
+    readonly_fields = ("product", "price")
 
 
 class CentralOfficeOrderAdmin(admin.ModelAdmin):
@@ -325,6 +390,8 @@ class PeriodSelectForm(forms.Form):
         (30, "30 days"),
         (60, "60 days"),
         (90, "90 days"),
+        (180, "180 days"),
+        (365, "365 days"),
     )
     period = forms.TypedChoiceField(choices=PERIODS, coerce=int, required=True)
 
@@ -354,6 +421,8 @@ class ReportingColoredAdminSite(ColoredAdminSite):
     the index page (I don't quite understand what is "list from").
     """
 
+    MOST_BOUGHT_PRODUCTS = 10
+
     def get_urls(self):
         urls = super().get_urls()
 
@@ -361,6 +430,7 @@ class ReportingColoredAdminSite(ColoredAdminSite):
             path(
                 route="orders_per_day/",
                 view=self.admin_view(self.orders_per_day),
+                name="orders_per_day",
             ),
             path(
                 route="most_bought_products/",
@@ -372,17 +442,17 @@ class ReportingColoredAdminSite(ColoredAdminSite):
         return my_urls + urls
 
     def orders_per_day(self, request):
-        starting_day = datetime.now() - timedelta(days=180)
+        starting_day = timezone.localdate() - timedelta(days=180)
 
-        # Notes on this long expression:
-        # 1. Use `str(order_data`.query)` to get the actual SQL code
-        # 2. TruncDay here is simply used to "chunk down" the precision :)
-        # 3. The `.values` behaves just like the one for dict (a list of dicts)
+        # Notes on this expression:
+        # 1. The daily stats are precomputed (one row per day and country),
+        #    see `OrderDailyStats`, we only add up the countries here
+        # 2. The `.values` behaves just like the one for dict (a list of dicts)
         order_data = (
-            models.Order.objects.filter(date_added__gt=starting_day)
-            .annotate(day=TruncDay("date_added"))
+            models.OrderDailyStats.objects.filter(day__gt=starting_day)
             .values("day")
-            .annotate(c=Count("id"))
+            .annotate(c=Sum("orders"))
+            .order_by("day")
         )
 
         # => labels: [ '2020-02-07' ]
@@ -407,20 +477,19 @@ class ReportingColoredAdminSite(ColoredAdminSite):
 
             if form.is_valid():
                 days = form.cleaned_data["period"]
-                starting_day = datetime.now() - timedelta(days=days)
-
-                data = (
-                    models.OrderLine.objects.filter(
-                        order__date_added__gt=starting_day
-                    )
-                    .values("product__name")
-                    .annotate(c=Count("id"))
+                today = timezone.localdate()
+
+                # The sales are precomputed per product, per month and per
+                # day (see `ProductDailySales.top_products`), the cost
+                # doesn't grow with the period
+                data = models.ProductDailySales.objects.top_products(
+                    start=today - timedelta(days=days),
+                    end=today,
+                    n=self.MOST_BOUGHT_PRODUCTS,
                 )
 
-                logger.info(msg=f"most_bought_products query: {data.query}")
-
-                labels = [x["product__name"] for x in data]
-                values = [x["c"] for x in data]
+                labels = [product.name for product, quantity in data]
+                values = [quantity for product, quantity in data]
 
         else:
             form = PeriodSelectForm()
@@ -469,29 +538,19 @@ class InvoiceMixin:
         return my_urls + urls
 
     def invoice_for_order(self, request, order_id):
-        order = get_object_or_404(models.Order, pk=order_id)
+        order = get_object_or_404(invoices.orders(), pk=order_id)
 
         if request.GET.get("format") == "pdf":
-            html_string = render_to_string(
-                template_name="invoice.html", context={"order": order}
+            pdf = invoices.get_invoice_pdf(
+                order, base_url=request.build_absolute_uri()
             )
-            html = HTML(
-                string=html_string, base_url=request.build_absolute_uri()
-            )
-            result = html.write_pdf()
 
-            response = HttpResponse(content_type="application/pdf")
+            response = HttpResponse(
+                content=pdf, content_type="application/pdf"
+            )
             response["Content-Disposition"] = "inline; filename=invoice.pdf"
             response["Content-Transfer-Encoding"] = "binary"
 
-            with tempfile.NamedTemporaryFile(delete=True) as output:
-                output.write(result)
-                output.flush()
-                output = open(file=output.name, mode="rb")
-
-                binary_pdf = output.read()
-                response.write(binary_pdf)
-
             return response
 
         return render(
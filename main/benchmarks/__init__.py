@@ -0,0 +1,6 @@
+"""
+Benchmarks of the site, run them with './manage.py benchmark <suite>'.
+
+Each suite is a function taking the options of the command and returning
+its metrics (see `stats.summarize`), it runs in a throwaway test database.
+"""
@@ -0,0 +1,203 @@
+"""
+Load test of the customer-service chat.
+
+Every room is an order with `clients` websockets: its owner and employees.
+They go through the whole ASGI application (`booktime.routing`, session and
+auth middlewares included) with the in-memory channel layer, so it measures
+our code rather than Redis or the network:
+- how long a connection takes to be accepted (and its database queries)
+- how long a message takes to reach everybody in the room
+- how much memory a connection holds on to
+"""
+import asyncio
+import time
+
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+
+from django.conf import settings
+from django.contrib.auth import (
+    BACKEND_SESSION_KEY,
+    HASH_SESSION_KEY,
+    SESSION_KEY,
+)
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.contrib.sessions.backends.db import SessionStore
+
+from booktime.routing import application
+from main import chat
+from main import consumers
+from main import models
+
+from .stats import QueryCounter, summarize, traced_memory
+
+EMAIL_DOMAIN = "benchmark.booktime.com"
+MEMORY_SAMPLE_SIZE = 100
+
+
+def create_users(prefix, count, **fields):
+    models.User.objects.bulk_create(
+        [
+            models.User(
+                email=f"{prefix}{i}@{EMAIL_DOMAIN}",
+                password=make_password(None),
+                **fields,
+            )
+            for i in range(count)
+        ]
+    )
+
+    # The primary keys are only set by `bulk_create` on PostgreSQL
+    return list(
+        models.User.objects.filter(
+            email__startswith=prefix, email__endswith=f"@{EMAIL_DOMAIN}"
+        ).order_by("id")
+    )
+
+
+def login(user):
+    session = SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = "django.contrib.auth.backends.ModelBackend"
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+
+    return session.session_key
+
+
+def create_rooms(rooms, clients):
+    """
+    Return the session keys of the clients of each room, by order id.
+    """
+    customers = create_users("customer", rooms)
+    employees = create_users("employee", clients - 1, is_staff=True)
+    Group.objects.get_or_create(name="Employees")[0].user_set.add(*employees)
+
+    models.Order.objects.bulk_create(
+        [models.Order(user=customer) for customer in customers]
+    )
+    orders = models.Order.objects.filter(user__in=customers).order_by("id")
+
+    employee_sessions = [login(employee) for employee in employees]
+
+    return {
+        order.id: [login(order.user)] + employee_sessions
+        for order in orders.select_related("user")
+    }
+
+
+def communicator(order_id, session_key):
+    cookie = f"{settings.SESSION_COOKIE_NAME}={session_key}"
+
+    return WebsocketCommunicator(
+        application,
+        f"/ws/customer-service/{order_id}/",
+        headers=[(b"cookie", cookie.encode())],
+    )
+
+
+async def connect(order_id, session_key, timeout, durations):
+    client = communicator(order_id, session_key)
+
+    started = time.perf_counter()
+    connected, _ = await client.connect(timeout=timeout)
+    durations.append(time.perf_counter() - started)
+
+    if not connected:
+        raise RuntimeError(f"Connection refused in room {order_id}")
+
+    return client
+
+
+async def connect_room(order_id, session_keys, timeout, durations):
+    return await asyncio.gather(
+        *[
+            connect(order_id, session_key, timeout, durations)
+            for session_key in session_keys
+        ]
+    )
+
+
+async def receive_message(client, message, timeout):
+    """
+    Skip the other frames (history, joins, presence) until the message.
+    """
+    while True:
+        event = await client.receive_json_from(timeout=timeout)
+        if event["type"] == "chat_message" and event["message"] == message:
+            return time.perf_counter()
+
+
+async def fan_out(clients, message, timeout):
+    """
+    Return how long the message took to reach each client of the room.
+    """
+    sender = clients[0]
+    sent = time.perf_counter()
+    await sender.send_json_to({"type": "message", "message": message})
+
+    received = await asyncio.gather(
+        *[receive_message(client, message, timeout) for client in clients]
+    )
+    return [moment - sent for moment in received]
+
+
+async def run_rooms(sessions, messages, timeout):
+    connect_durations = []
+    fan_out_durations = []
+
+    with QueryCounter() as queries:
+        connected = await asyncio.gather(
+            *[
+                connect_room(order_id, keys, timeout, connect_durations)
+                for order_id, keys in sessions.items()
+            ]
+        )
+        # Including what the connections left for later (`last_spoken_to`)
+        await asyncio.gather(*consumers.ChatConsumer.background_tasks)
+
+    rooms = dict(zip(sessions.keys(), connected))
+    connections = len(connect_durations)
+
+    for i in range(messages):
+        for durations in await asyncio.gather(
+            *[
+                fan_out(clients, f"Message {i} to room {order_id}", timeout)
+                for order_id, clients in rooms.items()
+            ]
+        ):
+            fan_out_durations.extend(durations)
+
+    # The memory is measured apart, tracing slows everything down
+    sample = list(sessions.items())[:MEMORY_SAMPLE_SIZE]
+    with traced_memory() as memory:
+        sampled = [
+            await connect(order_id, keys[0], timeout, [])
+            for order_id, keys in sample
+        ]
+        # Let the room settle (join and presence events, background tasks)
+        await asyncio.sleep(0.1)
+
+    clients = sampled + [
+        client for room_clients in rooms.values() for client in room_clients
+    ]
+    await asyncio.gather(*[client.disconnect() for client in clients])
+    await chat.message_buffer.flush()
+
+    return {
+        "connections": connections,
+        "connect_seconds": summarize(connect_durations),
+        "fan_out_seconds": summarize(fan_out_durations),
+        "queries_per_connect": queries.count / connections,
+        "memory_per_connection": memory["allocated"] / len(sampled),
+    }
+
+
+def run(rooms=100, clients=2, messages=1, timeout=30, **options):
+    sessions = create_rooms(rooms, clients)
+
+    # Start cold, every connection is authorized for real
+    consumers.ChatConsumer.acl_cache.clear()
+
+    return async_to_sync(run_rooms)(sessions, messages, timeout)
@@ -0,0 +1,462 @@
+"""
+A production-shaped dataset, generated with bulk inserts.
+
+Everything is drawn from a `random.Random(seed)`: the same seed and sizes
+give the same rows (into an empty database, with the same `end` day).
+The distributions are rough but realistic ones:
+- a few bestsellers sell most of the copies, the long tail hardly any
+  (Zipf-like popularity of the products, the tags and the customers)
+- log-normal prices, mostly between 5 and 50
+- one to a few lines per order, nearly always one copy of each product
+- more orders lately than a year ago, the old ones done, the recent ones
+  new or paid
+
+The rows get explicit primary keys (after the ones already there), so this
+works the same on every database, and the sequences are reset afterwards.
+No signal is sent by `bulk_create`: the summaries of the baskets are
+computed here and the reporting rollups rebuilt at the end.
+"""
+
+from array import array
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import accumulate, islice
+import math
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max
+from django.template.defaultfilters import slugify
+from django.utils import timezone
+
+from main import models
+
+EMAIL_DOMAIN = "dataset.booktime.com"
+
+# fmt: off
+GENRES = (
+    "Fiction", "History", "Science", "Biography", "Poetry", "Travel",
+    "Cooking", "Business", "Philosophy", "Politics", "Art", "Children",
+    "Fantasy", "Crime", "Romance", "Health", "Religion", "Sports",
+    "Technology", "Economics",
+)
+ADJECTIVES = (
+    "Silent", "Hidden", "Last", "Lost", "Golden", "Broken", "Wild", "Dark",
+    "Little", "Endless", "Quiet", "Burning", "Secret", "Distant", "Open",
+)
+NOUNS = (
+    "River", "Garden", "Empire", "Night", "Island", "Machine", "City",
+    "Winter", "Road", "Mirror", "Kingdom", "Storm", "House", "Map", "Sea",
+)
+FIRST_NAMES = (
+    "Alice", "Bob", "Carol", "David", "Emma", "Frank", "Grace", "Henry",
+    "Isla", "Jack", "Kate", "Liam", "Mia", "Noah", "Olivia", "Peter",
+)
+LAST_NAMES = (
+    "Smith", "Jones", "Brown", "Taylor", "Wilson", "Davies", "Evans",
+    "Thomas", "Johnson", "Roberts", "Walker", "Wright", "Green", "Hall",
+)
+CITIES = {
+    "uk": ("London", "Manchester", "Bristol", "Leeds", "Glasgow"),
+    "us": ("New York", "Chicago", "Seattle", "Austin", "Boston"),
+}
+# fmt: on
+
+# Copies of a product in a line, and how likely each is
+QUANTITIES = (1, 2, 3, 4, 5)
+QUANTITY_WEIGHTS = (80, 12, 5, 2, 1)
+
+# Orders older than that are done, the recent ones could be anything
+SHIPPING_DAYS = 14
+
+
+@contextmanager
+def explicit_dates(model):
+    """
+    Keep the dates given to the instances, `auto_now` and `auto_now_add`
+    would otherwise replace them with the current time.
+    """
+    fields = [
+        field
+        for field in model._meta.concrete_fields
+        if getattr(field, "auto_now", False)
+        or getattr(field, "auto_now_add", False)
+    ]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def next_id(model):
+    return (model.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+
+
+def zipf_weights(count, exponent=1.0):
+    """
+    The cumulative weights of `count` ranks, the first one the most likely.
+    """
+    return array(
+        "d", accumulate(1 / rank ** exponent for rank in range(1, count + 1))
+    )
+
+
+class Generator:
+    def __init__(self, seed=0, end=None, days=365, batch_size=5000):
+        self.random = random.Random(seed)
+        self.end = end or timezone.localdate()
+        self.days = days
+        self.batch_size = batch_size
+        self.counts = {}
+
+        # The ids of the generated products and their prices, in cents
+        self.product_ids = range(0)
+        self.prices = array("l")
+
+    def insert(self, model, objs):
+        """
+        Insert the (lazily generated) instances a batch at a time.
+        """
+        objs = iter(objs)
+        count = 0
+
+        while True:
+            batch = list(islice(objs, self.batch_size))
+            if not batch:
+                break
+
+            # Split further if the database needs it (SQLite does)
+            model.objects.bulk_create(batch)
+            count += len(batch)
+
+        name = model._meta.model_name
+        self.counts[name] = self.counts.get(name, 0) + count
+
+    def batches(self, ids):
+        for first in range(ids.start, ids.stop, self.batch_size):
+            yield range(first, min(first + self.batch_size, ids.stop))
+
+    def popular(self, ids, exponent=1.0):
+        """
+        A sampler of the ids, a few of them far more likely than the rest
+        (which ones is random).
+        """
+        ranked = list(ids)
+        self.random.shuffle(ranked)
+        weights = zipf_weights(len(ranked), exponent)
+
+        def sample(k=1):
+            return self.random.choices(ranked, cum_weights=weights, k=k)
+
+        return sample
+
+    def moment(self, days_ago):
+        day = self.end - timedelta(days=days_ago)
+        seconds = self.random.randrange(24 * 60 * 60)
+
+        return timezone.make_aware(
+            datetime.combine(day, time()) + timedelta(seconds=seconds)
+        )
+
+    def price_of(self, product_id):
+        return Decimal(self.prices[product_id - self.product_ids.start]) / 100
+
+    def quantity(self):
+        return self.random.choices(QUANTITIES, QUANTITY_WEIGHTS)[0]
+
+    def tags(self, count):
+        start = next_id(models.ProductTag)
+        ids = range(start, start + count)
+
+        def build():
+            for i, tag_id in enumerate(ids):
+                genre = GENRES[i % len(GENRES)]
+                name = genre if i < len(GENRES) else f"{genre} {i}"
+                yield models.ProductTag(
+                    id=tag_id, name=name, slug=f"{slugify(name)}-{tag_id}"
+                )
+
+        self.insert(models.ProductTag, build())
+
+        return ids
+
+    def products(self, count, tag_ids):
+        start = next_id(models.Product)
+        self.product_ids = range(start, start + count)
+        random_tags = self.popular(tag_ids, exponent=0.8)
+
+        def build():
+            for product_id in self.product_ids:
+                # Log-normal, the median around 15
+                cents = round(math.exp(self.random.gauss(2.7, 0.6)) * 100)
+                self.prices.append(min(max(cents, 99), 99999))
+
+                name = (
+                    f"{self.random.choice(ADJECTIVES)} "
+                    f"{self.random.choice(NOUNS)} {product_id}"
+                )
+                yield models.Product(
+                    id=product_id,
+                    name=name,
+                    slug=f"{slugify(name)}-{product_id}",
+                    price=self.price_of(product_id),
+                    active=self.random.random() < 0.95,
+                    in_stock=self.random.random() < 0.9,
+                )
+
+        def build_tags():
+            for product_id in self.product_ids:
+                for tag_id in set(random_tags(k=self.random.randint(1, 3))):
+                    yield models.Product.tags.through(
+                        product_id=product_id, producttag_id=tag_id
+                    )
+
+        self.insert(models.Product, build())
+        if tag_ids:
+            self.insert(models.Product.tags.through, build_tags())
+
+        return self.product_ids
+
+    def address_of(self, user_id):
+        """
+        The address of a customer, derived from the id (nothing to keep).
+        """
+        country = "uk" if user_id % 3 else "us"
+        cities = CITIES[country]
+
+        return {
+            "name": (
+                f"{FIRST_NAMES[user_id % len(FIRST_NAMES)]} "
+                f"{LAST_NAMES[user_id // 7 % len(LAST_NAMES)]}"
+            ),
+            "address1": f"{user_id % 200 + 1} Main Street",
+            "postal_code": f"{10000 + user_id % 89999}",
+            "city": cities[user_id // 11 % len(cities)],
+            "country": country,
+        }
+
+    def users(self, count):
+        start = next_id(models.User)
+        ids = range(start, start + count)
+        # Nobody logs in with these, one unusable password will do
+        password = make_password(None)
+
+        def build():
+            for user_id in ids:
+                first_name, last_name = self.address_of(user_id)[
+                    "name"
+                ].split()
+                yield models.User(
+                    id=user_id,
+                    email=f"user{user_id}@{EMAIL_DOMAIN}",
+                    password=password,
+                    first_name=first_name,
+                    last_name=last_name,
+                )
+
+        def build_addresses():
+            for user_id in ids:
+                yield models.Address(
+                    user_id=user_id, **self.address_of(user_id)
+                )
+
+        self.insert(models.User, build())
+        self.insert(models.Address, build_addresses())
+
+        return ids
+
+    def status_of_order(self, days_ago):
+        if days_ago > SHIPPING_DAYS:
+            return models.Order.DONE
+
+        return self.random.choice(
+            (models.Order.NEW, models.Order.PAID, models.Order.DONE)
+        )
+
+    def status_of_line(self, order_status):
+        if order_status == models.Order.NEW:
+            return models.OrderLine.NEW
+        if order_status == models.Order.PAID:
+            return self.random.choice(
+                (models.OrderLine.NEW, models.OrderLine.PROCESSING)
+            )
+        if self.random.random() < 0.05:
+            return models.OrderLine.CANCELLED
+
+        return models.OrderLine.SENT
+
+    def lines_per_order(self):
+        """
+        One line, then a geometric tail (about 2 lines per order on average).
+        """
+        count = 1
+        while count < 10 and self.random.random() < 0.5:
+            count += 1
+
+        return count
+
+    def order(self, order_id, random_user, random_products, lines):
+        # More and more orders over time
+        days_ago = int(self.days * (1 - math.sqrt(self.random.random())))
+        date_added = self.moment(days_ago)
+        status = self.status_of_order(days_ago)
+        # Paid, sent... some time before today
+        updated_after = timedelta(
+            hours=self.random.randint(0, max(days_ago - 1, 0) * 24)
+        )
+        user_id = random_user()[0]
+        address = self.address_of(user_id)
+
+        for product_id in set(random_products(self.lines_per_order())):
+            lines.append(
+                models.OrderLine(
+                    order_id=order_id,
+                    product_id=product_id,
+                    quantity=self.quantity(),
+                    price=self.price_of(product_id),
+                    status=self.status_of_line(status),
+                )
+            )
+
+        return models.Order(
+            id=order_id,
+            user_id=user_id,
+            status=status,
+            date_added=date_added,
+            date_updated=date_added + updated_after,
+            **{
+                f"{kind}_{field}": value
+                for field, value in address.items()
+                for kind in ("billing", "shipping")
+            },
+        )
+
+    def orders(self, count, user_ids):
+        start = next_id(models.Order)
+        random_user = self.popular(user_ids, exponent=0.6)
+        random_products = self.popular(self.product_ids)
+
+        with explicit_dates(models.Order):
+            for order_ids in self.batches(range(start, start + count)):
+                lines = []
+                orders = [
+                    self.order(order_id, random_user, random_products, lines)
+                    for order_id in order_ids
+                ]
+                self.insert(models.Order, orders)
+                self.insert(models.OrderLine, lines)
+
+    def basket(self, basket_id, user_id, random_products, lines):
+        basket_lines = [
+            models.BasketLine(
+                basket_id=basket_id,
+                product_id=product_id,
+                quantity=self.quantity(),
+            )
+            for product_id in set(random_products(self.random.randint(1, 5)))
+        ]
+        lines.extend(basket_lines)
+
+        return models.Basket(
+            id=basket_id,
+            user_id=user_id,
+            item_count=sum(line.quantity for line in basket_lines),
+            line_count=len(basket_lines),
+            total=sum(
+                line.quantity * self.price_of(line.product_id)
+                for line in basket_lines
+            ),
+        )
+
+    def baskets(self, count, user_ids):
+        """
+        The open baskets, of visitors and of customers (one each at most),
+        with their summary.
+        """
+        start = next_id(models.Basket)
+        customers = self.random.sample(
+            user_ids, min(count * 3 // 5, len(user_ids))
+        )
+        owners = customers + [None] * (count - len(customers))
+        self.random.shuffle(owners)
+        random_products = self.popular(self.product_ids)
+
+        for basket_ids in self.batches(range(start, start + count)):
+            lines = []
+            baskets = [
+                self.basket(
+                    basket_id,
+                    owners[basket_id - start],
+                    random_products,
+                    lines,
+                )
+                for basket_id in basket_ids
+            ]
+            self.insert(models.Basket, baskets)
+            self.insert(models.BasketLine, lines)
+
+    def reset_sequences(self):
+        """
+        The ids were given explicitly, the sequences (of PostgreSQL) have
+        to catch up with them.
+        """
+        sequence_sql = connection.ops.sequence_reset_sql(
+            no_style(),
+            [
+                models.ProductTag,
+                models.Product,
+                models.User,
+                models.Address,
+                models.Order,
+                models.OrderLine,
+                models.Basket,
+                models.BasketLine,
+            ],
+        )
+        with connection.cursor() as cursor:
+            for sql in sequence_sql:
+                cursor.execute(sql)
+
+
+def generate(
+    tags=50,
+    products=10000,
+    users=5000,
+    orders=20000,
+    baskets=2000,
+    seed=0,
+    end=None,
+    days=365,
+    batch_size=5000,
+):
+    """
+    Generate the dataset and return how many rows of each model it has
+    inserted.
+    """
+    generator = Generator(seed=seed, end=end, days=days, batch_size=batch_size)
+
+    tag_ids = generator.tags(tags)
+    generator.products(products, tag_ids)
+    user_ids = generator.users(users)
+
+    if generator.product_ids:
+        if user_ids:
+            generator.orders(orders, user_ids)
+        generator.baskets(baskets, user_ids)
+
+    generator.reset_sequences()
+
+    # Not maintained by `bulk_create` (no signals)
+    models.OrderDailyStats.objects.rebuild()
+    models.ProductDailySales.objects.rebuild()
+    models.ProductMonthlySales.objects.rebuild()
+
+    return generator.counts
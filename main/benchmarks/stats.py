@@ -0,0 +1,124 @@
+"""
+Measuring helpers shared by the benchmark suites.
+"""
+from contextlib import contextmanager
+import math
+import threading
+import tracemalloc
+
+from django.db.backends.utils import CursorWrapper
+
+
+def percentile(values, percent):
+    """
+    The nearest-rank percentile of the values.
+    """
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+
+    return ordered[rank - 1]
+
+
+def summarize(values):
+    if not values:
+        return {"count": 0}
+
+    return {
+        "count": len(values),
+        "min": min(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
+
+
+class QueryCounter:
+    """
+    Count the queries of every connection (i.e. of all the threads), unlike
+    `CaptureQueriesContext` which only sees the one of the current thread.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        self.execute = CursorWrapper.execute
+        self.executemany = CursorWrapper.executemany
+        counter = self
+
+        # `CursorDebugWrapper` calls these too, queries are counted once
+        def execute(cursor, *args, **kwargs):
+            counter.add()
+            return counter.execute(cursor, *args, **kwargs)
+
+        def executemany(cursor, *args, **kwargs):
+            counter.add()
+            return counter.executemany(cursor, *args, **kwargs)
+
+        CursorWrapper.execute = execute
+        CursorWrapper.executemany = executemany
+
+        return self
+
+    def __exit__(self, *exc_info):
+        CursorWrapper.execute = self.execute
+        CursorWrapper.executemany = self.executemany
+
+    def add(self):
+        with self.lock:
+            self.count += 1
+
+
+@contextmanager
+def traced_memory():
+    """
+    Yield a dict which gets the bytes allocated in the block (and still
+    alive at its end) under "allocated", and the most it held at once under
+    "peak" (only meaningful if nothing was tracing before).
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+
+    before = tracemalloc.get_traced_memory()[0]
+    result = {}
+
+    try:
+        yield result
+    finally:
+        current, peak = tracemalloc.get_traced_memory()
+        result["allocated"] = current - before
+        result["peak"] = peak - before
+
+        if started:
+            tracemalloc.stop()
+
+
+def compare(metrics, baseline, tolerance=0.2):
+    """
+    The (name, baseline, current) of the metrics which got worse than the
+    baseline: durations and memory by more than `tolerance` (a ratio, with
+    the median of the summaries), queries by any amount.
+    """
+    regressions = []
+
+    for name, value in metrics.items():
+        if name not in baseline:
+            continue
+        if not any(kind in name for kind in ("seconds", "queries", "memory")):
+            continue
+
+        old, new = baseline[name], value
+        if isinstance(new, dict):
+            old, new = old.get("p50"), new.get("p50")
+        if old is None or new is None:
+            continue
+
+        allowed = old if "queries" in name else old * (1 + tolerance)
+        if new > allowed:
+            regressions.append((name, old, new))
+
+    return regressions
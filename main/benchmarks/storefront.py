@@ -0,0 +1,217 @@
+"""
+Benchmark of the journey of a customer through the storefront:
+browsing the products (all of them, then by tag), looking at one, adding it
+to the basket, reviewing the basket and picking the addresses.
+
+Every visit goes through two transports, on a generated dataset (see
+`dataset`):
+- Django's test client: the whole middleware stack, no network
+- a local WSGI server (`wsgiref`) in a thread, over HTTP
+
+For each page it measures how long the requests take, how many queries
+they run and the peak memory they allocate. The debug toolbar is left
+out, it isn't there in production.
+"""
+from collections import defaultdict
+import http.client
+import random
+import threading
+import time
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from main import models
+
+from . import dataset
+from .stats import QueryCounter, summarize, traced_memory
+
+CUSTOMER_EMAIL = f"customer@{dataset.EMAIL_DOMAIN}"
+MEMORY_SAMPLE_SIZE = 10
+
+# Error statuses some pages may give without the run being broken: a
+# product already at `MAX_BASKET_QUANTITY` copies can't be added anymore
+EXPECTED_ERRORS = {"add_to_basket": {400}}
+
+
+def create_customer():
+    customer = models.User.objects.create_user(email=CUSTOMER_EMAIL)
+    generator = dataset.Generator()
+    models.Address.objects.bulk_create(
+        [
+            models.Address(user=customer, **generator.address_of(i))
+            for i in (1, 2)
+        ]
+    )
+
+    return customer
+
+
+def journeys(count, seed):
+    """
+    The pages of each visit, by name, the same ones for the same seed.
+
+    The products are drawn without replacement, a product only comes back
+    once all the others have been visited, so the basket fills up evenly
+    instead of piling copies of the same few products.
+    """
+    generator = random.Random(seed)
+    product_ids = list(
+        models.Product.objects.active().values_list("id", flat=True)
+    )
+    slugs = dict(models.Product.objects.values_list("id", "slug"))
+    tags = list(models.ProductTag.objects.values_list("slug", flat=True))
+
+    queue = []
+    for _ in range(count):
+        if not queue:
+            queue = generator.sample(product_ids, len(product_ids))
+        product_id = queue.pop()
+        tag = generator.choice(tags)
+
+        yield [
+            ("products", reverse("main:products", args=("all",))),
+            ("products_by_tag", reverse("main:products", args=(tag,))),
+            ("product", reverse("main:product", args=(slugs[product_id],))),
+            (
+                "add_to_basket",
+                f"{reverse('main:add_to_basket')}?product_id={product_id}",
+            ),
+            ("basket", reverse("main:basket")),
+            ("address_select", reverse("main:address_select")),
+        ]
+
+
+class ClientTransport:
+    name = "client"
+
+    def __init__(self, customer):
+        self.client = Client()
+        self.client.force_login(customer)
+
+    def get(self, path):
+        return self.client.get(path).status_code
+
+    def close(self):
+        pass
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class WSGITransport:
+    name = "wsgi"
+
+    def __init__(self, customer):
+        client = Client()
+        client.force_login(customer)
+        session_key = client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.cookie = f"{settings.SESSION_COOKIE_NAME}={session_key}"
+
+        self.server = make_server(
+            "127.0.0.1", 0, WSGIHandler(), handler_class=QuietRequestHandler
+        )
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        )
+        self.thread.start()
+        self.connection = http.client.HTTPConnection(
+            "127.0.0.1", self.server.server_port
+        )
+
+    def get(self, path):
+        # The server closes the connection after each response (HTTP/1.0),
+        # `HTTPConnection` opens a new one for the next request
+        self.connection.request("GET", path, headers={"Cookie": self.cookie})
+        response = self.connection.getresponse()
+        response.read()
+
+        return response.status
+
+    def close(self):
+        self.connection.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+def request(transport, name, path):
+    status = transport.get(path)
+
+    if status >= 400 and status not in EXPECTED_ERRORS.get(name, ()):
+        raise RuntimeError(f"{transport.name} got {status} from {path}")
+
+
+def measure(transport, all_visits):
+    durations = defaultdict(list)
+    queries = defaultdict(int)
+    peaks = defaultdict(list)
+
+    # Warm up (templates, caches, connections), not measured
+    for name, path in all_visits[0]:
+        request(transport, name, path)
+
+    for visit in all_visits:
+        for name, path in visit:
+            with QueryCounter() as counter:
+                started = time.perf_counter()
+                request(transport, name, path)
+                durations[name].append(time.perf_counter() - started)
+
+            queries[name] += counter.count
+
+    # The memory is measured apart, tracing slows everything down
+    for visit in all_visits[:MEMORY_SAMPLE_SIZE]:
+        for name, path in visit:
+            with traced_memory() as memory:
+                request(transport, name, path)
+
+            peaks[name].append(memory["peak"])
+
+    metrics = {}
+    for name in durations:
+        prefix = f"{transport.name}.{name}"
+        metrics[f"{prefix}.seconds"] = summarize(durations[name])
+        metrics[f"{prefix}.queries"] = queries[name] / len(durations[name])
+        metrics[f"{prefix}.memory_peak"] = summarize(peaks[name])["p50"]
+
+    return metrics
+
+
+def run(visits=50, products=1000, seed=0, **options):
+    dataset.generate(
+        products=products,
+        users=max(products // 2, 1),
+        orders=products * 2,
+        baskets=products // 5,
+        seed=seed,
+    )
+    customer = create_customer()
+    all_visits = list(journeys(visits, seed))
+
+    metrics = {}
+    with override_settings(
+        ALLOWED_HOSTS=["testserver", "127.0.0.1"],
+        MIDDLEWARE=[
+            middleware
+            for middleware in settings.MIDDLEWARE
+            if not middleware.startswith("debug_toolbar.")
+        ],
+    ):
+        for transport_class in (ClientTransport, WSGITransport):
+            # A new basket for each transport
+            models.Basket.objects.filter(user=customer).delete()
+
+            transport = transport_class(customer)
+            try:
+                metrics.update(measure(transport, all_visits))
+            finally:
+                transport.close()
+
+    return metrics
@@ -0,0 +1,61 @@
+"""
+Caching of the rendered product pages.
+
+A page is stored under a key made of the product id and its `date_updated`,
+so saving a product (or touching it, see the signals) makes a new key. The
+URL only knows the slug though, a small pointer `slug -> page key` is cached
+next to it, that's the one we delete to invalidate a page.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .models import Product
+
+
+def get_cache():
+    return caches[settings.PRODUCT_PAGE_CACHE]
+
+
+def page_key(product):
+    return f"product-page:{product.id}:{product.date_updated.timestamp()}"
+
+
+def pointer_key(slug):
+    return f"product-slug:{slug}"
+
+
+def get_product_page(slug):
+    cache = get_cache()
+    key = cache.get(pointer_key(slug))
+
+    if key is None:
+        return None
+
+    return cache.get(key)
+
+
+def set_product_page(product, content):
+    cache = get_cache()
+    key = page_key(product)
+
+    cache.set_many(
+        {key: content, pointer_key(product.slug): key},
+        timeout=settings.PRODUCT_PAGE_CACHE_TIMEOUT,
+    )
+
+
+def invalidate_product_pages(slugs):
+    get_cache().delete_many([pointer_key(slug) for slug in slugs])
+
+
+def touch_products(product_ids):
+    """
+    Bump `date_updated` (the cached fragments get a new key) and drop the
+    cached pages of the products.
+    """
+    products = Product.objects.filter(pk__in=product_ids)
+    slugs = list(products.values_list("slug", flat=True))
+
+    products.update(date_updated=timezone.now())
+    invalidate_product_pages(slugs)
@@ -0,0 +1,123 @@
+"""
+The history of the customer-service chats.
+
+The consumer doesn't write each message as it comes, it puts it into the
+`message_buffer` of the process, which writes them with one `bulk_create`
+every `CHAT_FLUSH_INTERVAL` seconds (or as soon as `CHAT_FLUSH_SIZE` of them
+are waiting). The messages still in the buffer are lost if the process dies
+before the next flush, and only show up in the API once they're written.
+"""
+import asyncio
+import logging
+
+from django.conf import settings
+from django.db.models import Q
+
+from channels.db import database_sync_to_async
+
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+
+def serialize(message):
+    return {
+        "username": message.user.get_full_name(),
+        "message": message.message,
+        "created": message.created.isoformat(),
+    }
+
+
+def history(order_id, before=None, size=None):
+    """
+    The last `size` stored messages of the chat of an order before a
+    `(created, id)` position (or up to now), oldest first. Also return
+    whether there are older ones.
+
+    The id tells apart the messages of the same moment, e.g. a page ending
+    in the middle of the messages written by the same flush.
+    """
+    size = size or settings.CHAT_HISTORY_SIZE
+
+    messages = (
+        ChatMessage.objects.filter(order_id=order_id)
+        .select_related("user")
+        .order_by("-created", "-id")
+    )
+    if before is not None:
+        created, pk = before
+        messages = messages.filter(
+            Q(created__lt=created) | Q(created=created, id__lt=pk)
+        )
+
+    page = list(messages[: size + 1])
+
+    return page[:size][::-1], len(page) > size
+
+
+def merge(stored, buffered, size=None):
+    """
+    The last `size` messages out of the stored and the buffered ones (a
+    message being written could be both), oldest first.
+    """
+    size = size or settings.CHAT_HISTORY_SIZE
+
+    messages = {
+        (message.user_id, message.created, message.message): message
+        for message in stored + buffered
+    }
+    ordered = sorted(messages.values(), key=lambda message: message.created)
+
+    return ordered[-size:]
+
+
+class MessageBuffer:
+    def __init__(self):
+        self.pending = []
+        self.in_flight = []
+        self.flush_handle = None
+
+    def buffered(self, order_id):
+        return [
+            message
+            for message in self.in_flight + self.pending
+            if message.order_id == order_id
+        ]
+
+    async def add(self, message):
+        self.pending.append(message)
+
+        if len(self.pending) >= settings.CHAT_FLUSH_SIZE:
+            await self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_event_loop().call_later(
+                settings.CHAT_FLUSH_INTERVAL,
+                lambda: asyncio.ensure_future(self.flush()),
+            )
+
+    async def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+
+        self.in_flight.extend(batch)
+        try:
+            await database_sync_to_async(ChatMessage.objects.bulk_create)(
+                batch
+            )
+        except Exception:
+            logger.exception(f"Lost {len(batch)} chat messages")
+        finally:
+            written = {id(message) for message in batch}
+            self.in_flight = [
+                message
+                for message in self.in_flight
+                if id(message) not in written
+            ]
+
+
+message_buffer = MessageBuffer()
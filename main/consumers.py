@@ -1,14 +1,15 @@
+import asyncio
 import logging
+import time
 
-from django.shortcuts import get_object_or_404
-import aioredis
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 
+from . import chat
 from . import models
+from .presence import get_presence, room_name
 
 
-REDIS_ADDR = "redis//localhost"
 logger = logging.getLogger(name="__name__")
 
 
@@ -16,28 +17,85 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
     EMPLOYEE = 2
     CLIENT = 1
 
+    # (user id, order id) -> (user type, expiry). ReconnectingWebSocket
+    # comes back over and over when the network is flaky, the answer is
+    # the same every time.
+    acl_cache = {}
+    ACL_CACHE_TIMEOUT = 30
+    ACL_CACHE_SIZE = 10000
+
+    # References to the fire-and-forget tasks (so they're not collected)
+    background_tasks = set()
+
     def get_user_type(self, user, order_id):
-        order = get_object_or_404(models.Order, pk=order_id)
+        owner_id = (
+            models.Order.objects.filter(pk=order_id)
+            .values_list("user_id", flat=True)
+            .first()
+        )
 
-        if user.is_employee:
-            order.last_spoken_to = user.order.save()
+        if owner_id is None:
+            return None
+        elif user.is_employee:
             return ChatConsumer.EMPLOYEE
-        elif order.user == user:
+        elif owner_id == user.id:
             return ChatConsumer.CLIENT
         else:
             return None
 
+    def set_last_spoken_to(self, user, order_id):
+        # Nothing to write when the same employee reconnects
+        models.Order.objects.filter(pk=order_id).exclude(
+            last_spoken_to=user
+        ).update(last_spoken_to=user)
+
+    def run_in_background(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        ChatConsumer.background_tasks.add(task)
+        task.add_done_callback(ChatConsumer.background_tasks.discard)
+
+    async def authorize(self, user, order_id):
+        """
+        The user type of a user in the chat of an order, from the cache when
+        it's been asked recently. `last_spoken_to` is updated in the
+        background for every employee who connects (another one may have
+        connected since), the connection doesn't wait for it.
+        """
+        key = (user.id, order_id)
+        now = time.monotonic()
+
+        cached = self.acl_cache.get(key)
+        if cached is not None and cached[1] > now:
+            user_type = cached[0]
+        else:
+            user_type = await database_sync_to_async(self.get_user_type)(
+                user, order_id
+            )
+
+            if len(self.acl_cache) >= self.ACL_CACHE_SIZE:
+                self.acl_cache.clear()
+            self.acl_cache[key] = (user_type, now + self.ACL_CACHE_TIMEOUT)
+
+        if user_type == ChatConsumer.EMPLOYEE:
+            self.run_in_background(
+                database_sync_to_async(self.set_last_spoken_to)(
+                    user, order_id
+                )
+            )
+
+        return user_type
+
     async def connect(self):
         self.order_id = self.scope["url_route"]["kwargs"]["order_id"]
-        self.room_group_name = f"customer-service_{self.order_id}"
+        self.room_group_name = room_name(self.order_id)
+        self.member = None
         authorized = False
 
         if self.scope["user"].is_anonymous:
             await self.close()
+            return
 
-        user_type = await database_sync_to_async(self.get_user_type)(
-            self.scope["user"], self.order_id
-        )
+        user_type = await self.authorize(self.scope["user"], self.order_id)
 
         if user_type == ChatConsumer.EMPLOYEE:
             logger.info(
@@ -52,12 +110,13 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             await self.close()
 
         if authorized:
-            self.redis_conn = await aioredis.create_redis(address=REDIS_ADDR)
+            self.member = self.scope["user"].email
 
             await self.channel_layer.group_add(
                 self.room_group_name, self.channel_name
             )
             await self.accept()
+            await self.send_history()
             await self.channel_layer.group_send(
                 self.room_group_name,
                 {
@@ -66,8 +125,14 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
                 },
             )
 
-    async def disconnect(self):
-        if not self.scope["user"].is_anonymous:
+            await get_presence().heartbeat(self.room_group_name, self.member)
+            await self.send_presence_to_room()
+
+    async def disconnect(self, close_code):
+        if self.member is not None:
+            await get_presence().leave(self.room_group_name, self.member)
+            await self.send_presence_to_room()
+
             await self.channel_layer.group_send(
                 self.room_group_name,
                 {
@@ -92,13 +157,51 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
                     "message": content["message"],
                 },
             )
+            await chat.message_buffer.add(
+                models.ChatMessage(
+                    order_id=self.order_id,
+                    user=self.scope["user"],
+                    message=content["message"],
+                )
+            )
         elif cont_type == "heartbeat":
-            await self.redis_conn.setex(
-                key=f"{self.room_group_name}_{self.scope['user'].email}",
-                seconds=10,
-                value="1",  # a dummy value
+            await get_presence().heartbeat(self.room_group_name, self.member)
+        elif cont_type == "presence":
+            await self.send_json(
+                content={
+                    "type": "chat_presence",
+                    "online": await get_presence().online(
+                        self.room_group_name
+                    ),
+                }
             )
 
+    async def send_history(self):
+        # Taken before the query, a message written in between is in both
+        buffered = chat.message_buffer.buffered(self.order_id)
+        stored, _ = await database_sync_to_async(chat.history)(
+            self.order_id
+        )
+
+        await self.send_json(
+            content={
+                "type": "chat_history",
+                "messages": [
+                    chat.serialize(message)
+                    for message in chat.merge(stored, buffered)
+                ],
+            }
+        )
+
+    async def send_presence_to_room(self):
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                "type": "chat_presence",
+                "online": await get_presence().online(self.room_group_name),
+            },
+        )
+
     async def chat_message(self, event):
         await self.send_json(content=event)
 
@@ -107,3 +210,6 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
 
     async def chat_leave(self, event):
         await self.send_json(content=event)
+
+    async def chat_presence(self, event):
+        await self.send_json(content=event)
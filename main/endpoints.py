@@ -1,26 +1,91 @@
-from rest_framework import serializers, viewsets
+from django.conf import settings
+from rest_framework import pagination, serializers, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
 from . import models
 
 
-# STATUS: not working
-class OrderLineSerializer(serializers.HyperlinkedModelSerializer):
-    product = serializers.StringRelatedField()
+class OrderLineSerializer(serializers.ModelSerializer):
+    """
+    Everything a dispatcher needs to know about a line (the order and the
+    product come from a `select_related`, not a query per line).
+    """
+
+    order_date_added = serializers.DateTimeField(
+        source="order.date_added", read_only=True
+    )
+    product_name = serializers.CharField(source="product.name", read_only=True)
 
     class Meta:
         model = models.OrderLine
-        fields = ("id", "order", "product", "status")
-        read_only_fields = ("id", "order", "product")
+        fields = (
+            "id",
+            "order",
+            "order_date_added",
+            "product",
+            "product_name",
+            "quantity",
+            "price",
+            "status",
+        )
+        read_only_fields = ("id", "order", "product", "quantity", "price")
+
+
+class OrderLineStatusSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), min_length=1, max_length=1000
+    )
+    status = serializers.ChoiceField(choices=models.OrderLine.STATUSES)
+
+
+class DispatchCursorPagination(pagination.CursorPagination):
+    """
+    Newest lines first, i.e. those of the newest orders (the lines are
+    created with their order). A cursor keeps its place however many lines
+    are added in the meantime, and doesn't cost an OFFSET scan deep down.
+
+    DRF's cursor only holds the first field of the ordering, which must be
+    unique: with a shared one (e.g. the date of the order) it falls back to
+    an offset among the rows of the same value, and loses its place when
+    rows are added there.
+    """
+
+    ordering = "-id"
+    page_size = settings.DISPATCH_API_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = settings.DISPATCH_API_MAX_PAGE_SIZE
 
 
-# STATUS: not working
 class PaidOrderLineViewSet(viewsets.ModelViewSet):
     serializer_class = OrderLineSerializer
-    filter_fields = ("order", "status")
+    pagination_class = DispatchCursorPagination
+    filterset_fields = ("order", "status")
 
     # fmt: off
     queryset = models.OrderLine.objects \
         .filter(order__status=models.Order.PAID) \
-        .order_by("-order__date_added")
+        .select_related("order", "product")
+
+    @action(detail=False, methods=["patch"], url_path="status")
+    def bulk_status(self, request):
+        """
+        Set the status of many lines at once, e.g. a warehouse marking what
+        it has sent: {"ids": [1, 2, 3], "status": 30}.
+        """
+        serializer = OrderLineStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        lines = self.get_queryset().filter(
+            id__in=serializer.validated_data["ids"]
+        )
+        order_ids = set(lines.values_list("order_id", flat=True))
+        updated = lines.update(status=serializer.validated_data["status"])
+
+        # `update` sends no signals, the orders are reconciled right here
+        models.Order.objects.reconcile_statuses(order_ids)
+
+        return Response({"updated": updated})
 
 
 class OrderSerializer(serializers.HyperlinkedModelSerializer):
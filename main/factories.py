@@ -1,11 +1,13 @@
 import factory
 import factory.fuzzy
+from django.template.defaultfilters import slugify
 
-from .models import User, Product, Address, Order, OrderLine
+from .models import User, Product, ProductTag, ProductImage, Address
+from .models import Order, OrderLine, Basket, BasketLine
 
 
 class UserFactory(factory.django.DjangoModelFactory):
-    email = "guest@booktime.com"
+    email = factory.Sequence(lambda n: f"user{n}@booktime.com")
 
     class Meta:
         model = User
@@ -13,17 +15,59 @@ class UserFactory(factory.django.DjangoModelFactory):
 
 
 class ProductFactory(factory.django.DjangoModelFactory):
+    name = factory.Sequence(lambda n: f"Product {n}")
+    slug = factory.LazyAttributeSequence(lambda o, n: f"{slugify(o.name)}-{n}")
     price = factory.fuzzy.FuzzyDecimal(low=1.0, high=1000.0, precision=2)
 
     class Meta:
         model = Product
 
 
+class ProductTagFactory(factory.django.DjangoModelFactory):
+    name = factory.Sequence(lambda n: f"Tag {n}")
+    slug = factory.LazyAttributeSequence(lambda o, n: f"{slugify(o.name)}-{n}")
+
+    class Meta:
+        model = ProductTag
+
+
+class ProductImageFactory(factory.django.DjangoModelFactory):
+    """
+    Saving it queues the renditions of the image, like any other upload.
+    """
+
+    product = factory.SubFactory(ProductFactory)
+    image = factory.django.ImageField(width=300, height=300)
+
+    class Meta:
+        model = ProductImage
+
+
 class AddressFactory(factory.django.DjangoModelFactory):
+    user = factory.SubFactory(UserFactory)
+    name = factory.Sequence(lambda n: f"Customer {n}")
+    address1 = "1 Main Street"
+    postal_code = "12345"
+    city = "London"
+    country = "uk"
+
     class Meta:
         model = Address
 
 
+class BasketFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = Basket
+
+
+class BasketLineFactory(factory.django.DjangoModelFactory):
+    basket = factory.SubFactory(BasketFactory)
+    product = factory.SubFactory(ProductFactory)
+
+    class Meta:
+        model = BasketLine
+
+
 class OrderLineFactory(factory.django.DjangoModelFactory):
     class Meta:
         model = OrderLine
@@ -2,8 +2,10 @@ import logging
 from os import getenv
 
 from django import forms
+from django.conf import settings
 from django.forms import inlineformset_factory
 from django.core.mail import send_mail
+from django.core.validators import MaxValueValidator
 from django.contrib.auth.forms import (
     UserCreationForm as DjangoUserCreationForm,
     UsernameField,
@@ -17,11 +19,22 @@ from . import widgets
 logger = logging.getLogger(__name__)
 
 
+class BasketLineForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # The same limit as `add_to_basket`
+        self.fields["quantity"].validators.append(
+            MaxValueValidator(settings.MAX_BASKET_QUANTITY)
+        )
+
+
 # This formset is used to build forms for all basket lines that connected to
 # the basket specified.
 BasketLineFormSet = inlineformset_factory(
     parent_model=models.Basket,
     model=models.BasketLine,
+    form=BasketLineForm,
     fields=("quantity",),
     extra=0,
     widgets={"quantity": widgets.PlusMinusNumberInput()},
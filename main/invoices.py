@@ -0,0 +1,95 @@
+"""
+Invoices of the orders, as HTML or PDF.
+
+A PDF is stored under the id of the order and its `date_updated`, so any
+change to the order gives it a new name (the old file is never read again).
+It's served from a small in-process cache first, then from the storage, and
+only rendered by WeasyPrint when neither of them has it.
+"""
+from collections import OrderedDict
+import threading
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+
+from weasyprint import HTML
+
+from .models import Order, OrderLine
+
+PDF_CACHE_SIZE = 32
+
+pdf_cache = OrderedDict()
+pdf_cache_lock = threading.Lock()
+
+
+def orders():
+    """
+    The orders with everything the template needs (two queries in total).
+    """
+    lines = OrderLine.objects.select_related("product").order_by("id")
+    return Order.objects.prefetch_related(Prefetch("lines", queryset=lines))
+
+
+def invoice_path(order):
+    return f"invoices/{order.id}-{order.date_updated:%Y%m%d%H%M%S%f}.pdf"
+
+
+def render_html(order):
+    return render_to_string(
+        template_name="invoice.html", context={"order": order}
+    )
+
+
+def render_pdf(order, base_url):
+    return HTML(string=render_html(order), base_url=base_url).write_pdf()
+
+
+def remember(path, pdf):
+    with pdf_cache_lock:
+        pdf_cache[path] = pdf
+        pdf_cache.move_to_end(path)
+
+        while len(pdf_cache) > PDF_CACHE_SIZE:
+            pdf_cache.popitem(last=False)
+
+
+def get_invoice_pdf(order, base_url):
+    """
+    Return the PDF (bytes) of the invoice, `base_url` is where the static
+    files of the template are fetched from in case it has to be rendered.
+    """
+    path = invoice_path(order)
+
+    pdf = pdf_cache.get(path)
+    if pdf is not None:
+        return pdf
+
+    if default_storage.exists(path):
+        with default_storage.open(path, mode="rb") as f:
+            pdf = f.read()
+    else:
+        pdf = render_pdf(order, base_url)
+        default_storage.save(path, ContentFile(pdf))
+
+    remember(path, pdf)
+
+    return pdf
+
+
+def render_invoice(order_id, base_url):
+    """
+    Make sure the PDF of an order is in the storage (run in the processes of
+    `./manage.py render_invoices`), return whether it had to be rendered.
+    """
+    order = orders().get(pk=order_id)
+    path = invoice_path(order)
+
+    if default_storage.exists(path):
+        return False
+
+    pdf = render_pdf(order, base_url)
+    default_storage.save(path, ContentFile(pdf))
+
+    return True
@@ -0,0 +1,136 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    teardown_databases,
+)
+
+from main.benchmarks import chat
+from main.benchmarks import stats
+from main.benchmarks import storefront
+
+SUITES = {
+    "chat": chat.run,
+    "storefront": storefront.run,
+}
+
+
+class Command(BaseCommand):
+    help = "Run a benchmark suite against a throwaway test database"
+
+    def add_arguments(self, parser):
+        """
+        Example command:
+        >> ./manage.py benchmark chat --rooms 2000 --clients 3
+        >> ./manage.py benchmark chat --output chat.json
+        >> ./manage.py benchmark storefront --visits 200 --products 5000
+        >> ./manage.py benchmark storefront --baseline storefront.json
+        """
+        parser.add_argument("suite", choices=sorted(SUITES))
+        parser.add_argument(
+            "--rooms", type=int, default=100, help="Chat rooms (orders)"
+        )
+        parser.add_argument(
+            "--clients", type=int, default=2, help="Websockets per room"
+        )
+        parser.add_argument(
+            "--messages", type=int, default=1, help="Messages per room"
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=30,
+            help="Seconds to wait for a frame before giving up",
+        )
+        parser.add_argument(
+            "--visits", type=int, default=50, help="Storefront journeys"
+        )
+        parser.add_argument(
+            "--products",
+            type=int,
+            default=1000,
+            help="Products of the storefront dataset",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Same seed, same journeys"
+        )
+        parser.add_argument("--output", help="Also write the results as JSON")
+        parser.add_argument(
+            "--baseline",
+            help="Results (--output) of an earlier run to compare with",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="How much slower or bigger than the baseline is fine",
+        )
+
+    def handle(self, *args, **options):
+        """
+        The suites create their own data, in a test database (like the test
+        runner does), with the in-memory channel layer and presence.
+        """
+        old_config = setup_databases(verbosity=0, interactive=False)
+
+        try:
+            with override_settings(
+                CHANNEL_LAYERS={
+                    "default": {
+                        "BACKEND": "channels.layers.InMemoryChannelLayer",
+                        "CONFIG": {"capacity": 1000},
+                    }
+                },
+                PRESENCE_BACKEND="main.presence.InMemoryPresence",
+            ):
+                results = SUITES[options["suite"]](**options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        results = {"suite": options["suite"], "metrics": results}
+        self.write_results(results["metrics"])
+
+        if options["output"]:
+            with open(options["output"], mode="w") as f:
+                json.dump(results, f, indent=2)
+
+        if options["baseline"]:
+            self.compare(results, options["baseline"], options["tolerance"])
+
+    def compare(self, results, path, tolerance):
+        with open(path) as f:
+            baseline = json.load(f)
+
+        if baseline.get("suite") != results["suite"]:
+            raise CommandError(
+                f"{path} has the results of {baseline.get('suite')}, "
+                f"not {results['suite']}"
+            )
+
+        regressions = stats.compare(
+            results["metrics"], baseline["metrics"], tolerance=tolerance
+        )
+        for name, old, new in regressions:
+            self.stderr.write(f"Regression {name}: {old} -> {new}")
+
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} metrics regressed against {path}"
+            )
+        self.stdout.write(f"No regression against {path}")
+
+    def write_results(self, metrics):
+        for name, value in metrics.items():
+            if isinstance(value, dict):
+                value = " ".join(
+                    f"{key}={number:.4f}"
+                    if isinstance(number, float)
+                    else f"{key}={number}"
+                    for key, number in value.items()
+                )
+            elif isinstance(value, float):
+                value = f"{value:.2f}"
+
+            self.stdout.write(f"{name}: {value}")
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main import exports
+from main import models
+from main.views import OrderFilter
+
+
+class Command(BaseCommand):
+    help = "Export orders (or their lines) as CSV or NDJSON"
+
+    def add_arguments(self, parser):
+        """
+        Example command:
+        >> ./manage.py export_orders orders > orders.csv
+        >> ./manage.py export_orders lines --format ndjson --status 20 \\
+               --since 2020-01-01 --until 2020-02-01 --output lines.ndjson
+        """
+        parser.add_argument("dataset", choices=sorted(exports.DATASETS))
+        parser.add_argument(
+            "--format", choices=sorted(exports.FORMATS), default="csv"
+        )
+        parser.add_argument("--status", help="Only the orders in this status")
+        parser.add_argument(
+            "--since", help="Only the orders added after this day"
+        )
+        parser.add_argument(
+            "--until", help="Only the orders added before this day"
+        )
+        parser.add_argument("--output", help="Write to a file, not stdout")
+
+    def handle(self, *args, **options):
+        """
+        The same filters as the order dashboard (`OrderFilter`), the rows
+        are streamed to the output as they are read.
+        """
+        filterset = OrderFilter(
+            data={
+                "status": options["status"],
+                "date_added__gt": options["since"],
+                "date_added__lt": options["until"],
+            },
+            queryset=models.Order.objects.all(),
+        )
+        if not filterset.is_valid():
+            raise CommandError(filterset.errors.as_text())
+
+        lines = exports.export(
+            options["dataset"], options["format"], filterset.qs
+        )
+
+        if options["output"]:
+            with open(options["output"], mode="w", newline="") as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
@@ -0,0 +1,61 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from main.benchmarks import dataset
+
+
+class Command(BaseCommand):
+    help = "Fill the database with a large, production-shaped dataset"
+
+    def add_arguments(self, parser):
+        """
+        Example command:
+        >> ./manage.py generate_dataset --products 1000000 --orders 2000000
+        >> ./manage.py generate_dataset --seed 42 --end 2020-03-01
+        """
+        parser.add_argument("--tags", type=int, default=50)
+        parser.add_argument("--products", type=int, default=10000)
+        parser.add_argument("--users", type=int, default=5000)
+        parser.add_argument("--orders", type=int, default=20000)
+        parser.add_argument(
+            "--baskets", type=int, default=2000, help="Open baskets"
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Same seed, same data"
+        )
+        parser.add_argument(
+            "--end",
+            type=date.fromisoformat,
+            help="The day of the last orders (default to today)",
+        )
+        parser.add_argument(
+            "--days", type=int, default=365, help="How far back orders go"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Rows per INSERT (and kept in memory at a time)",
+        )
+
+    def handle(self, *args, **options):
+        """
+        The rows are added to whatever is there already. Nothing is sent to
+        the signals (no renditions, no cache invalidation), the reporting
+        rollups are rebuilt at the end.
+        """
+        counts = dataset.generate(
+            tags=options["tags"],
+            products=options["products"],
+            users=options["users"],
+            orders=options["orders"],
+            baskets=options["baskets"],
+            seed=options["seed"],
+            end=options["end"],
+            days=options["days"],
+            batch_size=options["batch_size"],
+        )
+
+        for name, count in counts.items():
+            self.stdout.write(f"Generated {name}={count}")
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from main import models
+from main.renditions import generate_renditions
+
+
+class Command(BaseCommand):
+    help = "Generate the missing renditions of the product images"
+
+    def add_arguments(self, parser):
+        """
+        Example command:
+        >> ./manage.py generate_renditions
+        >> ./manage.py generate_renditions --all
+        """
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Also check the images which have been processed before",
+        )
+
+    def handle(self, *args, **options):
+        """
+        The jobs of the worker thread are gone when the process exits, this
+        is how we catch up with them (the renditions already stored under the
+        same digest are skipped anyway).
+        """
+        images = models.ProductImage.objects.all()
+        if not options["all"]:
+            images = images.filter(digest="")
+
+        count = 0
+        for image_id in images.values_list("id", flat=True).iterator():
+            generate_renditions(image_id)
+            count += 1
+
+        self.stdout.write(f"Images processed={count}")
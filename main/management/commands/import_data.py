@@ -1,12 +1,21 @@
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 import csv
+from itertools import islice
+import os
 import os.path
+import time
 
 from django.core.management.base import BaseCommand
 from django.core.files.images import ImageFile
+from django.core.files.storage import default_storage
+from django.db import transaction
 from django.template.defaultfilters import slugify
+from django.utils import timezone
 
+from main import caching
 from main import models
+from main.renditions import render_missing, rendition_path, store_renditions
 
 
 class Command(BaseCommand):
@@ -16,9 +25,32 @@ class Command(BaseCommand):
         """
         Example command:
         >> ./manage.py import_data SAMPLE.csv SAMPLE_DIR
+        >> ./manage.py import_data SAMPLE.csv SAMPLE_DIR --bulk --resume
         """
         parser.add_argument("csvfile", type=open)
         parser.add_argument("image_basedir", type=str)
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            help="Import in chunks with batched queries (for large feeds)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Rows per chunk (and per transaction) of the bulk mode",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Processes generating renditions, 0 to do it inline",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Skip the rows imported by an interrupted bulk import",
+        )
 
     def handle(self, *args, **options):
         """
@@ -28,19 +60,48 @@ class Command(BaseCommand):
         """
         self.stdout.write("Importing products")
 
+        if options["bulk"]:
+            counter = self.handle_bulk(**options)
+        else:
+            counter = self.handle_rows(**options)
+
+        # fmt: off
+        self.stdout.write(
+            f"Products "
+            f"processed={counter['products']} "
+            f"(created={counter['products_created']})"
+        )
+        self.stdout.write(
+            f"Tags "
+            f"processed={counter['tags']} "
+            f"(created={counter['tags_created']})"
+        )
+        self.stdout.write(
+            f"Images "
+            f"processed={counter['images']}"
+        )
+
+    def handle_rows(self, **options):
+        """
+        The original (row by row) import.
+        """
         counter = Counter()
         csv_dict_reader = csv.DictReader(options.pop("csvfile"))
 
         for row in csv_dict_reader:
+            # Matched by slug (unique), the same name at another price is
+            # the same product with a new price
             product, created = models.Product.objects.get_or_create(
-                name=row["name"], price=row["price"],
+                slug=slugify(row["name"]),
+                defaults={"name": row["name"], "price": row["price"]},
             )
+            product.name = row["name"]
             product.description = row["description"]
-            product.slug = slugify(row["name"])
+            product.price = row["price"]
 
             for import_tag in row["tags"].split("|"):
                 tag, tag_created = models.ProductTag.objects.get_or_create(
-                    name=import_tag
+                    slug=slugify(import_tag), defaults={"name": import_tag}
                 )
                 product.tags.add(tag)
                 counter["tags"] += 1
@@ -68,18 +129,214 @@ class Command(BaseCommand):
             if created:
                 counter["products_created"] += 1
 
-        # fmt: off
-        self.stdout.write(
-            f"Products "
-            f"processed={counter['products']} "
-            f"(created={counter['products_created']})"
+        return counter
+
+    def handle_bulk(self, **options):
+        """
+        Stream the csv in chunks, each one is imported with a handful of
+        batched queries in its own transaction. Products are matched by slug.
+
+        The amount of committed rows is written to '<csvfile>.progress'
+        after every chunk, `--resume` skips over them. Only products without
+        any images get the image of the feed (re-running won't duplicate).
+        """
+        counter = Counter()
+        csvfile = options["csvfile"]
+        progress_path = f"{csvfile.name}.progress"
+
+        rows_done = 0
+        if options["resume"] and os.path.exists(progress_path):
+            with open(progress_path) as f:
+                rows_done = int(f.read() or 0)
+            self.stdout.write(f"Resuming after row {rows_done}")
+
+        rows = islice(csv.DictReader(csvfile), rows_done, None)
+        self.tag_ids = dict(
+            models.ProductTag.objects.values_list("name", "id")
         )
-        self.stdout.write(
-            f"Tags "
-            f"processed={counter['tags']} "
-            f"(created={counter['tags_created']})"
+
+        pool = None
+        if options["workers"] > 0:
+            pool = ProcessPoolExecutor(max_workers=options["workers"])
+
+        started = time.monotonic()
+        rows_imported = 0
+
+        try:
+            while True:
+                chunk = list(islice(rows, options["chunk_size"]))
+                if not chunk:
+                    break
+
+                with transaction.atomic():
+                    self.import_chunk(
+                        chunk, options["image_basedir"], pool, counter
+                    )
+
+                rows_done += len(chunk)
+                rows_imported += len(chunk)
+                with open(progress_path, mode="w") as f:
+                    f.write(str(rows_done))
+
+                rate = rows_imported / (time.monotonic() - started)
+                self.stdout.write(
+                    f"Imported {rows_done} rows ({rate:.0f} rows/sec)"
+                )
+        finally:
+            if pool:
+                pool.shutdown()
+
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
+
+        return counter
+
+    def import_chunk(self, chunk, image_basedir, pool, counter):
+        # The last row wins if a product shows up more than once
+        rows = {slugify(row["name"]): row for row in chunk}
+        counter["products"] += len(chunk)
+
+        self.import_tags(rows.values(), counter)
+        products = self.import_products(rows, counter)
+
+        through = models.Product.tags.through
+        links = [
+            through(product_id=products[slug].id, producttag_id=tag_id)
+            for slug, row in rows.items()
+            for tag_id in self.row_tag_ids(row)
+        ]
+        through.objects.bulk_create(links, ignore_conflicts=True)
+        counter["tags"] += len(links)
+
+        with_images = set(
+            models.ProductImage.objects.filter(
+                product__in=products.values()
+            ).values_list("product_id", flat=True)
         )
-        self.stdout.write(
-            f"Images "
-            f"processed={counter['images']}"
+        self.import_images(
+            [
+                (products[slug], row["image_filename"])
+                for slug, row in rows.items()
+                if products[slug].id not in with_images
+            ],
+            image_basedir,
+            pool,
+            counter,
+        )
+
+    def row_tag_ids(self, row):
+        return [self.tag_ids[name] for name in row["tags"].split("|")]
+
+    def import_tags(self, rows, counter):
+        names = {name for row in rows for name in row["tags"].split("|")}
+        missing = names - self.tag_ids.keys()
+
+        if not missing:
+            return
+
+        # Names are matched by slug (unique), e.g. "Sci-Fi" and "sci fi" are
+        # the same tag, an existing one or named after the first of them
+        slugs = {name: slugify(name) for name in missing}
+        ids_by_slug = dict(
+            models.ProductTag.objects.filter(
+                slug__in=slugs.values()
+            ).values_list("slug", "id")
         )
+        new_tags = {}
+        for name in sorted(missing):
+            if slugs[name] not in ids_by_slug:
+                new_tags.setdefault(slugs[name], name)
+
+        if new_tags:
+            models.ProductTag.objects.bulk_create(
+                [
+                    models.ProductTag(name=name, slug=slug)
+                    for slug, name in new_tags.items()
+                ],
+                ignore_conflicts=True,
+            )
+            ids_by_slug.update(
+                models.ProductTag.objects.filter(
+                    slug__in=new_tags.keys()
+                ).values_list("slug", "id")
+            )
+            counter["tags_created"] += len(new_tags)
+
+        for name, slug in slugs.items():
+            self.tag_ids[name] = ids_by_slug[slug]
+
+    def import_products(self, rows, counter):
+        """
+        Create the new products, update the existing ones, then return all
+        of them by slug.
+        """
+        existing = models.Product.objects.in_bulk(
+            list(rows.keys()), field_name="slug"
+        )
+        now = timezone.now()
+
+        for slug, product in existing.items():
+            product.name = rows[slug]["name"]
+            product.description = rows[slug]["description"]
+            product.price = rows[slug]["price"]
+            product.date_updated = now
+
+        models.Product.objects.bulk_update(
+            existing.values(),
+            fields=["name", "description", "price", "date_updated"],
+        )
+        caching.invalidate_product_pages(existing.keys())
+
+        new_products = [
+            models.Product(
+                name=row["name"],
+                slug=slug,
+                description=row["description"],
+                price=row["price"],
+            )
+            for slug, row in rows.items()
+            if slug not in existing
+        ]
+        models.Product.objects.bulk_create(new_products)
+        counter["products_created"] += len(new_products)
+
+        return models.Product.objects.in_bulk(
+            list(rows.keys()), field_name="slug"
+        )
+
+    def import_images(self, product_images, image_basedir, pool, counter):
+        """
+        The renditions are generated by the processes of the pool, we only
+        store what they send back (skipping the ones we already have).
+        """
+        paths = [
+            os.path.join(image_basedir, filename)
+            for product, filename in product_images
+        ]
+
+        if pool:
+            results = pool.map(render_missing, paths, chunksize=16)
+        else:
+            results = map(render_missing, paths)
+
+        images = []
+        for (product, filename), path, (digest, renditions) in zip(
+            product_images, paths, results
+        ):
+            with open(file=path, mode="rb") as f:
+                image_name = default_storage.save(
+                    f"product-images/{filename}", ImageFile(f)
+                )
+
+            store_renditions(digest, renditions)
+            images.append(
+                models.ProductImage(
+                    product=product,
+                    image=image_name,
+                    thumbnail=rendition_path(digest, "thumbnail"),
+                    digest=digest,
+                )
+            )
+
+        models.ProductImage.objects.bulk_create(images)
+        counter["images"] += len(images)
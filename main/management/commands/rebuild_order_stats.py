@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from main import models
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily order stats and product sales of the reports"
+
+    def handle(self, *args, **options):
+        """
+        The stats are kept up to date by the signals, but not by the bulk
+        operations (`update`, `bulk_create`, raw SQL). Run this after those.
+        """
+        count = models.OrderDailyStats.objects.rebuild()
+        self.stdout.write(f"Daily stats rebuilt={count}")
+
+        count = models.ProductDailySales.objects.rebuild()
+        self.stdout.write(f"Daily product sales rebuilt={count}")
+
+        count = models.ProductMonthlySales.objects.rebuild()
+        self.stdout.write(f"Monthly product sales rebuilt={count}")
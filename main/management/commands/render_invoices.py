@@ -0,0 +1,66 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from main import invoices
+from main import models
+from main.views import OrderFilter
+
+
+class Command(BaseCommand):
+    help = "Render the invoice PDFs of the orders of a period"
+
+    def add_arguments(self, parser):
+        """
+        Example command:
+        >> ./manage.py render_invoices --since 2020-01-01 --until 2020-02-01
+        """
+        parser.add_argument(
+            "--since", help="Only the orders added after this day"
+        )
+        parser.add_argument(
+            "--until", help="Only the orders added before this day"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Processes rendering the PDFs, 0 to do it inline",
+        )
+        parser.add_argument(
+            "--base-url",
+            default="http://localhost:8000/",
+            help="Where the static files of the invoice are served from",
+        )
+
+    def handle(self, *args, **options):
+        """
+        The PDFs already in the storage are skipped, the admin serves the
+        rest straight from there afterwards.
+        """
+        filterset = OrderFilter(
+            data={
+                "date_added__gt": options["since"],
+                "date_added__lt": options["until"],
+            },
+            queryset=models.Order.objects.order_by("id"),
+        )
+        order_ids = list(filterset.qs.values_list("id", flat=True))
+        render = partial(invoices.render_invoice, base_url=options["base_url"])
+
+        if options["workers"] > 0:
+            # The forked processes must not share our database connection
+            connections.close_all()
+
+            with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+                rendered = list(pool.map(render, order_ids, chunksize=8))
+        else:
+            rendered = [render(order_id) for order_id in order_ids]
+
+        self.stdout.write(
+            f"Invoices processed={len(rendered)} "
+            f"(rendered={sum(rendered)})"
+        )
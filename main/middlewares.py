@@ -1,45 +1,75 @@
 import logging
+
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils.functional import SimpleLazyObject
+
 from . import models
 
 logger = logging.getLogger(__name__)
 
 
+def get_basket(request):
+    """
+    Resolve the open basket of the current visitor with (at most) one query.
+
+    The basket in the session wins, otherwise it falls back to the newest open
+    basket of the logged in user (several of them won't break anything). The
+    resolved id is cached in the session, so the following requests only need
+    a primary key lookup.
+    """
+    basket_id = request.session.get("basket_id")
+    user = request.user
+
+    if basket_id is None and not user.is_authenticated:
+        return None
+
+    baskets = models.Basket.objects.filter(status=models.Basket.OPEN)
+
+    if basket_id is not None and user.is_authenticated:
+        # Session basket first, then the newest one owned by the user
+        baskets = (
+            baskets.filter(Q(pk=basket_id) | Q(user=user))
+            .annotate(
+                from_session=Case(
+                    When(pk=basket_id, then=Value(0)),
+                    default=Value(1),
+                    output_field=IntegerField(),
+                )
+            )
+            .order_by("from_session", "-id")
+        )
+    elif basket_id is not None:
+        baskets = baskets.filter(pk=basket_id)
+    else:
+        baskets = baskets.filter(user=user).order_by("-id")
+
+    basket = baskets.first()
+
+    if basket is None:
+        if basket_id is not None:
+            del request.session["basket_id"]
+    elif basket.id != basket_id:
+        request.session["basket_id"] = basket.id
+
+    return basket
+
+
 def basket_middleware(get_response):
     """
     The original implementation provided in the book was incomplete, here's an
     improved version which is written by 'Spartak-Belov-Floresku' (the link:
     https://github.com/Spartak-Belov-Floresku/practical-django2-and-channels2).
 
+    The basket is resolved lazily (just like `request.user`), requests which
+    never touch `request.basket` (static files, product pages, admin) won't
+    pay for any basket queries.
+
     Some of the issues might actually caused by the browsers' cache, do clean
     it up before testing this!
     """
 
     def middleware(request):
-        user = request.user
-
-        if "basket_id" in request.session:
-            basket_id = request.session["basket_id"]
-
-            try:
-                basket = models.Basket.objects.get(id=basket_id)
-                request.basket = basket
-            except Exception:
-
-                try:
-                    basket = models.Basket.objects.get(
-                        user=user, status=models.Basket.OPEN
-                    )
-                    request.basket = basket
-                except Exception:
-                    del request.session["basket_id"]
-        else:
-            try:
-                basket = models.Basket.objects.get(
-                    user=user, status=models.Basket.OPEN
-                )
-                request.basket = basket
-            except Exception:
-                request.basket = None
+        request.basket = SimpleLazyObject(lambda: get_basket(request))
 
         response = get_response(request)
 
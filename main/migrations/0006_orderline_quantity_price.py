@@ -0,0 +1,85 @@
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+
+
+def collapse_order_lines(apps, schema_editor):
+    """
+    Fold the "one row per copy" lines into one row per product (and status),
+    then take a snapshot of the current product price for every line.
+    """
+    OrderLine = apps.get_model("main", "OrderLine")
+    Product = apps.get_model("main", "Product")
+
+    duplicated = (
+        OrderLine.objects.values("order_id", "product_id", "status")
+        .annotate(keep=Min("id"), units=Count("id"))
+        .filter(units__gt=1)
+    )
+
+    for group in list(duplicated):
+        same_lines = OrderLine.objects.filter(
+            order_id=group["order_id"],
+            product_id=group["product_id"],
+            status=group["status"],
+        )
+        same_lines.exclude(pk=group["keep"]).delete()
+        same_lines.filter(pk=group["keep"]).update(quantity=group["units"])
+
+    unit_price = Product.objects.filter(pk=OuterRef("product_id")).values(
+        "price"
+    )
+    OrderLine.objects.update(price=Subquery(unit_price[:1]))
+
+
+def expand_order_lines(apps, schema_editor):
+    OrderLine = apps.get_model("main", "OrderLine")
+
+    copies = [
+        OrderLine(
+            order_id=line.order_id,
+            product_id=line.product_id,
+            status=line.status,
+            quantity=1,
+            price=line.price,
+        )
+        for line in OrderLine.objects.filter(quantity__gt=1)
+        for copy in range(line.quantity - 1)
+    ]
+    OrderLine.objects.bulk_create(copies, batch_size=1000)
+    OrderLine.objects.update(quantity=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0005_order_last_spoken_to"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="orderline",
+            name="quantity",
+            field=models.PositiveIntegerField(
+                default=1,
+                validators=[django.core.validators.MinValueValidator(1)],
+            ),
+        ),
+        migrations.AddField(
+            model_name="orderline",
+            name="price",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=6, null=True
+            ),
+        ),
+        migrations.RunPython(
+            code=collapse_order_lines, reverse_code=expand_order_lines
+        ),
+        migrations.AlterField(
+            model_name="orderline",
+            name="price",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=6
+            ),
+        ),
+    ]
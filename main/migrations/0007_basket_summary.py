@@ -0,0 +1,59 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+
+
+def fill_basket_summaries(apps, schema_editor):
+    Basket = apps.get_model("main", "Basket")
+    BasketLine = apps.get_model("main", "BasketLine")
+
+    summaries = (
+        BasketLine.objects.values("basket_id")
+        .annotate(
+            item_count=Sum("quantity"),
+            line_count=Count("id"),
+            total=Sum(
+                F("quantity") * F("product__price"),
+                output_field=models.DecimalField(),
+            ),
+        )
+        .order_by()
+    )
+
+    for summary in summaries.iterator():
+        Basket.objects.filter(pk=summary.pop("basket_id")).update(
+            item_count=summary["item_count"],
+            line_count=summary["line_count"],
+            total=summary["total"] or Decimal("0.00"),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0006_orderline_quantity_price"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="basket",
+            name="item_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="basket",
+            name="line_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="basket",
+            name="total",
+            field=models.DecimalField(
+                decimal_places=2, default=0, max_digits=10
+            ),
+        ),
+        migrations.RunPython(
+            code=fill_basket_summaries, reverse_code=migrations.RunPython.noop
+        ),
+    ]
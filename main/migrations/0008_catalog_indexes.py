@@ -0,0 +1,67 @@
+# Generated by Django 2.2.7 on 2026-10-18 09:08
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def deduplicate_slugs(apps, schema_editor):
+    """
+    Slugs become unique, the duplicated ones get their id appended.
+    """
+    for model_name in ("Product", "ProductTag"):
+        model = apps.get_model("main", model_name)
+
+        duplicated = (
+            model.objects.values("slug")
+            .annotate(c=Count("id"))
+            .filter(c__gt=1)
+            .values_list("slug", flat=True)
+        )
+        for obj in model.objects.filter(slug__in=list(duplicated)):
+            suffix = f"-{obj.id}" if obj.slug else str(obj.id)
+            obj.slug = obj.slug[: 48 - len(suffix)] + suffix
+            obj.save(update_fields=["slug"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0007_basket_summary"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            code=deduplicate_slugs, reverse_code=migrations.RunPython.noop
+        ),
+        migrations.AlterField(
+            model_name="product",
+            name="slug",
+            field=models.SlugField(max_length=48, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="producttag",
+            name="slug",
+            field=models.SlugField(max_length=48, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name="basket",
+            index=models.Index(
+                fields=["user", "status"], name="basket_user_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["status", "date_added"],
+                name="order_status_date_added_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(active=True),
+                fields=["name", "id"],
+                name="product_active_name_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.7 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0008_catalog_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productimage",
+            name="digest",
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
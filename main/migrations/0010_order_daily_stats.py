@@ -0,0 +1,89 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_order_daily_stats(apps, schema_editor):
+    Order = apps.get_model("main", "Order")
+    OrderLine = apps.get_model("main", "OrderLine")
+    OrderDailyStats = apps.get_model("main", "OrderDailyStats")
+
+    stats = {}
+
+    per_day = (
+        Order.objects.annotate(day=TruncDate("date_added"))
+        .values("day", "shipping_country")
+        .annotate(orders=Count("id"))
+        .order_by()
+    )
+    for row in per_day.iterator():
+        stats[row["day"], row["shipping_country"]] = OrderDailyStats(
+            day=row["day"],
+            country=row["shipping_country"],
+            orders=row["orders"],
+        )
+
+    lines_per_day = (
+        OrderLine.objects.annotate(day=TruncDate("order__date_added"))
+        .values("day", "order__shipping_country")
+        .annotate(
+            lines=Count("id"),
+            revenue=Sum(
+                F("quantity") * F("price"),
+                output_field=models.DecimalField(),
+            ),
+        )
+        .order_by()
+    )
+    for row in lines_per_day.iterator():
+        day_stats = stats[row["day"], row["order__shipping_country"]]
+        day_stats.lines = row["lines"]
+        day_stats.revenue = row["revenue"]
+
+    OrderDailyStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0009_productimage_digest"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderDailyStats",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("country", models.CharField(max_length=3)),
+                ("orders", models.PositiveIntegerField(default=0)),
+                ("lines", models.PositiveIntegerField(default=0)),
+                (
+                    "revenue",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("0.00"),
+                        max_digits=12,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "order daily stats",
+                "unique_together": {("day", "country")},
+            },
+        ),
+        migrations.RunPython(
+            code=fill_order_daily_stats,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
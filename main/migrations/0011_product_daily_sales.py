@@ -0,0 +1,86 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def fill_product_daily_sales(apps, schema_editor):
+    OrderLine = apps.get_model("main", "OrderLine")
+    ProductDailySales = apps.get_model("main", "ProductDailySales")
+
+    per_day = (
+        OrderLine.objects.annotate(day=TruncDate("order__date_added"))
+        .values("day", "product_id")
+        .annotate(
+            sold=Sum("quantity"),
+            revenue=Sum(
+                F("quantity") * F("price"),
+                output_field=models.DecimalField(),
+            ),
+        )
+        .order_by()
+    )
+
+    ProductDailySales.objects.bulk_create(
+        [
+            ProductDailySales(
+                day=row["day"],
+                product_id=row["product_id"],
+                quantity=row["sold"],
+                revenue=row["revenue"],
+            )
+            for row in per_day.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0010_order_daily_stats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductDailySales",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("quantity", models.PositiveIntegerField(default=0)),
+                (
+                    "revenue",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("0.00"),
+                        max_digits=12,
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="main.Product",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "product daily sales",
+                "unique_together": {("day", "product")},
+            },
+        ),
+        migrations.RunPython(
+            code=fill_product_daily_sales,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,86 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth
+import django.db.models.deletion
+
+
+def fill_product_monthly_sales(apps, schema_editor):
+    OrderLine = apps.get_model("main", "OrderLine")
+    ProductMonthlySales = apps.get_model("main", "ProductMonthlySales")
+
+    per_month = (
+        OrderLine.objects.annotate(month=TruncMonth("order__date_added"))
+        .values("month", "product_id")
+        .annotate(
+            sold=Sum("quantity"),
+            revenue=Sum(
+                F("quantity") * F("price"),
+                output_field=models.DecimalField(),
+            ),
+        )
+        .order_by()
+    )
+
+    ProductMonthlySales.objects.bulk_create(
+        [
+            ProductMonthlySales(
+                month=row["month"],
+                product_id=row["product_id"],
+                quantity=row["sold"],
+                revenue=row["revenue"],
+            )
+            for row in per_month.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0012_chatmessage"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductMonthlySales",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.DateField()),
+                ("quantity", models.PositiveIntegerField(default=0)),
+                (
+                    "revenue",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("0.00"),
+                        max_digits=12,
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="main.Product",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "product monthly sales",
+                "unique_together": {("month", "product")},
+            },
+        ),
+        migrations.RunPython(
+            code=fill_product_monthly_sales,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
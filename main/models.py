@@ -1,8 +1,31 @@
+from abc import ABCMeta, abstractmethod
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+import heapq
 import logging
-
-from django.db import models
+import threading
+import time
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import (
+    Count,
+    Exists,
+    F,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Least, TruncDate, TruncMonth
 from django.contrib.auth.models import AbstractUser, BaseUserManager
+from django.core.cache import cache
+from django.core.files.storage import default_storage
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 
 from main import exceptions
 
@@ -13,6 +36,21 @@ class ActiveManager(models.Manager):
     def active(self):
         return self.filter(active=True)
 
+    def active_with_tag(self, tag):
+        """
+        The active products holding a tag, as an EXISTS per product rather
+        than a join: the database can walk `product_active_name_idx` in the
+        order of the catalog and stop at the end of the page, instead of
+        sorting every product of the tag.
+        """
+        tagged = self.model.tags.through.objects.filter(
+            product_id=OuterRef("pk"), producttag=tag
+        )
+
+        return (
+            self.active().annotate(tagged=Exists(tagged)).filter(tagged=True)
+        )
+
 
 class ProductTagManager(models.Manager):
     """
@@ -20,9 +58,158 @@ class ProductTagManager(models.Manager):
     Both can be used for './manage.py [dumpdata|loaddata]'.
     """
 
+    # An in-process LRU cache of tags by slug, cleared by the signals
+    # whenever any tag is written (the timeout covers changes in other
+    # processes). Unknown slugs raise and are never cached, so made-up URLs
+    # can't grow it, and it holds at most `SLUG_CACHE_SIZE` tags.
+    SLUG_CACHE_TIMEOUT = 60
+    SLUG_CACHE_SIZE = 256
+    slug_cache = OrderedDict()
+    slug_cache_lock = threading.Lock()
+
     def get_by_natural_key(self, slug):
         return self.get(slug=slug)
 
+    def get_by_slug_cached(self, slug):
+        now = time.monotonic()
+
+        with self.slug_cache_lock:
+            tag, expires_at = self.slug_cache.pop(slug, (None, 0))
+            if expires_at >= now:
+                self.slug_cache[slug] = (tag, expires_at)
+                return tag
+
+        tag = self.get(slug=slug)
+
+        with self.slug_cache_lock:
+            self.slug_cache[slug] = (tag, now + self.SLUG_CACHE_TIMEOUT)
+            while len(self.slug_cache) > self.SLUG_CACHE_SIZE:
+                self.slug_cache.popitem(last=False)
+
+        return tag
+
+
+class BasketManager(models.Manager):
+    local = threading.local()
+
+    def refresh_summary(self, basket_id):
+        """
+        Recompute the summary columns of a basket (one aggregate, one update)
+        and return the new values, so they could be put on the instances.
+        """
+        summary = BasketLine.objects.filter(basket_id=basket_id).aggregate(
+            item_count=Sum("quantity"),
+            line_count=Count("id"),
+            total=Sum(
+                F("quantity") * F("product__price"),
+                output_field=models.DecimalField(),
+            ),
+        )
+        summary["item_count"] = summary["item_count"] or 0
+        summary["total"] = summary["total"] or Decimal("0.00")
+
+        self.filter(pk=basket_id).update(**summary)
+
+        return summary
+
+    def refresh_totals(self, product_id):
+        """
+        Recompute the totals of the open baskets holding a product whose
+        price has changed, one update however many baskets.
+        """
+        totals = (
+            BasketLine.objects.filter(basket=OuterRef("pk"))
+            .values("basket")
+            .annotate(
+                total=Sum(
+                    F("quantity") * F("product__price"),
+                    output_field=models.DecimalField(),
+                )
+            )
+            .values("total")
+        )
+
+        return self.filter(
+            status=Basket.OPEN, basketline__product_id=product_id
+        ).update(total=Subquery(totals))
+
+    @property
+    def summaries_deferred(self):
+        return getattr(self.local, "summaries_deferred", False)
+
+    @contextmanager
+    def defer_summaries(self):
+        """
+        The lines written in here don't refresh the summary of their basket
+        one by one (see the signals), whoever rewrites them in bulk refreshes
+        it once afterwards.
+        """
+        self.local.summaries_deferred = True
+        try:
+            yield
+        finally:
+            self.local.summaries_deferred = False
+
+    def merge(self, basket, user):
+        """
+        Merge an anonymous basket and the open baskets of the user into the
+        newest of the latter, with one line per product, and return it (the
+        anonymous basket simply becomes the user's if there's none).
+
+        A bounded number of queries in one transaction, however many lines
+        there are: the quantities are summed up by the database, the lines
+        rewritten with a `bulk_create` and the extra baskets deleted.
+
+        A merged line holds at most `MAX_BASKET_QUANTITY` copies too (see
+        `Basket.add_product`), the extra ones are dropped and the summary
+        counts only what's left.
+        """
+        with transaction.atomic():
+            user_basket_ids = list(
+                self.select_for_update()
+                .filter(user=user, status=Basket.OPEN)
+                .order_by("-id")
+                .values_list("id", flat=True)
+            )
+
+            if not user_basket_ids:
+                self.filter(pk=basket.pk).update(user=user)
+                basket.user = user
+                return basket
+
+            target_id, *extra_ids = user_basket_ids
+            basket_ids = [target_id, basket.pk, *extra_ids]
+            lines = BasketLine.objects.filter(basket_id__in=basket_ids)
+
+            quantities = (
+                lines.values("product_id")
+                .annotate(
+                    total_quantity=Least(
+                        Sum("quantity"),
+                        Value(settings.MAX_BASKET_QUANTITY),
+                        output_field=models.PositiveIntegerField(),
+                    )
+                )
+                .order_by("product_id")
+            )
+            merged = [
+                BasketLine(
+                    basket_id=target_id,
+                    product_id=row["product_id"],
+                    quantity=row["total_quantity"],
+                )
+                for row in quantities
+            ]
+
+            with self.defer_summaries():
+                lines.delete()
+                BasketLine.objects.bulk_create(merged)
+                self.filter(pk__in=[basket.pk, *extra_ids]).delete()
+
+            self.refresh_summary(target_id)
+
+        return self.get(pk=target_id)
+
 
 class UserManager(BaseUserManager):
     use_in_migrations = True
@@ -74,12 +261,39 @@ class User(AbstractUser):
 
     objects = UserManager()
 
+    GROUP_NAMES_CACHE_KEY = "user-group-names:{}"
+    GROUP_NAMES_CACHE_TIMEOUT = 60 * 60
+
+    @property
+    def group_names(self):
+        """
+        The names of the user's groups, loaded once per instance (i.e. per
+        request or per websocket connection) and cached across them. The
+        signals delete the cached ones whenever the groups are changed.
+        """
+        if not hasattr(self, "_group_names"):
+            key = self.GROUP_NAMES_CACHE_KEY.format(self.pk)
+            group_names = cache.get(key)
+
+            if group_names is None:
+                group_names = frozenset(
+                    self.groups.values_list("name", flat=True)
+                )
+                cache.set(key, group_names, self.GROUP_NAMES_CACHE_TIMEOUT)
+
+            self._group_names = group_names
+
+        return self._group_names
+
+    def forget_group_names(self):
+        self.__dict__.pop("_group_names", None)
+
     @property
     def is_employee(self):
         return self.is_active and (
             self.is_superuser
             or self.is_staff
-            and self.groups.filter(name="Employees").exists()
+            and "Employees" in self.group_names
         )
 
     @property
@@ -87,7 +301,7 @@ class User(AbstractUser):
         return self.is_active and (
             self.is_superuser
             or self.is_staff
-            and self.groups.filter(name="Dispatchers").exists()
+            and "Dispatchers" in self.group_names
         )
 
 
@@ -95,7 +309,7 @@ class ProductTag(models.Model):
     objects = ProductTagManager()
 
     name = models.CharField(max_length=40)
-    slug = models.SlugField(max_length=48)
+    slug = models.SlugField(max_length=48, unique=True)
     description = models.TextField(blank=True)
     active = models.BooleanField(default=True)
 
@@ -119,24 +333,68 @@ class Product(models.Model):
     name = models.CharField(max_length=40)
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=6, decimal_places=2)
-    slug = models.SlugField(max_length=48)
+    slug = models.SlugField(max_length=48, unique=True)
     active = models.BooleanField(default=True)
     in_stock = models.BooleanField(default=True)
     date_updated = models.DateTimeField(auto_now=True)
 
     tags = models.ManyToManyField(to=ProductTag, blank=True)
 
+    # The price and slug as loaded, the signals refresh the baskets when the
+    # price changes and invalidate the cached page of both slugs
+    loaded_price = None
+    loaded_slug = None
+
+    class Meta:
+        indexes = [
+            # The catalog only ever lists active products ordered by name
+            # (with id as the tie-breaker of the cursor pagination).
+            models.Index(
+                fields=["name", "id"],
+                name="product_active_name_idx",
+                condition=models.Q(active=True),
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_price = instance.__dict__.get("price")
+        instance.loaded_slug = instance.__dict__.get("slug")
+
+        return instance
+
 
 class ProductImage(models.Model):
     """This model requires 'Pillow' installed first.
+
+    The thumbnail (and the other renditions) are generated in the background,
+    they're stored under the `digest` of the image (see `main.renditions`).
     """
 
     product = models.ForeignKey(to=Product, on_delete=models.CASCADE)
     image = models.ImageField(upload_to="product-images")
     thumbnail = models.ImageField(upload_to="product-thumbnails", null=True)
+    digest = models.CharField(max_length=64, blank=True, db_index=True)
+
+    def rendition_url(self, name):
+        from .renditions import rendition_path
+
+        if not self.digest:
+            return None
+
+        return default_storage.url(rendition_path(self.digest, name))
+
+    @property
+    def webp_url(self):
+        return self.rendition_url("medium-webp")
+
+    @property
+    def thumbnail_webp_url(self):
+        return self.rendition_url("thumbnail-webp")
 
 
 class Address(models.Model):
@@ -180,74 +438,173 @@ class Basket(models.Model):
     SUBMITTED = 20
     STATUSES = ((OPEN, "Open"), (SUBMITTED, "Submitted"))
 
+    objects = BasketManager()
+
     user = models.ForeignKey(
         to=User, on_delete=models.CASCADE, blank=True, null=True
     )
     status = models.IntegerField(choices=STATUSES, default=OPEN)
 
+    # A summary maintained whenever the lines get written (see the signals),
+    # reading it won't cost any extra queries. `total` follows the current
+    # prices of the products, like the order lines of the checkout.
+    item_count = models.PositiveIntegerField(default=0)
+    line_count = models.PositiveIntegerField(default=0)
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    SUMMARY_FIELDS = ("item_count", "line_count", "total")
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "status"], name="basket_user_status_idx"
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        Updates leave the summary alone, the values in memory may be stale
+        by now (the lines update it with atomic increments).
+        """
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.SUMMARY_FIELDS
+            ]
+
+        super().save(*args, **kwargs)
+
+    def add_product(self, product, quantity=1):
+        """
+        Add some copies of the product with atomic increments, concurrent
+        clicks won't lose any of them.
+
+        Updating the summary first also locks the basket row, so two "first"
+        additions of the same product can't both create a line.
+
+        A line holds at most `MAX_BASKET_QUANTITY` copies (the summary has
+        to fit in its columns), going over adds nothing and raises
+        `BasketException`.
+        """
+        max_quantity = settings.MAX_BASKET_QUANTITY
+        if quantity > max_quantity:
+            raise exceptions.BasketException(
+                f"At most {max_quantity} copies of a product"
+            )
+
+        with transaction.atomic():
+            Basket.objects.filter(pk=self.pk).update(
+                item_count=F("item_count") + quantity,
+                total=F("total") + product.price * quantity,
+            )
+            updated = BasketLine.objects.filter(
+                basket=self,
+                product=product,
+                quantity__lte=max_quantity - quantity,
+            ).update(quantity=F("quantity") + quantity)
+
+            # The signal takes care of the summary for newly created lines
+            if not updated:
+                if BasketLine.objects.filter(
+                    basket=self, product=product
+                ).exists():
+                    raise exceptions.BasketException(
+                        f"At most {max_quantity} copies of a product"
+                    )
+
+                BasketLine.objects.create(
+                    basket=self, product=product, quantity=quantity
+                )
+
     def is_empty(self):
-        return self.basketline_set.all().count == 0
+        return self.item_count == 0
 
     def count(self):
-        return sum(bl.quantity for bl in self.basketline_set.all())
+        return self.item_count
 
     def create_order(self, billing_address, shipping_address):
         """
         The "check out" flow:
-        1. Logging info about basket and addresses
-        2. Creating Order instance      (one record, mostly info)
-        3. Creating OrderLine instances (multiple records, actual products)
-        4. Logging info about order and the amounts of products were bought
-        5. Mark the process of the "basket"'s side has end (and.. save the obj)
+        1. Locking the basket row (so double-submits can't race each other)
+        2. Logging info about basket and addresses
+        3. Creating Order instance      (one record, mostly info)
+        4. Creating OrderLine instances (one per product, batched insert)
+        5. Logging info about order and the amounts of products were bought
+        6. Mark the process of the "basket"'s side has end (and.. save the obj)
+
+        Everything happens inside one transaction, a failure halfway through
+        won't leave half an order behind.
         """
         if not self.user:
             raise exceptions.BasketException(
                 "Cannot create order without user!"
             )
 
-        logger.info(
-            f"Creating order for basket_id={self.id}, "
-            f"shipping_address={shipping_address.id}, "
-            f"billing_address={billing_address.id}"
-        )
+        with transaction.atomic():
+            # The second request of a double-submit blocks here until the
+            # first one commits, then sees the basket is no longer open.
+            locked = Basket.objects.select_for_update().get(pk=self.pk)
+            if locked.status != Basket.OPEN:
+                raise exceptions.BasketException(
+                    f"Basket {self.id} has already been submitted!"
+                )
+
+            logger.info(
+                f"Creating order for basket_id={self.id}, "
+                f"shipping_address={shipping_address.id}, "
+                f"billing_address={billing_address.id}"
+            )
 
-        order_data = {
-            "user": self.user,
-            "billing_name": billing_address.name,
-            "billing_address1": billing_address.address1,
-            "billing_address2": billing_address.address2,
-            "billing_postal_code": billing_address.postal_code,
-            "billing_city": billing_address.city,
-            "billing_country": billing_address.country,
-            "shipping_name": shipping_address.name,
-            "shipping_address1": shipping_address.address1,
-            "shipping_address2": shipping_address.address2,
-            "shipping_postal_code": shipping_address.postal_code,
-            "shipping_city": shipping_address.city,
-            "shipping_country": shipping_address.country,
-        }
-        order = Order.objects.create(**order_data)
-
-        # For the BasketLine part, we're simply inserting the records line by
-        # line.
-        lines_count = 0
-        for basket_line in self.basketline_set.all():
-            for item in range(basket_line.quantity):
-                order_line_data = {
-                    "order": order,
-                    "product": basket_line.product,
-                }
-                order_line = OrderLine.objects.create(**order_line_data)
-                lines_count += 1
-
-        logger.info(
-            f"Created order with id={order.id} and lines_count={lines_count}"
-        )
+            order_data = {
+                "user": self.user,
+                "billing_name": billing_address.name,
+                "billing_address1": billing_address.address1,
+                "billing_address2": billing_address.address2,
+                "billing_postal_code": billing_address.postal_code,
+                "billing_city": billing_address.city,
+                "billing_country": billing_address.country,
+                "shipping_name": shipping_address.name,
+                "shipping_address1": shipping_address.address1,
+                "shipping_address2": shipping_address.address2,
+                "shipping_postal_code": shipping_address.postal_code,
+                "shipping_city": shipping_address.city,
+                "shipping_country": shipping_address.country,
+            }
+            order = Order.objects.create(**order_data)
+
+            # Lines are only built in memory here, one line per product (with
+            # its quantity and the price at this very moment), the number of
+            # round trips no longer depends on how many items are bought.
+            basket_lines = self.basketline_set.select_related("product")
+            order_lines = [
+                OrderLine(
+                    order=order,
+                    product=basket_line.product,
+                    quantity=basket_line.quantity,
+                    price=basket_line.product.price,
+                )
+                for basket_line in basket_lines.order_by("id")
+            ]
+            OrderLine.objects.bulk_create(order_lines)
 
-        # Mark the process of the "basket"'s side has ended (), the actual
-        # payment can be implemented in the `Order` model.
-        self.status = Basket.SUBMITTED
-        self.save()
+            # No signal for lines created in bulk, their daily stats and
+            # sales are recorded here
+            from .signals import daily_stats_recorder
+
+            daily_stats_recorder.add_lines(order, order_lines)
+
+            logger.info(
+                f"Created order with id={order.id} "
+                f"and lines_count={len(order_lines)} "
+                f"(items_count={sum(ol.quantity for ol in order_lines)})"
+            )
+
+            # Mark the process of the "basket"'s side has ended (), the actual
+            # payment can be implemented in the `Order` model.
+            self.status = Basket.SUBMITTED
+            self.save(update_fields=["status"])
 
         return order
 
@@ -264,7 +621,89 @@ class BasketLine(models.Model):
     )
 
 
-class Order(models.Model):
+class OrderManager(models.Manager):
+    def reconcile_statuses(self, order_ids):
+        """
+        Mark as done the orders (among these) whose lines have all been
+        processed, i.e. sent or cancelled. One grouped query, one update,
+        whatever the number of orders; the ones done already are left alone.
+        """
+        processed = (
+            OrderLine.objects.filter(order_id__in=order_ids)
+            .values("order_id")
+            .annotate(
+                unprocessed=Count("id", filter=Q(status__lt=OrderLine.SENT))
+            )
+            .filter(unprocessed=0)
+            .values("order_id")
+        )
+
+        return (
+            self.filter(pk__in=processed)
+            .exclude(status=Order.DONE)
+            .update(status=Order.DONE, date_updated=timezone.now())
+        )
+
+
+class RollupFieldsMixin:
+    """
+    Remember the fields the daily rollups are computed from as they are in
+    the database, so that the signals can take the old values out of the
+    rollups (and leave them alone when a save doesn't change them, e.g. a
+    new status). `None` means there's no such row yet.
+    """
+
+    ROLLUP_FIELDS = ()
+    loaded_rollup_fields = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_rollup_fields()
+
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self.loaded_rollup_fields is None and self.pk is not None:
+            # Deferred (or never loaded), one query rather than a guess
+            self.loaded_rollup_fields = (
+                type(self)
+                ._base_manager.filter(pk=self.pk)
+                .values(*self.ROLLUP_FIELDS)
+                .first()
+            )
+
+        super().save(*args, **kwargs)
+        self.remember_rollup_fields()
+
+    def remember_rollup_fields(self):
+        if self.get_deferred_fields().intersection(self.ROLLUP_FIELDS):
+            self.loaded_rollup_fields = None
+        else:
+            self.loaded_rollup_fields = {
+                name: getattr(self, name) for name in self.ROLLUP_FIELDS
+            }
+
+    def saved_rollup_field(self, name):
+        """
+        The value in the database, the current one when there's no such row.
+        """
+        loaded = self.loaded_rollup_fields
+
+        return getattr(self, name) if loaded is None else loaded[name]
+
+    @property
+    def rollup_fields_changed(self):
+        loaded = self.loaded_rollup_fields
+        if loaded is None:
+            return True
+
+        return any(
+            getattr(self, name) != value for name, value in loaded.items()
+        )
+
+
+class Order(RollupFieldsMixin, models.Model):
     NEW = 10
     PAID = 20
     DONE = 30
@@ -298,8 +737,25 @@ class Order(models.Model):
     date_updated = models.DateTimeField(auto_now=True)
     date_added = models.DateTimeField(auto_now_add=True)
 
+    objects = OrderManager()
+
+    ROLLUP_FIELDS = ("date_added", "shipping_country")
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "date_added"],
+                name="order_status_date_added_idx",
+            ),
+        ]
+
+
+class OrderLine(RollupFieldsMixin, models.Model):
+    """
+    Represent specific product, its quantity and the unit price it was sold
+    at (one row per product rather than one row per copy).
+    """
 
-class OrderLine(models.Model):
     NEW = 10
     PROCESSING = 20
     SENT = 30
@@ -315,5 +771,353 @@ class OrderLine(models.Model):
         to=Order, on_delete=models.CASCADE, related_name="lines"
     )
     product = models.ForeignKey(to=Product, on_delete=models.PROTECT)
+    quantity = models.PositiveIntegerField(
+        default=1, validators=[MinValueValidator(1)]
+    )
+
+    # A snapshot of the unit price, later changes to the product's price
+    # should not change what the customer has already paid.
+    price = models.DecimalField(max_digits=6, decimal_places=2, blank=True)
 
     status = models.IntegerField(choices=STATUSES, default=NEW)
+
+    ROLLUP_FIELDS = ("order_id", "product_id", "quantity", "price")
+
+    @property
+    def total(self):
+        return self.price * self.quantity
+
+    def save(self, *args, **kwargs):
+        if self.price is None:
+            self.price = self.product.price
+
+        super().save(*args, **kwargs)
+
+
+class ChatMessage(models.Model):
+    """
+    A message of the customer-service chat of an order. The consumer writes
+    them in batches (see `main.chat`), `created` is when it was sent.
+    """
+
+    order = models.ForeignKey(
+        to=Order, on_delete=models.CASCADE, related_name="chat_messages"
+    )
+    user = models.ForeignKey(to=User, on_delete=models.CASCADE)
+    message = models.TextField()
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["order", "created"], name="chatmessage_order_idx"
+            ),
+        ]
+
+
+class DailyStatsManager(models.Manager, metaclass=ABCMeta):
+    """
+    The signals add the changes of each transaction up to the stats (see
+    `signals.DailyStatsRecorder`), `rebuild` recomputes them all from the
+    orders. The subclasses say which fields make a row (`KEY_FIELDS`) and
+    how to `summarize` a bunch of orders.
+    """
+
+    KEY_FIELDS = ()
+    REBUILD_BATCH_SIZE = 1000
+
+    @abstractmethod
+    def summarize(self, orders):
+        """
+        Build the (unsaved) stats of the given orders.
+        """
+
+    @staticmethod
+    def day_of(date_added):
+        """
+        The (local) day of an order, for the naive dates too.
+        """
+        if timezone.is_naive(date_added):
+            date_added = timezone.make_aware(date_added)
+
+        return timezone.localdate(date_added)
+
+    @staticmethod
+    def month_after(day):
+        """
+        The first day of the month after the one of `day`.
+        """
+        return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+    def add_deltas(self, deltas):
+        """
+        Add `{key: {field: delta}}` up to the rows of these keys, creating
+        the missing ones first. An update per row whatever the number of
+        orders of the day; the rows are always updated in the same order,
+        so concurrent transactions wait for each other rather than deadlock.
+        """
+        deltas = {
+            key: fields
+            for key, fields in deltas.items()
+            if any(fields.values())
+        }
+        if not deltas:
+            return
+
+        rows = [
+            (dict(zip(self.KEY_FIELDS, key)), deltas[key])
+            for key in sorted(deltas)
+        ]
+        with transaction.atomic(savepoint=False):
+            self.bulk_create(
+                [self.model(**key) for key, fields in rows],
+                ignore_conflicts=True,
+            )
+            for key, fields in rows:
+                self.filter(**key).update(
+                    **{
+                        name: F(name) + value
+                        for name, value in fields.items()
+                        if value
+                    }
+                )
+
+    def rebuild(self):
+        """
+        Recompute everything (see `./manage.py rebuild_order_stats`).
+        """
+        stats = self.summarize(Order.objects.all())
+
+        # Not `batch_size`, which would override the (lower) limit of SQLite
+        with transaction.atomic():
+            self.all().delete()
+            for start in range(0, len(stats), self.REBUILD_BATCH_SIZE):
+                end = start + self.REBUILD_BATCH_SIZE
+                self.bulk_create(stats[start:end])
+
+        return len(stats)
+
+
+class OrderDailyStatsManager(DailyStatsManager):
+    KEY_FIELDS = ("day", "country")
+
+    def summarize(self, orders):
+        """
+        Build (unsaved) stats of the given orders, one per day and shipping
+        country. Two grouped queries, whatever the number of orders.
+        """
+        stats = {}
+
+        per_day = (
+            orders.annotate(day=TruncDate("date_added"))
+            .values("day", "shipping_country")
+            .annotate(orders=Count("id"))
+            .order_by()
+        )
+        for row in per_day:
+            stats[row["day"], row["shipping_country"]] = self.model(
+                day=row["day"],
+                country=row["shipping_country"],
+                orders=row["orders"],
+            )
+
+        lines_per_day = (
+            OrderLine.objects.filter(order__in=orders)
+            .annotate(day=TruncDate("order__date_added"))
+            .values("day", "order__shipping_country")
+            .annotate(
+                lines=Count("id"),
+                revenue=Sum(
+                    F("quantity") * F("price"),
+                    output_field=models.DecimalField(),
+                ),
+            )
+            .order_by()
+        )
+        for row in lines_per_day:
+            day_stats = stats[row["day"], row["order__shipping_country"]]
+            day_stats.lines = row["lines"]
+            day_stats.revenue = row["revenue"]
+
+        return list(stats.values())
+
+
+class OrderDailyStats(models.Model):
+    """
+    The amount of orders, lines and the revenue of each day per shipping
+    country. The reports read these few rows instead of grouping the whole
+    orders table, the signals keep them up to date.
+    """
+
+    day = models.DateField()
+    country = models.CharField(max_length=3)
+    orders = models.PositiveIntegerField(default=0)
+    lines = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal("0.00")
+    )
+
+    objects = OrderDailyStatsManager()
+
+    class Meta:
+        unique_together = ("day", "country")
+        verbose_name_plural = "order daily stats"
+
+
+class ProductDailySalesManager(DailyStatsManager):
+    KEY_FIELDS = ("day", "product_id")
+
+    def summarize(self, orders):
+        """
+        Build (unsaved) sales of the given orders, one per day and product.
+        """
+        per_day = (
+            OrderLine.objects.filter(order__in=orders)
+            .annotate(day=TruncDate("order__date_added"))
+            .values("day", "product_id")
+            .annotate(
+                # Not `quantity`, `F("quantity")` would be the annotation
+                sold=Sum("quantity"),
+                revenue=Sum(
+                    F("quantity") * F("price"),
+                    output_field=models.DecimalField(),
+                ),
+            )
+            .order_by()
+        )
+
+        return [
+            self.model(
+                day=row["day"],
+                product_id=row["product_id"],
+                quantity=row["sold"],
+                revenue=row["revenue"],
+            )
+            for row in per_day
+        ]
+
+    def top_products(self, start, end, n=10):
+        """
+        The `n` most bought products between two days (both included), as
+        `(product, quantity)` pairs.
+
+        The whole months of the window are read from `ProductMonthlySales`,
+        only the days at both ends from here: at most a row per product and
+        month, plus a row per product and day of the two partial months,
+        however long the window. The database adds up the rows of each
+        product, a bounded heap keeps the top `n` of both tables.
+        """
+        first_month = start if start.day == 1 else self.month_after(start)
+        # The first day of the last month that ends within the window
+        last_month = (
+            (end + timedelta(days=1)).replace(day=1) - timedelta(days=1)
+        ).replace(day=1)
+
+        if first_month > last_month:
+            parts = [self.filter(day__gte=start, day__lte=end)]
+        else:
+            parts = [
+                ProductMonthlySales.objects.filter(
+                    month__gte=first_month, month__lte=last_month
+                ),
+                self.filter(day__gte=start, day__lt=first_month),
+                self.filter(
+                    day__gte=self.month_after(last_month), day__lte=end
+                ),
+            ]
+
+        sold = [
+            part.values("product_id")
+            .annotate(sold=Sum("quantity"))
+            .filter(sold__gt=0)
+            .order_by("-sold", "product_id")
+            for part in parts
+        ]
+
+        if len(sold) == 1:
+            top = [(row["product_id"], row["sold"]) for row in sold[0][:n]]
+        else:
+            totals = Counter()
+            for part in sold:
+                totals.update({row["product_id"]: row["sold"] for row in part})
+            top = heapq.nsmallest(
+                n, totals.items(), key=lambda item: (-item[1], item[0])
+            )
+
+        products = Product.objects.in_bulk(
+            [product_id for product_id, sold in top]
+        )
+
+        return [(products[product_id], sold) for product_id, sold in top]
+
+
+class ProductDailySales(models.Model):
+    """
+    The copies of each product sold per day (and what they brought in), the
+    most bought products are picked from these rather than the order lines.
+    """
+
+    day = models.DateField()
+    product = models.ForeignKey(to=Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal("0.00")
+    )
+
+    objects = ProductDailySalesManager()
+
+    class Meta:
+        unique_together = ("day", "product")
+        verbose_name_plural = "product daily sales"
+
+
+class ProductMonthlySalesManager(DailyStatsManager):
+    KEY_FIELDS = ("month", "product_id")
+
+    def summarize(self, orders):
+        """
+        Build (unsaved) sales of the given orders, one per month and product.
+        """
+        per_month = (
+            OrderLine.objects.filter(order__in=orders)
+            .annotate(month=TruncMonth("order__date_added"))
+            .values("month", "product_id")
+            .annotate(
+                sold=Sum("quantity"),
+                revenue=Sum(
+                    F("quantity") * F("price"),
+                    output_field=models.DecimalField(),
+                ),
+            )
+            .order_by()
+        )
+
+        return [
+            self.model(
+                month=row["month"],
+                product_id=row["product_id"],
+                quantity=row["sold"],
+                revenue=row["revenue"],
+            )
+            for row in per_month
+        ]
+
+
+class ProductMonthlySales(models.Model):
+    """
+    The daily sales added up per month (`month` is its first day), for the
+    long periods of the reports.
+    """
+
+    month = models.DateField()
+    product = models.ForeignKey(to=Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal("0.00")
+    )
+
+    objects = ProductMonthlySalesManager()
+
+    class Meta:
+        unique_together = ("month", "product")
+        verbose_name_plural = "product monthly sales"
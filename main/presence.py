@@ -0,0 +1,185 @@
+"""
+Who is online in the customer-service chat rooms.
+
+Every chat websocket sends a heartbeat (every 10 seconds), a user is online
+in a room as long as we've seen one in the last `PRESENCE_TIMEOUT` seconds.
+Heartbeats of the same user and room within `PRESENCE_COALESCE` seconds of
+the last one that was written are dropped before they reach the backend.
+
+Two backends, picked by `PRESENCE_BACKEND`:
+- `InMemoryPresence`, a dict in the process (tests, single-node deployments)
+- `RedisPresence`, a sorted set per room (member -> last heartbeat), shared
+  by all the workers; each worker uses one small connection pool, not one
+  connection per websocket
+
+The views are synchronous, they go through `run_sync` (one event loop for
+the whole process) rather than `async_to_sync`, whose new event loop every
+time would mean a new pool every time.
+"""
+import asyncio
+from functools import lru_cache
+import threading
+import time
+import weakref
+
+import aioredis
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+def room_name(order_id):
+    return f"customer-service_{order_id}"
+
+
+class InMemoryPresence:
+    def __init__(self):
+        self.rooms = {}
+
+    async def touch(self, room, member, now):
+        self.rooms.setdefault(room, {})[member] = now
+
+    async def remove(self, room, member):
+        self.rooms.get(room, {}).pop(member, None)
+
+    async def online(self, room, since):
+        members = self.rooms.get(room, {})
+
+        for member, seen in list(members.items()):
+            if seen < since:
+                members.pop(member, None)
+
+        return sorted(members)
+
+
+class RedisPresence:
+    def __init__(self):
+        self.address = settings.PRESENCE_REDIS_ADDRESS
+        # The connections are bound to an event loop, one pool for each
+        self.pools = weakref.WeakKeyDictionary()
+
+    async def get_pool(self):
+        loop = asyncio.get_event_loop()
+        pool = self.pools.get(loop)
+
+        if pool is None:
+            # A task (not the pool itself), so that the coroutines asking at
+            # the same time end up sharing the very same pool
+            pool = loop.create_task(
+                aioredis.create_redis_pool(
+                    self.address,
+                    maxsize=settings.PRESENCE_REDIS_POOL_SIZE,
+                    encoding="utf-8",
+                )
+            )
+            self.pools[loop] = pool
+
+        try:
+            return await pool
+        except Exception:
+            # Not for good (e.g. Redis restarting), the next call tries again
+            if self.pools.get(loop) is pool:
+                del self.pools[loop]
+            raise
+
+    async def touch(self, room, member, now):
+        redis = await self.get_pool()
+
+        timeout = settings.PRESENCE_TIMEOUT
+
+        transaction = redis.multi_exec()
+        transaction.zadd(room, now, member)
+        transaction.zremrangebyscore(room, max=now - timeout)
+        # Abandoned rooms go away on their own
+        transaction.expire(room, timeout)
+        await transaction.execute()
+
+    async def remove(self, room, member):
+        redis = await self.get_pool()
+        await redis.zrem(room, member)
+
+    async def online(self, room, since):
+        redis = await self.get_pool()
+        return sorted(await redis.zrangebyscore(room, min=since))
+
+
+class Presence:
+    def __init__(self, backend):
+        self.backend = backend
+        self.last_written = {}
+        self.pruned_at = 0
+
+    def prune(self, now):
+        """
+        Forget the heartbeats too old to coalesce anything, e.g. those of the
+        sockets that dropped without saying goodbye. Once per window, it goes
+        through them all.
+        """
+        since = now - settings.PRESENCE_COALESCE
+        if self.pruned_at > since:
+            return
+
+        self.last_written = {
+            key: last
+            for key, last in self.last_written.items()
+            if last > since
+        }
+        self.pruned_at = now
+
+    async def heartbeat(self, room, member):
+        """
+        Return whether the heartbeat was written (or coalesced).
+        """
+        now = time.time()
+        last = self.last_written.get((room, member))
+
+        if last is not None and now - last < settings.PRESENCE_COALESCE:
+            return False
+
+        self.prune(now)
+        self.last_written[room, member] = now
+        await self.backend.touch(room, member, now)
+
+        return True
+
+    async def leave(self, room, member):
+        """
+        Another socket of the same user (another tab) brings them back with
+        its next heartbeat.
+        """
+        self.last_written.pop((room, member), None)
+        await self.backend.remove(room, member)
+
+    async def online(self, room):
+        return await self.backend.online(
+            room, since=time.time() - settings.PRESENCE_TIMEOUT
+        )
+
+
+@lru_cache(maxsize=None)
+def get_presence():
+    return Presence(backend=import_string(settings.PRESENCE_BACKEND)())
+
+
+@lru_cache(maxsize=None)
+def get_background_loop():
+    """
+    The event loop of the synchronous code, in a thread of its own, along
+    with the Redis pool bound to it.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(
+        target=loop.run_forever, name="presence", daemon=True
+    ).start()
+
+    return loop
+
+
+def run_sync(coroutine):
+    """
+    Run a coroutine (of `get_presence()`) from synchronous code, e.g.
+    `run_sync(get_presence().online(room))`, and return its result.
+    """
+    future = asyncio.run_coroutine_threadsafe(coroutine, get_background_loop())
+
+    return future.result()
@@ -0,0 +1,160 @@
+"""
+Renditions (thumbnails and friends) of the product images.
+
+Saving a `ProductImage` only puts its id on a queue, a local worker thread
+does the actual image processing after the transaction is committed. Set
+`RENDITIONS_EAGER = True` to do it right away instead (e.g. in the tests).
+
+The renditions are content-addressed: they are stored under the SHA-256 of
+the source image, so an identical image uploaded twice is processed once.
+"""
+from hashlib import sha256
+from io import BytesIO
+import logging
+import queue
+import threading
+
+from PIL import Image
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+from . import caching
+from .models import ProductImage
+
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS = {
+    "thumbnail": {"size": (300, 300), "format": "JPEG"},
+    "thumbnail-webp": {"size": (300, 300), "format": "WEBP"},
+    "medium-webp": {"size": (800, 800), "format": "WEBP"},
+}
+EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp"}
+
+
+def rendition_path(digest, name):
+    extension = EXTENSIONS[RENDITIONS[name]["format"]]
+    return f"product-renditions/{digest[:2]}/{digest}/{name}.{extension}"
+
+
+def file_digest(source):
+    digest = sha256()
+    source.seek(0)
+
+    for chunk in iter(lambda: source.read(64 * 1024), b""):
+        digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def render(source, size, image_format):
+    """
+    `draft` lets the JPEG decoder skip most of the pixels of a big photo,
+    `reducing_gap` shrinks it with `reduce` before the (costly) resampling.
+    """
+    source.seek(0)
+    image = Image.open(source)
+    image.draft("RGB", size)
+
+    if image_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+
+    image.thumbnail(size, reducing_gap=2.0)
+
+    with BytesIO() as output:
+        image.save(fp=output, format=image_format)
+        return output.getvalue()
+
+
+def missing_renditions(source, digest):
+    return {
+        name: render(source, spec["size"], spec["format"])
+        for name, spec in RENDITIONS.items()
+        if not default_storage.exists(rendition_path(digest, name))
+    }
+
+
+def render_missing(source_path):
+    """
+    Return the digest of the image and the renditions it doesn't have yet.
+    There is no database access here, it's also run in the processes of
+    `./manage.py import_data --bulk`.
+    """
+    with open(source_path, mode="rb") as source:
+        digest = file_digest(source)
+        return digest, missing_renditions(source, digest)
+
+
+def store_renditions(digest, renditions):
+    for name, content in renditions.items():
+        path = rendition_path(digest, name)
+
+        # Another worker could've been faster with the very same image
+        if not default_storage.exists(path):
+            default_storage.save(path, ContentFile(content))
+
+
+def generate_renditions(image_id):
+    try:
+        image = ProductImage.objects.get(pk=image_id)
+    except ProductImage.DoesNotExist:
+        return
+
+    logger.info(f"Generating renditions for product {image.product_id}")
+
+    with image.image.open(mode="rb") as source:
+        digest = file_digest(source)
+        store_renditions(digest, missing_renditions(source, digest))
+
+    # `update` won't send `post_save`, otherwise it'd be queued again
+    ProductImage.objects.filter(pk=image_id).update(
+        digest=digest, thumbnail=rendition_path(digest, "thumbnail")
+    )
+    caching.touch_products([image.product_id])
+
+
+class RenditionQueue:
+    """
+    A queue with a single (lazily started) worker thread in each process.
+    The pending jobs are lost when the process exits, run
+    `./manage.py generate_renditions` to catch up with those.
+    """
+
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.worker = None
+        self.lock = threading.Lock()
+
+    def enqueue(self, image_id):
+        if settings.RENDITIONS_EAGER:
+            generate_renditions(image_id)
+            return
+
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self.work, daemon=True)
+                self.worker.start()
+
+        # The worker uses its own connection, wait until the row is visible
+        transaction.on_commit(lambda: self.jobs.put(image_id))
+
+    def work(self):
+        while True:
+            image_id = self.jobs.get()
+
+            try:
+                generate_renditions(image_id)
+            except Exception:
+                logger.exception(f"Renditions failed for image {image_id}")
+            finally:
+                close_old_connections()
+                self.jobs.task_done()
+
+    def join(self):
+        self.jobs.join()
+
+
+rendition_queue = RenditionQueue()
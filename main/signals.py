@@ -1,77 +1,416 @@
-from io import BytesIO
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
 import logging
-from PIL import Image
+import threading
 
-from django.core.files.base import ContentFile
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import (
+    post_save,
+    pre_delete,
+    post_delete,
+    m2m_changed,
+)
 from django.dispatch import receiver
+from django.contrib.auth.models import Group
 from django.contrib.auth.signals import user_logged_in
+from django.core.cache import cache
+from django.db import transaction
 
-from .models import ProductImage, Basket
-from .models import OrderLine, Order
-
-THUMBNAIL_SIZE = (300, 300)
+from . import caching
+from .renditions import rendition_queue
+from .models import User
+from .models import Product, ProductImage, ProductTag, Basket, BasketLine
+from .models import OrderLine, Order, OrderDailyStats, ProductDailySales
+from .models import DailyStatsManager, ProductMonthlySales
 
 logger = logging.getLogger(__name__)
 
 
-@receiver(pre_save, sender=ProductImage)
-def generate_thumbnail(sender, instance, **kwargs):
-    logger.info(msg=f"Generating thumbnail for product {instance.product.id}")
-
-    image = Image.open(instance.image)
-    # image = image.convert("RGB")
-    # image.thumbnail(THUMBNAIL_SIZE, Image.ANTIALIAS)
-    image.thumbnail(THUMBNAIL_SIZE)
-    temp_thumbnail = BytesIO()
-    image.save(fp=temp_thumbnail, format="JPEG")
-    temp_thumbnail.seek(0)
+@receiver(post_save, sender=ProductImage)
+def queue_renditions(sender, instance, **kwargs):
+    """
+    The image processing happens in the background (see `renditions`), all
+    we do here is putting it on the queue.
+    """
+    rendition_queue.enqueue(instance.pk)
 
-    # Give thumbnail a bit different name
-    thumbnail_name = instance.image.name.replace("jpg", "thumb.jpg")
 
-    # Set `save=False`, otherwise it'll run in an infinite loop (quote).
-    instance.thumbnail.save(
-        thumbnail_name, ContentFile(temp_thumbnail.read()), save=False
+def forget_group_names(user_ids):
+    cache.delete_many(
+        [User.GROUP_NAMES_CACHE_KEY.format(user_id) for user_id in user_ids]
     )
-    temp_thumbnail.close()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def forget_group_names_on_change(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """
+    Just like the tags of the products, `user.groups` and `group.user_set`.
+    """
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            forget_group_names([instance.pk])
+            instance.forget_group_names()
+    elif action == "pre_clear":
+        instance._cleared_user_ids = list(
+            instance.user_set.values_list("pk", flat=True)
+        )
+    elif action == "post_clear":
+        forget_group_names(getattr(instance, "_cleared_user_ids", []))
+    elif action in ("post_add", "post_remove"):
+        forget_group_names(pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def forget_group_names_of_members(sender, instance, **kwargs):
+    forget_group_names(instance.user_set.values_list("pk", flat=True))
 
 
 @receiver(signal=user_logged_in)
 def merge_baskets_if_found(sender, user, request, **kwargs):
     """
     Part of the job was done by our own middleware (basket_middleware).
+
+    The basket is resolved lazily, the user is already logged in by now so we
+    might get the user's own basket back, which has nothing to be merged.
     """
     anonymous_basket = getattr(request, "basket", None)
-    if anonymous_basket:
-        try:
-            loggedin_basket = Basket.objects.get(user=user, status=Basket.OPEN)
+    if anonymous_basket and anonymous_basket.user_id is None:
+        basket = Basket.objects.merge(anonymous_basket, user)
+        request.basket = basket
+        request.session["basket_id"] = basket.id
 
-            for basket_line in anonymous_basket.basketline_set.all():
-                basket_line.basket = loggedin_basket
-                basket_line.save()
+        logger.info(f"Merged basket to id {basket.id}")
 
-            anonymous_basket.delete()
-            request.basket = loggedin_basket
 
-            logger.info(f"Merged basket to id {loggedin_basket.id}")
-        except Basket.DoesNotExist:
-            anonymous_basket.user = user
-            anonymous_basket.save()
+@receiver(post_save, sender=ProductTag)
+@receiver(post_delete, sender=ProductTag)
+def clear_tag_slug_cache(sender, instance, **kwargs):
+    ProductTag.objects.slug_cache.clear()
 
-            logger.info(f"Assigned user to basket id {anonymous_basket.id}")
 
+@receiver(post_save, sender=Product)
+def refresh_basket_totals(sender, instance, created, **kwargs):
+    if not created and instance.price != instance.loaded_price:
+        Basket.objects.refresh_totals(instance.pk)
 
-@receiver(post_save, sender=OrderLine)
-def orderline_to_order_status(sender, instance, **kwargs):
+    instance.loaded_price = instance.price
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_page(sender, instance, **kwargs):
+    """
+    The old slug too, when it's been changed: nothing points to that page
+    anymore.
+    """
+    slugs = {instance.slug, instance.loaded_slug} - {None}
+    caching.invalidate_product_pages(slugs)
+
+    instance.loaded_slug = instance.slug
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def touch_products_on_tags_change(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
     """
-    Honestly, I can't figure this method out (how it'll be used).
+    The signal is sent from both sides, i.e. `product.tags.add(tag)` and
+    `tag.product_set.add(product)`.
     """
-    if not instance.order.lines.filter(status__lt=OrderLine.SENT).exists():
-        logger.info(
-            f"All lines for order {instance.order.id} have been processed. "
-            f"Marking as done."
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            caching.touch_products([instance.pk])
+    elif action == "pre_clear":
+        # Remember who were tagged, they are gone when "post_clear" is sent
+        instance._cleared_product_ids = list(
+            instance.product_set.values_list("pk", flat=True)
         )
+    elif action == "post_clear":
+        caching.touch_products(getattr(instance, "_cleared_product_ids", []))
+    elif action in ("post_add", "post_remove"):
+        caching.touch_products(pk_set)
+
+
+@receiver(post_save, sender=ProductTag)
+@receiver(pre_delete, sender=ProductTag)
+def touch_tagged_products(sender, instance, **kwargs):
+    caching.touch_products(instance.product_set.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def touch_product_of_image(sender, instance, **kwargs):
+    caching.touch_products([instance.product_id])
+
+
+@receiver(post_save, sender=BasketLine)
+@receiver(post_delete, sender=BasketLine)
+def refresh_basket_summary(sender, instance, **kwargs):
+    """
+    Keep the summary columns of the basket up to date, including the basket
+    object the line holds (e.g. `request.basket` used by the formset).
+    """
+    if Basket.objects.summaries_deferred:
+        return
+
+    summary = Basket.objects.refresh_summary(instance.basket_id)
+
+    if BasketLine.basket.is_cached(instance):
+        for field_name, value in summary.items():
+            setattr(instance.basket, field_name, value)
+
+
+class OnCommitBatch:
+    """
+    The items collected in a transaction (or savepoint), and whatever the
+    collector wants to remember until they are processed (`memo`).
+    """
+
+    def __init__(self, collector, key):
+        self.collector = collector
+        self.key = key
+        self.items = []
+        self.memo = {}
+
+    def flush(self):
+        if self.collector.batches.get(self.key) is self:
+            del self.collector.batches[self.key]
+
+        if self.items:
+            self.collector.process(self.items)
+
+
+class OnCommitCollector(ABC):
+    """
+    Collect what the saves of a transaction touched and `process` it all at
+    once when the transaction is committed (straight away in autocommit).
 
-        instance.order.status = Order.DONE
-        instance.order.save()
+    There's a batch per savepoint, with its own `on_commit` callback: Django
+    drops the callbacks of what's rolled back, their items go along.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+
+    @property
+    def batches(self):
+        if not hasattr(self.local, "batches"):
+            self.local.batches = {}
+        return self.local.batches
+
+    def current_batch(self):
+        """
+        The batch of the current savepoint, `None` in autocommit.
+        """
+        connection = transaction.get_connection()
+        if not connection.in_atomic_block:
+            return None
+
+        key = tuple(connection.savepoint_ids)
+        registered = [func for sids, func in connection.run_on_commit]
+        batch = self.batches.get(key)
+
+        if batch is None or batch.flush not in registered:
+            # Forget the batches of whatever was rolled back in the meantime
+            for stale_key, stale in list(self.batches.items()):
+                if stale.flush not in registered:
+                    del self.batches[stale_key]
+
+            batch = self.batches[key] = OnCommitBatch(self, key)
+            transaction.on_commit(batch.flush)
+
+        return batch
+
+    def add(self, *items):
+        batch = self.current_batch()
+        if batch is None:
+            self.process(list(items))
+        else:
+            batch.items.extend(items)
+
+    @abstractmethod
+    def process(self, items):
+        pass
+
+
+class DailyStatsRecorder(OnCommitCollector):
+    """
+    Turn the orders and lines saved or deleted into deltas of the daily
+    stats (per day and shipping country) and sales (per day, and month, and
+    product),
+    added up once, after the commit: the checkout doesn't wait for the
+    reports, nor fails because of them. What a row used to count comes from
+    the values `RollupFieldsMixin` remembered.
+    """
+
+    def order_keys(self):
+        batch = self.current_batch()
+
+        return {} if batch is None else batch.memo.setdefault("orders", {})
+
+    def order_key(self, order):
+        """
+        The day and shipping country of a (loaded) order, as it's saved.
+        """
+        return (
+            DailyStatsManager.day_of(order.saved_rollup_field("date_added")),
+            order.saved_rollup_field("shipping_country"),
+        )
+
+    def order_key_of_id(self, order_id):
+        keys = self.order_keys()
+
+        if order_id not in keys:
+            date_added, country = Order.objects.values_list(
+                "date_added", "shipping_country"
+            ).get(pk=order_id)
+            keys[order_id] = (DailyStatsManager.day_of(date_added), country)
+
+        return keys[order_id]
+
+    def line_deltas(self, order_key, product_id, quantity, price, sign=1):
+        day = order_key[0]
+        revenue = quantity * price * sign
+
+        sales = {"quantity": quantity * sign, "revenue": revenue}
+
+        return [
+            (OrderDailyStats, order_key, {"lines": sign, "revenue": revenue}),
+            (ProductDailySales, (day, product_id), sales),
+            (ProductMonthlySales, (day.replace(day=1), product_id), sales),
+        ]
+
+    def saved_line_deltas(self, line, sign=1):
+        return self.line_deltas(
+            self.order_key_of_id(line.saved_rollup_field("order_id")),
+            line.saved_rollup_field("product_id"),
+            line.saved_rollup_field("quantity"),
+            line.saved_rollup_field("price"),
+            sign,
+        )
+
+    def add_order(self, order):
+        new_key = (
+            DailyStatsManager.day_of(order.date_added),
+            order.shipping_country,
+        )
+        deltas = [(OrderDailyStats, new_key, {"orders": 1})]
+
+        if order.loaded_rollup_fields is not None:
+            old_key = self.order_key(order)
+            deltas.append((OrderDailyStats, old_key, {"orders": -1}))
+
+            # Its lines move along to the new day (or country)
+            for line in order.lines.all():
+                values = (line.product_id, line.quantity, line.price)
+                deltas += self.line_deltas(old_key, *values, sign=-1)
+                deltas += self.line_deltas(new_key, *values)
+
+        # Whatever the savepoint looked it up, it's somewhere else now
+        for batch in self.batches.values():
+            batch.memo.get("orders", {}).pop(order.pk, None)
+        self.order_keys()[order.pk] = new_key
+        self.add(*deltas)
+
+    def add_deleted_order(self, order):
+        # Its lines are deleted first, they've taken themselves out already
+        self.add((OrderDailyStats, self.order_key(order), {"orders": -1}))
+
+    def add_line(self, line):
+        deltas = []
+        if line.loaded_rollup_fields is not None:
+            deltas += self.saved_line_deltas(line, sign=-1)
+
+        if OrderLine.order.is_cached(line):
+            order_key = self.order_key(line.order)
+        else:
+            order_key = self.order_key_of_id(line.order_id)
+        deltas += self.line_deltas(
+            order_key, line.product_id, line.quantity, line.price
+        )
+
+        self.add(*deltas)
+
+    def add_lines(self, order, lines):
+        """
+        For the lines created in bulk, which send no signal.
+        """
+        order_key = self.order_key(order)
+
+        deltas = []
+        for line in lines:
+            deltas += self.line_deltas(
+                order_key, line.product_id, line.quantity, line.price
+            )
+
+        self.add(*deltas)
+
+    def add_deleted_line(self, line):
+        self.add(*self.saved_line_deltas(line, sign=-1))
+
+    def process(self, items):
+        deltas = {
+            OrderDailyStats: defaultdict(Counter),
+            ProductDailySales: defaultdict(Counter),
+            ProductMonthlySales: defaultdict(Counter),
+        }
+        for model, key, fields in items:
+            deltas[model][key].update(fields)
+
+        with transaction.atomic():
+            for model, model_deltas in deltas.items():
+                model.objects.add_deltas(model_deltas)
+
+
+daily_stats_recorder = DailyStatsRecorder()
+
+
+@receiver(post_save, sender=Order)
+def record_daily_stats_of_order(sender, instance, **kwargs):
+    if instance.rollup_fields_changed:
+        daily_stats_recorder.add_order(instance)
+
+
+@receiver(post_delete, sender=Order)
+def record_daily_stats_of_deleted_order(sender, instance, **kwargs):
+    daily_stats_recorder.add_deleted_order(instance)
+
+
+@receiver(post_save, sender=OrderLine)
+def record_daily_stats_of_line(sender, instance, **kwargs):
+    """
+    Only the quantity, price, product (or order) of the lines count, the
+    status updates of the dispatchers leave the rollups alone.
+    """
+    if instance.rollup_fields_changed:
+        daily_stats_recorder.add_line(instance)
+
+
+@receiver(post_delete, sender=OrderLine)
+def record_daily_stats_of_deleted_line(sender, instance, **kwargs):
+    daily_stats_recorder.add_deleted_line(instance)
+
+
+class OrderStatusReconciler(OnCommitCollector):
+    """
+    Collect the orders whose lines were saved and reconcile their status
+    once, when the transaction is committed. Saving a formset of 50 lines
+    costs their 50 updates and a single grouped update on top (the daily
+    rollups are added up the same way, see `DailyStatsRecorder`) rather
+    than a query and a save per line.
+    """
+
+    def process(self, order_ids):
+        done = Order.objects.reconcile_statuses(order_ids)
+        if done:
+            logger.info(f"All lines processed for {done} orders, now done")
+
+
+order_status_reconciler = OrderStatusReconciler()
+
+
+@receiver(post_save, sender=OrderLine)
+def orderline_to_order_status(sender, instance, **kwargs):
+    order_status_reconciler.add(instance.order_id)
@@ -93,7 +93,7 @@
 /*! no static exports found */
 /***/ (function(module, exports, __webpack_require__) {
 
-eval("const React = __webpack_require__(/*! react */ \"./node_modules/react/index.js\");\nconst ReactDOM = __webpack_require__(/*! react-dom */ \"./node_modules/react-dom/index.js\");\nconst e = React.createElement;\n\nvar imageStyle = {\n    marginTop: '10px',\n    display: 'inline-block',\n};\n\nclass ImageBox extends React.Component {\n    constructor(props) {\n        super(props);\n        this.state = {\n            currentImage: this.props.imageStart,\n        };\n    }\n\n    click(image) {\n        this.setState({\n            currentImage: image,\n        });\n    }\n\n    render() {\n        const imagesize_fullres = '400';\n        const imagesize_thumnail = '100';\n\n        const images = this.props.images.map(i =>\n            e(\n                'div',\n                {\n                    style: imageStyle,\n                    className: 'image',\n                    key: i.image,\n                },\n                e('img', {\n                    onClick: this.click.bind(this, i),\n                    width: imagesize_thumnail,\n                    src: i.thumbnail,\n                })\n            )\n        );\n\n        return e(\n            'div',\n            {\n                className: 'gallery',\n            },\n            e(\n                'div',\n                {\n                    className: 'current-image',\n                },\n                e('img', {\n                    src: this.state.currentImage.image,\n                    width: imagesize_fullres,\n                })\n            ),\n            images\n        );\n    }\n}\n\nwindow.React = React;\nwindow.ReactDOM = ReactDOM;\nwindow.ImageBox = ImageBox;\n\nmodule.exports = ImageBox;\n\n\n//# sourceURL=webpack:///./frontend/imageswitcher.js?");
+eval("const React = __webpack_require__(/*! react */ \"./node_modules/react/index.js\");\nconst ReactDOM = __webpack_require__(/*! react-dom */ \"./node_modules/react-dom/index.js\");\nconst e = React.createElement;\n\nvar imageStyle = {\n    marginTop: '10px',\n    display: 'inline-block',\n};\n\n// The WebP rendition for the browsers that support it, the JPEG otherwise\nfunction picture(webp, imageProps) {\n    if (!webp) {\n        return e('img', imageProps);\n    }\n\n    return e(\n        'picture',\n        null,\n        e('source', {\n            type: 'image/webp',\n            srcSet: webp,\n        }),\n        e('img', imageProps)\n    );\n}\n\nclass ImageBox extends React.Component {\n    constructor(props) {\n        super(props);\n        this.state = {\n            currentImage: this.props.imageStart,\n        };\n    }\n\n    click(image) {\n        this.setState({\n            currentImage: image,\n        });\n    }\n\n    render() {\n        const imagesize_fullres = '400';\n        const imagesize_thumnail = '100';\n\n        const images = this.props.images.map(i =>\n            e(\n                'div',\n                {\n                    style: imageStyle,\n                    className: 'image',\n                    key: i.image,\n                },\n                picture(i.thumbnail_webp, {\n                    onClick: this.click.bind(this, i),\n                    width: imagesize_thumnail,\n                    src: i.thumbnail,\n                })\n            )\n        );\n\n        return e(\n            'div',\n            {\n                className: 'gallery',\n            },\n            e(\n                'div',\n                {\n                    className: 'current-image',\n                },\n                picture(this.state.currentImage.image_webp, {\n                    src: this.state.currentImage.image,\n                    width: imagesize_fullres,\n                })\n            ),\n            images\n        );\n    }\n}\n\nwindow.React = React;\nwindow.ReactDOM = ReactDOM;\nwindow.ImageBox = ImageBox;\n\nmodule.exports = ImageBox;\n\n\n//# sourceURL=webpack:///./frontend/imageswitcher.js?");
 
 /***/ }),
 
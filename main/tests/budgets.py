@@ -0,0 +1,168 @@
+"""
+Query budgets: the most queries a page may run, whatever the amount of data.
+
+The pages are requested with the fixtures scaled up (see `SCALE` and
+`test_query_budgets`), a query per row blows the budget right away instead
+of slipping through with the handful of rows the other tests create.
+
+    with query_budget(5, label="basket"):
+        self.client.get("/basket/")
+
+    @query_budget(5)
+    def test_something(self):
+        ...
+"""
+from contextlib import ContextDecorator
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# How many rows of each kind the fixtures have (products, lines of a basket
+# or an order, orders, ...), well above the size of any budget
+SCALE = 30
+
+# The counts below were measured on SQLite (the test settings), which logs
+# the BEGIN of each transaction, PostgreSQL (production) doesn't but may
+# differ elsewhere (savepoints, locking). Every budget gets that many extra
+# queries, few enough for a query per row (`SCALE` of them) to still fail.
+HEADROOM = 2
+
+# The budgets by URL name, every page of `main.urls` and of the admin sites
+# must have one (see `test_every_page_has_a_budget`)
+BUDGETS = {}
+
+
+def budget(name, queries):
+    BUDGETS[name] = queries + HEADROOM
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class query_budget(ContextDecorator):
+    """
+    Fail with the captured SQL when the block runs more queries than that.
+    """
+
+    def __init__(self, queries, label="The block"):
+        self.queries = queries
+        self.label = label
+
+    def __enter__(self):
+        self.context = CaptureQueriesContext(connection)
+        self.context.__enter__()
+
+        return self.context
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.context.__exit__(exc_type, exc_value, traceback)
+
+        if exc_type is None and len(self.context) > self.queries:
+            raise QueryBudgetExceeded(self.report())
+
+    def report(self):
+        queries = "\n".join(
+            f"{i}. {query['sql']}"
+            for i, query in enumerate(self.context.captured_queries, start=1)
+        )
+
+        return (
+            f"{self.label} ran {len(self.context)} queries, over its budget "
+            f"of {self.queries}:\n{queries}"
+        )
+
+
+""" The storefront (main.urls) """
+
+budget("main:about_us", 2)
+budget("main:add_to_basket", 11)
+budget("main:address_create", 2)
+budget("main:address_delete", 3)
+budget("main:address_list", 3)
+budget("main:address_select", 4)
+budget("main:address_update", 3)
+budget("main:api-root", 2)
+budget("main:basket", 7)
+budget("main:checkout_done", 2)
+budget("main:contact_us", 2)
+budget("main:customer_service_chat", 2)
+budget("main:customer_service_history", 4)
+budget("main:customer_service_presence", 3)
+budget("main:index", 2)
+budget("main:login", 0)
+budget("main:order-detail", 3)
+budget("main:order-list", 4)
+budget("main:order_dashboard", 4)
+budget("main:order_export", 3)
+budget("main:orderline-bulk-status", 5)
+budget("main:orderline-detail", 3)
+budget("main:orderline-list", 3)
+budget("main:product", 5)
+budget("main:products", 3)
+budget("main:signup", 0)
+
+""" The owners' admin """
+
+budget("admin:index", 3)
+budget("admin:invoice", 4)
+budget("admin:main_address_add", 5)
+budget("admin:main_address_change", 6)
+budget("admin:main_address_changelist", 5)
+budget("admin:main_basket_add", 6)
+budget("admin:main_basket_change", 7)
+budget("admin:main_basket_changelist", 5)
+budget("admin:main_order_add", 6)
+budget("admin:main_order_change", 7)
+budget("admin:main_order_changelist", 6)
+budget("admin:main_product_add", 5)
+budget("admin:main_product_change", 7)
+budget("admin:main_product_changelist", 5)
+budget("admin:main_productimage_add", 6)
+budget("admin:main_productimage_change", 6)
+budget("admin:main_productimage_changelist", 5)
+budget("admin:main_producttag_add", 5)
+budget("admin:main_producttag_change", 5)
+budget("admin:main_producttag_changelist", 5)
+budget("admin:main_user_add", 7)
+budget("admin:main_user_change", 9)
+budget("admin:main_user_changelist", 6)
+budget("admin:most_bought_products", 2)
+budget("admin:orders_per_day", 3)
+
+""" The central office admin """
+
+budget("central_office_admin:index", 6)
+budget("central_office_admin:invoice", 4)
+budget("central_office_admin:main_address_add", 6)
+budget("central_office_admin:main_address_change", 8)
+budget("central_office_admin:main_address_changelist", 7)
+budget("central_office_admin:main_order_add", 6)
+budget("central_office_admin:main_order_change", 9)
+budget("central_office_admin:main_order_changelist", 8)
+budget("central_office_admin:main_product_add", 6)
+budget("central_office_admin:main_product_change", 9)
+budget("central_office_admin:main_product_changelist", 7)
+budget("central_office_admin:main_productimage_add", 7)
+budget("central_office_admin:main_productimage_change", 8)
+budget("central_office_admin:main_productimage_changelist", 7)
+budget("central_office_admin:main_producttag_add", 6)
+budget("central_office_admin:main_producttag_change", 7)
+budget("central_office_admin:main_producttag_changelist", 7)
+budget("central_office_admin:most_bought_products", 4)
+budget("central_office_admin:orders_per_day", 5)
+
+""" The dispatchers' admin """
+
+budget("dispatchers-admin:index", 6)
+budget("dispatchers-admin:main_order_add", 6)
+budget("dispatchers-admin:main_order_change", 8)
+budget("dispatchers-admin:main_order_changelist", 8)
+budget("dispatchers-admin:main_product_add", 6)
+budget("dispatchers-admin:main_product_change", 8)
+budget("dispatchers-admin:main_product_changelist", 7)
+budget("dispatchers-admin:main_producttag_add", 6)
+budget("dispatchers-admin:main_producttag_change", 7)
+budget("dispatchers-admin:main_producttag_changelist", 7)
+budget("dispatchers-admin:most_bought_products", 4)
+budget("dispatchers-admin:orders_per_day", 5)
@@ -1,54 +1,31 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from decimal import Decimal
+import shutil
+import tempfile
 from unittest.mock import patch
 
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
 from main import factories
 from main import models
 
 
 class TestAdminViews(TestCase):
-    def test_most_bought_products(self):
-        user = models.User.objects.create_superuser(
-            email="guest@booktime.com", password="abcabcabc"
-        )
-        products = {
-            "A": factories.ProductFactory(name="A", active=True),
-            "B": factories.ProductFactory(name="B", active=True),
-            "C": factories.ProductFactory(name="C", active=True),
-        }
-        orders = factories.OrderFactory.create_batch(3)
-
-        # only for shortening the line XD
-        fac_ordline = factories.OrderLineFactory
-        fac_ordline.create_batch(2, order=orders[0], product=products["A"])
-        fac_ordline.create_batch(2, order=orders[0], product=products["B"])
-        fac_ordline.create_batch(2, order=orders[1], product=products["A"])
-        fac_ordline.create_batch(2, order=orders[1], product=products["C"])
-        fac_ordline.create_batch(2, order=orders[2], product=products["A"])
-        fac_ordline.create_batch(1, order=orders[2], product=products["B"])
-
-        self.client.force_login(user=user)
-
-        response = self.client.post(
-            path=reverse(viewname="admin:most_bought_products"),
-            data={"period": "90"},
-        )
-        self.assertEqual(response.status_code, 200)
-
-        data = dict(
-            zip(response.context["labels"], response.context["values"])
-        )
-        self.assertEqual(data, {"B": 3, "C": 2, "A": 6})
-
     def test_invoice_renders_exactly_as_expected(self):
         """
         About the HTML version of the invoice:
           the rows and columns aren't always aligned, but the PDF ver. is fine.
           According to the examples provided, the "mis-alignment" is okay :)
         """
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_root_override = override_settings(MEDIA_ROOT=media_root)
+        media_root_override.enable()
+        self.addCleanup(media_root_override.disable)
 
         user = models.User.objects.create_superuser(
             email="guest@booktime.com", password="abcabcabc"
@@ -111,3 +88,120 @@ class TestAdminViews(TestCase):
             expected_content = f.read()
 
         self.assertNotEqual(content, expected_content)
+
+    def test_basket_changelist_queries_do_not_grow_with_rows(self):
+        user = models.User.objects.create_superuser(
+            email="guest@booktime.com", password="abcabcabc"
+        )
+        product = factories.ProductFactory()
+        self.client.force_login(user=user)
+
+        def changelist_queries():
+            basket = models.Basket.objects.create()
+            models.BasketLine.objects.create(basket=basket, product=product)
+
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(
+                    path=reverse(viewname="admin:main_basket_changelist")
+                )
+
+            self.assertEqual(response.status_code, 200)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(changelist_queries(), changelist_queries())
+
+
+class TestReportViews(TransactionTestCase):
+    """
+    The daily stats and sales are updated on commit (hence no `TestCase`).
+    """
+
+    def test_most_bought_products(self):
+        user = models.User.objects.create_superuser(
+            email="guest@booktime.com", password="abcabcabc"
+        )
+        products = {
+            "A": factories.ProductFactory(name="A", active=True),
+            "B": factories.ProductFactory(name="B", active=True),
+            "C": factories.ProductFactory(name="C", active=True),
+        }
+        orders = factories.OrderFactory.create_batch(3)
+
+        # only for shortening the line XD
+        fac_ordline = factories.OrderLineFactory
+        fac_ordline.create_batch(2, order=orders[0], product=products["A"])
+        fac_ordline.create_batch(2, order=orders[0], product=products["B"])
+        fac_ordline.create_batch(2, order=orders[1], product=products["A"])
+        fac_ordline.create_batch(2, order=orders[1], product=products["C"])
+        fac_ordline.create_batch(2, order=orders[2], product=products["A"])
+        fac_ordline.create_batch(1, order=orders[2], product=products["B"])
+
+        self.client.force_login(user=user)
+
+        response = self.client.post(
+            path=reverse(viewname="admin:most_bought_products"),
+            data={"period": "90"},
+        )
+        self.assertEqual(response.status_code, 200)
+
+        data = dict(
+            zip(response.context["labels"], response.context["values"])
+        )
+        self.assertEqual(data, {"B": 3, "C": 2, "A": 6})
+
+    def test_most_bought_products_over_a_year(self):
+        user = models.User.objects.create_superuser(
+            email="guest@booktime.com", password="abcabcabc"
+        )
+        product = factories.ProductFactory(name="Old", active=True)
+        now = timezone.now()
+
+        with patch("django.utils.timezone.now") as mock_now:
+            mock_now.return_value = now - timedelta(days=200)
+            order = factories.OrderFactory()
+        factories.OrderLineFactory(order=order, product=product, quantity=4)
+
+        self.client.force_login(user=user)
+
+        for period, expected in [("90", {}), ("365", {"Old": 4})]:
+            response = self.client.post(
+                path=reverse(viewname="admin:most_bought_products"),
+                data={"period": period},
+            )
+            data = dict(
+                zip(response.context["labels"], response.context["values"])
+            )
+            self.assertEqual(data, expected)
+
+    def test_orders_per_day_reads_the_daily_stats_in_order(self):
+        user = models.User.objects.create_superuser(
+            email="guest@booktime.com", password="abcabcabc"
+        )
+        product = factories.ProductFactory(price=Decimal("5.00"))
+        now = timezone.now()
+
+        for day, country in [(3, "UK"), (1, "UK"), (3, "FR"), (2, "UK")]:
+            with patch("django.utils.timezone.now") as mock_now:
+                mock_now.return_value = now - timedelta(days=day)
+                order = factories.OrderFactory(shipping_country=country)
+            factories.OrderLineFactory(order=order, product=product)
+
+        self.assertEqual(models.OrderDailyStats.objects.count(), 4)
+        self.client.force_login(user=user)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(
+                path=reverse(viewname="admin:orders_per_day")
+            )
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(response.context["values"], [2, 1, 1])
+        self.assertEqual(
+            response.context["labels"], sorted(response.context["labels"])
+        )
+        self.assertFalse(
+            any(
+                '"main_order"' in query["sql"]
+                for query in ctx.captured_queries
+            )
+        )
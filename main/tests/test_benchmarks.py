@@ -0,0 +1,209 @@
+from datetime import date, datetime, time, timedelta
+
+from django.contrib.auth.models import Group
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from main import factories
+from main import models
+from main.benchmarks import chat
+from main.benchmarks import dataset
+from main.benchmarks import stats
+from main.benchmarks import storefront
+
+
+class TestStats(TransactionTestCase):
+    def test_percentiles(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(stats.percentile(values, 50), 50)
+        self.assertEqual(stats.percentile(values, 99), 99)
+        self.assertEqual(stats.percentile([3], 90), 3)
+        self.assertEqual(stats.summarize([])["count"], 0)
+
+    def test_query_counter_counts_every_query(self):
+        with stats.QueryCounter() as counter:
+            factories.ProductFactory()
+            list(models.Product.objects.all())
+
+        self.assertEqual(counter.count, 2)
+
+        # Back to normal afterwards
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        self.assertEqual(counter.count, 2)
+
+    def test_compare_with_a_baseline(self):
+        baseline = {
+            "connections": 10,
+            "connect_seconds": {"count": 10, "p50": 0.1, "p90": 0.2},
+            "queries_per_connect": 3,
+            "memory_per_connection": 1000,
+        }
+        metrics = {
+            "connections": 20,
+            "connect_seconds": {"count": 20, "p50": 0.11, "p90": 0.9},
+            "queries_per_connect": 4,
+            "memory_per_connection": 1500,
+            "new_seconds": {"count": 1, "p50": 1},
+        }
+
+        self.assertEqual(
+            stats.compare(metrics, baseline, tolerance=0.2),
+            [
+                ("queries_per_connect", 3, 4),
+                ("memory_per_connection", 1000, 1500),
+            ],
+        )
+        self.assertEqual(stats.compare(baseline, baseline), [])
+
+
+class TestDataset(TestCase):
+    SIZES = dict(tags=5, products=50, users=20, orders=200, baskets=10)
+    END = date(2020, 3, 1)
+
+    def generate(self, seed=1):
+        return dataset.generate(seed=seed, end=self.END, days=30, **self.SIZES)
+
+    def snapshot(self):
+        return (
+            list(
+                models.Product.objects.values_list("name", "price", "active")
+            ),
+            list(
+                models.Order.objects.values_list(
+                    "user_id", "status", "date_added", "shipping_city"
+                )
+            ),
+            list(
+                models.OrderLine.objects.values_list(
+                    "order_id", "product_id", "quantity", "status"
+                )
+            ),
+            list(
+                models.BasketLine.objects.values_list(
+                    "basket_id", "product_id"
+                )
+            ),
+        )
+
+    def test_generated_rows_are_consistent(self):
+        counts = self.generate()
+
+        self.assertEqual(counts["product"], 50)
+        self.assertEqual(counts["order"], 200)
+        self.assertEqual(counts["orderline"], models.OrderLine.objects.count())
+        self.assertFalse(models.Order.objects.filter(lines=None).exists())
+
+        for line in models.OrderLine.objects.select_related("product")[:20]:
+            self.assertEqual(line.price, line.product.price)
+
+        first_day = timezone.make_aware(
+            datetime.combine(self.END - timedelta(days=30), time())
+        )
+        self.assertFalse(
+            models.Order.objects.filter(date_added__lt=first_day).exists()
+        )
+        self.assertFalse(
+            models.Order.objects.filter(
+                date_added__lt=first_day + timedelta(days=15)
+            )
+            .exclude(status=models.Order.DONE)
+            .exists()
+        )
+
+        for basket in models.Basket.objects.all():
+            summary = models.Basket.objects.refresh_summary(basket.id)
+            self.assertEqual(basket.item_count, summary["item_count"])
+            self.assertEqual(basket.total, summary["total"])
+
+        self.assertEqual(
+            models.OrderDailyStats.objects.aggregate(orders=Sum("orders")),
+            {"orders": 200},
+        )
+
+    def delete_all(self):
+        for model in (
+            models.Order,
+            models.Basket,
+            models.Product,
+            models.ProductTag,
+            models.User,
+        ):
+            model.objects.all().delete()
+
+    def test_same_seed_same_data(self):
+        self.generate()
+        snapshot = self.snapshot()
+
+        self.delete_all()
+        self.generate()
+        self.assertEqual(self.snapshot(), snapshot)
+
+        self.delete_all()
+        self.generate(seed=2)
+        self.assertNotEqual(self.snapshot(), snapshot)
+
+
+@override_settings(
+    CHANNEL_LAYERS={
+        "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}
+    },
+    PRESENCE_BACKEND="main.presence.InMemoryPresence",
+)
+class TestChatBenchmark(TransactionTestCase):
+    def test_small_run(self):
+        Group.objects.create(name="Employees")
+
+        results = chat.run(rooms=3, clients=2, messages=2, timeout=5)
+
+        self.assertEqual(results["connections"], 6)
+        self.assertEqual(results["connect_seconds"]["count"], 6)
+        self.assertEqual(results["fan_out_seconds"]["count"], 12)
+        self.assertGreater(results["queries_per_connect"], 0)
+        self.assertGreater(results["memory_per_connection"], 0)
+        self.assertEqual(models.ChatMessage.objects.count(), 6)
+
+
+class TestStorefrontBenchmark(TransactionTestCase):
+    def test_small_run(self):
+        results = storefront.run(visits=2, products=20)
+
+        for transport in ("client", "wsgi"):
+            for page in ("products", "product", "add_to_basket", "basket"):
+                prefix = f"{transport}.{page}"
+                self.assertEqual(results[f"{prefix}.seconds"]["count"], 2)
+                self.assertGreater(results[f"{prefix}.queries"], 0)
+                self.assertGreater(results[f"{prefix}.memory_peak"], 0)
+
+        # The WSGI requests were logged in: the customer got their basket
+        self.assertTrue(
+            models.BasketLine.objects.filter(
+                basket__user__email=storefront.CUSTOMER_EMAIL
+            ).exists()
+        )
+
+    def test_journeys_visit_every_product_before_repeating(self):
+        products = factories.ProductFactory.create_batch(3, active=True)
+        products[0].tags.create(name="Tag", slug="tag")
+
+        visited = [
+            dict(visit)["product"]
+            for visit in storefront.journeys(count=6, seed=0)
+        ]
+
+        self.assertEqual(len(set(visited[:3])), 3)
+        self.assertEqual(set(visited[3:]), set(visited[:3]))
+
+    def test_full_basket_lines_are_expected(self):
+        class FullBasket:
+            name = "full"
+
+            def get(self, path):
+                return 400
+
+        storefront.request(FullBasket(), "add_to_basket", "/add/")
+        with self.assertRaises(RuntimeError):
+            storefront.request(FullBasket(), "basket", "/basket/")
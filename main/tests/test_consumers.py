@@ -0,0 +1,211 @@
+import asyncio
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, Group
+from django.test import TransactionTestCase, override_settings
+
+from booktime.routing import application
+from main import chat
+from main import consumers
+from main import factories
+from main import models
+from main import presence
+
+
+@override_settings(
+    CHANNEL_LAYERS={
+        "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}
+    },
+    PRESENCE_BACKEND="main.presence.InMemoryPresence",
+)
+class TestChatConsumer(TransactionTestCase):
+    """
+    The consumer reaches the database from other threads, the data has to
+    be committed for it (hence no `TestCase`).
+    """
+
+    def setUp(self):
+        consumers.ChatConsumer.acl_cache.clear()
+        buffer_patcher = patch.object(
+            chat, "message_buffer", chat.MessageBuffer()
+        )
+        buffer_patcher.start()
+        self.addCleanup(buffer_patcher.stop)
+        presence.get_presence.cache_clear()
+        self.addCleanup(presence.get_presence.cache_clear)
+
+        self.owner = factories.UserFactory(email="owner@booktime.com")
+        self.order = factories.OrderFactory(user=self.owner)
+
+    def communicator(self, user, order_id=None):
+        order_id = order_id or self.order.id
+        communicator = WebsocketCommunicator(
+            consumers.ChatConsumer, f"/ws/customer-service/{order_id}/"
+        )
+        communicator.scope["user"] = user
+        communicator.scope["url_route"] = {"kwargs": {"order_id": order_id}}
+
+        return communicator
+
+    def connects(self, user, order_id=None):
+        async def connect():
+            communicator = self.communicator(user, order_id)
+            connected, _ = await communicator.connect()
+
+            if connected:
+                await communicator.disconnect()
+
+            await asyncio.gather(*consumers.ChatConsumer.background_tasks)
+            return connected
+
+        return async_to_sync(connect)()
+
+    def test_owner_is_authorized_once_per_reconnect_storm(self):
+        with patch.object(
+            consumers.ChatConsumer,
+            "get_user_type",
+            autospec=True,
+            side_effect=consumers.ChatConsumer.get_user_type,
+        ) as mock_get_user_type:
+            for _ in range(3):
+                self.assertTrue(self.connects(self.owner))
+
+        self.assertEqual(mock_get_user_type.call_count, 1)
+
+    def test_strangers_and_anonymous_users_are_refused(self):
+        stranger = models.User.objects.create_user(
+            email="stranger@booktime.com", password="abcabcabc"
+        )
+
+        self.assertFalse(self.connects(stranger))
+        self.assertFalse(self.connects(AnonymousUser()))
+        self.assertFalse(self.connects(self.owner, order_id=self.order.id + 1))
+
+    def test_employee_becomes_last_spoken_to(self):
+        employee = factories.UserFactory(
+            email="employee@booktime.com", is_staff=True
+        )
+        employee.groups.add(Group.objects.create(name="Employees"))
+
+        self.assertTrue(self.connects(employee))
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.last_spoken_to, employee)
+
+    def test_employees_taking_turns_become_last_spoken_to(self):
+        group = Group.objects.create(name="Employees")
+        first, second = [
+            factories.UserFactory(email=email, is_staff=True)
+            for email in ("first@booktime.com", "second@booktime.com")
+        ]
+        for employee in (first, second):
+            employee.groups.add(group)
+
+        # The third connection is authorized from the cache
+        for employee in (first, second, first):
+            self.assertTrue(self.connects(employee))
+
+            self.order.refresh_from_db()
+            self.assertEqual(self.order.last_spoken_to, employee)
+
+    async def receive_until(self, communicator, event_type):
+        while True:
+            event = await communicator.receive_json_from()
+            if event["type"] == event_type:
+                return event
+
+    def test_messages_are_stored_and_sent_on_connect(self):
+        async def chat_and_reconnect():
+            communicator = self.communicator(self.owner)
+            await communicator.connect()
+
+            history = await self.receive_until(communicator, "chat_history")
+            self.assertEqual(history["messages"], [])
+
+            for message in ["Hello", "Anyone?"]:
+                await communicator.send_json_to(
+                    {"type": "message", "message": message}
+                )
+                await self.receive_until(communicator, "chat_message")
+
+            # Not written yet, but part of the history already
+            self.assertEqual(await count_messages(), 0)
+            again = self.communicator(self.owner)
+            await again.connect()
+            history = await self.receive_until(again, "chat_history")
+            await again.disconnect()
+
+            await chat.message_buffer.flush()
+            await communicator.disconnect()
+
+            return history
+
+        count_messages = database_sync_to_async(
+            models.ChatMessage.objects.count
+        )
+
+        history = async_to_sync(chat_and_reconnect)()
+
+        self.assertEqual(
+            [message["message"] for message in history["messages"]],
+            ["Hello", "Anyone?"],
+        )
+        self.assertEqual(
+            list(
+                models.ChatMessage.objects.order_by("created").values_list(
+                    "order_id", "user_id", "message"
+                )
+            ),
+            [
+                (self.order.id, self.owner.id, "Hello"),
+                (self.order.id, self.owner.id, "Anyone?"),
+            ],
+        )
+
+    @override_settings(CHAT_FLUSH_SIZE=2)
+    def test_buffer_is_flushed_when_full(self):
+        async def send_messages():
+            communicator = self.communicator(self.owner)
+            await communicator.connect()
+
+            for message in ["One", "Two", "Three"]:
+                await communicator.send_json_to(
+                    {"type": "message", "message": message}
+                )
+                await self.receive_until(communicator, "chat_message")
+
+            await communicator.disconnect()
+
+        async_to_sync(send_messages)()
+
+        self.assertEqual(models.ChatMessage.objects.count(), 2)
+        self.assertEqual(len(chat.message_buffer.pending), 1)
+
+    def test_application_authenticates_with_the_session_cookie(self):
+        self.client.force_login(self.owner)
+        cookie = self.client.cookies[settings.SESSION_COOKIE_NAME]
+
+        async def connect(headers):
+            communicator = WebsocketCommunicator(
+                application,
+                f"/ws/customer-service/{self.order.id}/",
+                headers=headers,
+            )
+            connected, _ = await communicator.connect()
+
+            if connected:
+                await communicator.disconnect()
+
+            return connected
+
+        self.assertTrue(
+            async_to_sync(connect)(
+                [(b"cookie", f"{cookie.key}={cookie.value}".encode())]
+            )
+        )
+        self.assertFalse(async_to_sync(connect)([]))
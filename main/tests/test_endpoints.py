@@ -0,0 +1,126 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth.models import Permission
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from main import factories
+from main import models
+
+
+class TestDispatchApi(TestCase):
+    URL = "/api/orderlines/"
+
+    def setUp(self):
+        self.dispatcher = factories.UserFactory(
+            email="dispatcher@booktime.com"
+        )
+        self.client.force_login(self.dispatcher)
+        self.products = factories.ProductFactory.create_batch(2)
+        self.now = timezone.now()
+
+    def create_order(self, lines=2, days_ago=0):
+        date_added = self.now - timedelta(days=days_ago)
+        with patch("django.utils.timezone.now") as mock_now:
+            mock_now.return_value = date_added
+            order = factories.OrderFactory(status=models.Order.PAID)
+
+        for i in range(lines):
+            factories.OrderLineFactory(
+                order=order, product=self.products[i % 2]
+            )
+
+        return order
+
+    def test_queries_do_not_grow_with_lines(self):
+        self.create_order(lines=2)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.URL)
+        queries = len(ctx.captured_queries)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 2)
+
+        self.create_order(lines=10)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.URL)
+
+        self.assertEqual(len(response.json()["results"]), 12)
+        self.assertEqual(len(ctx.captured_queries), queries)
+
+    def test_cursor_walks_newest_orders_first(self):
+        old = self.create_order(lines=3, days_ago=2)
+        new = self.create_order(lines=2, days_ago=1)
+        factories.OrderLineFactory(
+            order=factories.OrderFactory(status=models.Order.NEW),
+            product=self.products[0],
+        )
+
+        seen = []
+        url = f"{self.URL}?page_size=2"
+        while url:
+            page = self.client.get(url).json()
+            self.assertLessEqual(len(page["results"]), 2)
+            seen.extend(line["order"] for line in page["results"])
+            url = page["next"]
+
+        self.assertEqual(seen, [new.id] * 2 + [old.id] * 3)
+
+        # The newest line of the newest order comes first
+        line = self.client.get(self.URL).json()["results"][0]
+        self.assertEqual(line["product_name"], self.products[1].name)
+
+    def test_cursor_keeps_its_place_among_lines_of_an_order(self):
+        order = self.create_order(lines=4)
+        ids = sorted(order.lines.values_list("id", flat=True), reverse=True)
+
+        page = self.client.get(f"{self.URL}?page_size=2").json()
+        seen = [line["id"] for line in page["results"]]
+
+        # A line of the same order (and date) added between two pages
+        factories.OrderLineFactory(order=order, product=self.products[0])
+        page = self.client.get(page["next"]).json()
+        seen.extend(line["id"] for line in page["results"])
+
+        self.assertEqual(seen, ids)
+
+    def test_bulk_status_update(self):
+        order = self.create_order(lines=3)
+        other = self.create_order(lines=2)
+        ids = list(order.lines.values_list("id", flat=True))
+        ids.append(other.lines.first().id)
+        data = {"ids": ids, "status": models.OrderLine.SENT}
+
+        response = self.client.patch(
+            f"{self.URL}status/", data=data, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 403)
+
+        self.dispatcher.user_permissions.add(
+            Permission.objects.get(codename="change_orderline")
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(
+                f"{self.URL}status/",
+                data=data,
+                content_type="application/json",
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"updated": 4})
+        self.assertLess(len(ctx.captured_queries), 10)
+
+        order.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(order.status, models.Order.DONE)
+        self.assertEqual(other.status, models.Order.PAID)
+        self.assertEqual(
+            models.OrderLine.objects.filter(
+                status=models.OrderLine.SENT
+            ).count(),
+            4,
+        )
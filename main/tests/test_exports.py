@@ -0,0 +1,93 @@
+from decimal import Decimal
+from io import StringIO
+import csv
+import json
+
+from django.core.management import call_command
+from django.http import StreamingHttpResponse
+from django.test import TestCase
+from django.urls import reverse
+
+from main import factories
+from main import models
+
+
+class TestExports(TestCase):
+    def setUp(self):
+        self.user = factories.UserFactory(email="user@booktime.com")
+        product = factories.ProductFactory(name="A book")
+
+        self.paid = factories.OrderFactory(
+            user=self.user, status=models.Order.PAID, shipping_country="uk"
+        )
+        self.new = factories.OrderFactory(user=self.user)
+
+        factories.OrderLineFactory(
+            order=self.paid, product=product, quantity=2, price="9.50"
+        )
+        factories.OrderLineFactory(order=self.new, product=product)
+
+    def export(self, dataset, fmt, **filters):
+        response = self.client.get(
+            path=reverse(
+                viewname="main:order_export",
+                kwargs={"dataset": dataset, "fmt": fmt},
+            ),
+            data=filters,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response, StreamingHttpResponse)
+
+        return b"".join(response.streaming_content).decode()
+
+    def test_export_is_only_for_staff(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get(
+            path=reverse(
+                viewname="main:order_export",
+                kwargs={"dataset": "orders", "fmt": "csv"},
+            )
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_orders_csv_with_filters(self):
+        self.client.force_login(
+            factories.UserFactory(email="staff@booktime.com", is_staff=True)
+        )
+
+        content = self.export("orders", "csv", status=models.Order.PAID)
+        rows = list(csv.DictReader(StringIO(content)))
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["id"], str(self.paid.id))
+        self.assertEqual(rows[0]["email"], "user@booktime.com")
+        self.assertEqual(rows[0]["shipping_country"], "uk")
+
+    def test_lines_ndjson(self):
+        self.client.force_login(
+            factories.UserFactory(email="staff@booktime.com", is_staff=True)
+        )
+
+        lines = self.export("lines", "ndjson").splitlines()
+        records = [json.loads(line) for line in lines]
+
+        self.assertEqual(
+            [record["order_id"] for record in records],
+            [self.paid.id, self.new.id],
+        )
+        self.assertEqual(records[0]["product_name"], "A book")
+        self.assertEqual(records[0]["quantity"], 2)
+        self.assertEqual(Decimal(records[0]["price"]), Decimal("9.50"))
+
+    def test_export_orders_command(self):
+        out = StringIO()
+        call_command(
+            "export_orders", "lines", "--status", str(models.Order.NEW),
+            stdout=out,
+        )
+
+        rows = list(csv.DictReader(StringIO(out.getvalue())))
+        self.assertEqual(
+            [row["order_id"] for row in rows], [str(self.new.id)]
+        )
@@ -1,7 +1,9 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.core import mail
 
+from main import factories
 from main import forms
+from main import models
 
 
 class TestForm(TestCase):
@@ -49,3 +51,23 @@ class TestForm(TestCase):
             mail.outbox[0].subject, self.TEST_SUBJECT_REGISTRATION
         )
         self.assertGreaterEqual(len(m.output), 1)
+
+    @override_settings(MAX_BASKET_QUANTITY=5)
+    def test_basket_line_quantity_is_capped(self):
+        basket = models.Basket.objects.create()
+        line = models.BasketLine.objects.create(
+            basket=basket, product=factories.ProductFactory()
+        )
+
+        for quantity, valid in ((5, True), (6, False)):
+            formset = forms.BasketLineFormSet(
+                data={
+                    "basketline_set-TOTAL_FORMS": 1,
+                    "basketline_set-INITIAL_FORMS": 1,
+                    "basketline_set-0-id": line.id,
+                    "basketline_set-0-basket": basket.id,
+                    "basketline_set-0-quantity": quantity,
+                },
+                instance=basket,
+            )
+            self.assertEqual(formset.is_valid(), valid)
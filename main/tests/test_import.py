@@ -1,11 +1,14 @@
+import csv
 from io import StringIO
 from os import path
+import shutil
 import tempfile
 
 from django.core.management import call_command
 from django.test import TestCase, override_settings
 
 from main import models
+from main import renditions
 
 
 class TestImport(TestCase):
@@ -33,3 +36,143 @@ class TestImport(TestCase):
         self.assertEqual(models.Product.objects.count(), 3)
         self.assertEqual(models.ProductTag.objects.count(), 6)
         self.assertEqual(models.ProductImage.objects.count(), 3)
+
+    def test_import_data_bulk_and_resume(self):
+        out = StringIO()
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        csv_file = path.join(tempdir, "product-sample.csv")
+        shutil.copy("main/fixtures/product-sample.csv", csv_file)
+        image_files = "main/fixtures/product-sampleimages/"
+
+        # Pretend an earlier run has already committed the first two rows
+        with open(file=f"{csv_file}.progress", mode="w") as f:
+            f.write("2")
+
+        with self.settings(MEDIA_ROOT=media_root):
+            call_command(
+                "import_data",
+                csv_file,
+                image_files,
+                "--bulk",
+                "--resume",
+                "--workers=1",
+                stdout=out,
+            )
+
+            self.assertIn("Resuming after row 2", out.getvalue())
+            self.assertIn("Imported 3 rows", out.getvalue())
+            self.assertIn("rows/sec", out.getvalue())
+            self.assertEqual(models.Product.objects.count(), 1)
+            self.assertFalse(path.exists(f"{csv_file}.progress"))
+
+            call_command(
+                "import_data",
+                csv_file,
+                image_files,
+                "--bulk",
+                "--chunk-size=2",
+                "--workers=0",
+                stdout=out,
+            )
+
+        self.assertEqual(models.Product.objects.count(), 3)
+        self.assertEqual(models.ProductTag.objects.count(), 6)
+        self.assertEqual(models.ProductImage.objects.count(), 3)
+        self.assertEqual(
+            models.Product.objects.get(slug="siddhartha").tags.count(), 2
+        )
+
+        for image in models.ProductImage.objects.all():
+            self.assertEqual(
+                image.thumbnail.name,
+                renditions.rendition_path(image.digest, "thumbnail"),
+            )
+
+    def write_csv(self, rows):
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+
+        csv_file = path.join(tempdir, "products.csv")
+        with open(csv_file, mode="w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(
+                ["name", "description", "tags", "image_filename", "price"]
+            )
+            writer.writerows(rows)
+
+        return csv_file
+
+    def test_import_data_matches_products_and_tags_by_slug(self):
+        csv_file = self.write_csv(
+            [
+                [
+                    "Siddhartha",
+                    "A novel",
+                    "Sci-Fi|Religion",
+                    "siddhartha.jpg",
+                    "6.00",
+                ],
+                ["Siddhartha", "A novel", "sci fi", "siddhartha.jpg", "7.00"],
+            ]
+        )
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        out = StringIO()
+
+        with self.settings(MEDIA_ROOT=media_root):
+            call_command(
+                "import_data",
+                csv_file,
+                "main/fixtures/product-sampleimages/",
+                stdout=out,
+            )
+
+        self.assertIn("Products processed=2 (created=1)", out.getvalue())
+        self.assertIn("Tags processed=3 (created=2)", out.getvalue())
+        product = models.Product.objects.get()
+        self.assertEqual(str(product.price), "7.00")
+        self.assertEqual(
+            sorted(product.tags.values_list("slug", flat=True)),
+            ["religion", "sci-fi"],
+        )
+
+    def test_import_data_bulk_tags_sharing_a_slug(self):
+        models.ProductTag.objects.create(name="Religion", slug="religion")
+        csv_file = self.write_csv(
+            [
+                [
+                    "Siddhartha",
+                    "A novel",
+                    "Sci-Fi|RELIGION",
+                    "siddhartha.jpg",
+                    "6.00",
+                ],
+                ["Dune", "A novel", "sci fi", "siddhartha.jpg", "7.00"],
+            ]
+        )
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        out = StringIO()
+
+        with self.settings(MEDIA_ROOT=media_root):
+            call_command(
+                "import_data",
+                csv_file,
+                "main/fixtures/product-sampleimages/",
+                "--bulk",
+                "--workers=0",
+                stdout=out,
+            )
+
+        self.assertIn("Tags processed=3 (created=1)", out.getvalue())
+        self.assertEqual(models.ProductTag.objects.count(), 2)
+        self.assertEqual(
+            models.ProductTag.objects.get(slug="sci-fi").product_set.count(),
+            2,
+        )
+        self.assertEqual(
+            models.Product.objects.get(slug="siddhartha").tags.count(), 2
+        )
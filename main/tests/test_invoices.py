@@ -0,0 +1,100 @@
+from io import StringIO
+from unittest.mock import patch
+import shutil
+import tempfile
+
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from main import factories
+from main import invoices
+from main import models
+
+
+class TestInvoices(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_root_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_root_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_root_override.disable()
+        shutil.rmtree(cls.media_root)
+
+    def setUp(self):
+        invoices.pdf_cache.clear()
+
+        self.order = factories.OrderFactory()
+        for product in factories.ProductFactory.create_batch(3):
+            factories.OrderLineFactory(order=self.order, product=product)
+
+        self.client.force_login(
+            models.User.objects.create_superuser(
+                email="admin@booktime.com", password="abcabcabc"
+            )
+        )
+
+    def get_invoice(self, **params):
+        return self.client.get(
+            path=reverse(
+                viewname="admin:invoice", kwargs={"order_id": self.order.id}
+            ),
+            data=params,
+        )
+
+    def test_pdf_is_rendered_once_per_version_of_the_order(self):
+        with patch.object(
+            invoices, "render_pdf", wraps=invoices.render_pdf
+        ) as mock_render:
+            first = self.get_invoice(format="pdf").content
+            second = self.get_invoice(format="pdf").content
+
+            self.assertEqual(first, second)
+            self.assertEqual(mock_render.call_count, 1)
+            self.assertTrue(
+                default_storage.exists(invoices.invoice_path(self.order))
+            )
+
+            # From the storage when the process doesn't have it (yet)
+            invoices.pdf_cache.clear()
+            self.get_invoice(format="pdf")
+            self.assertEqual(mock_render.call_count, 1)
+
+            self.order.billing_name = "Someone else"
+            self.order.save()
+            self.get_invoice(format="pdf")
+            self.assertEqual(mock_render.call_count, 2)
+
+    def test_invoice_queries_do_not_grow_with_lines(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.get_invoice()
+        queries = len(ctx.captured_queries)
+
+        factories.OrderLineFactory.create_batch(
+            3, order=self.order, product=factories.ProductFactory()
+        )
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.get_invoice()
+        self.assertEqual(len(ctx.captured_queries), queries)
+
+    def test_render_invoices_skips_the_stored_ones(self):
+        out = StringIO()
+        call_command("render_invoices", "--workers", "0", stdout=out)
+        call_command("render_invoices", "--workers", "0", stdout=out)
+
+        self.assertEqual(
+            out.getvalue().splitlines(),
+            [
+                "Invoices processed=1 (rendered=1)",
+                "Invoices processed=1 (rendered=0)",
+            ],
+        )
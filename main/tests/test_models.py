@@ -1,5 +1,17 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
 
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from main import exceptions
 from main import models
 from main import factories
 
@@ -40,3 +52,505 @@ class TestModel(TestCase):
         lines = order.lines.all()
         self.assertEquals(lines[0].product, prod1)
         self.assertEquals(lines[1].product, prod2)
+
+    def test_create_order_cost_stays_flat_as_quantity_grows(self):
+        """
+        A cheap benchmark: the amount of queries used by the checkout should
+        be the same no matter how many copies are in the basket.
+        """
+        user1 = factories.UserFactory()
+        address = factories.AddressFactory(user=user1)
+
+        def checkout_queries(quantity):
+            basket = models.Basket.objects.create(user=user1)
+            models.BasketLine.objects.create(
+                basket=basket,
+                product=factories.ProductFactory(),
+                quantity=quantity,
+            )
+
+            with CaptureQueriesContext(connection) as ctx:
+                order = basket.create_order(
+                    billing_address=address, shipping_address=address
+                )
+
+            self.assertEquals(order.lines.get().quantity, quantity)
+            return len(ctx.captured_queries)
+
+        self.assertEquals(checkout_queries(1), checkout_queries(40))
+
+    def test_create_order_refuses_double_submit(self):
+        user1 = factories.UserFactory()
+        address = factories.AddressFactory(user=user1)
+
+        basket = models.Basket.objects.create(user=user1)
+        models.BasketLine.objects.create(
+            basket=basket, product=factories.ProductFactory(), quantity=2
+        )
+        basket.create_order(billing_address=address, shipping_address=address)
+
+        # A second request still holding the stale (open) basket object
+        stale_basket = models.Basket.objects.get(pk=basket.pk)
+        stale_basket.status = models.Basket.OPEN
+
+        with self.assertRaises(exceptions.BasketException):
+            stale_basket.create_order(
+                billing_address=address, shipping_address=address
+            )
+
+        self.assertEquals(models.Order.objects.count(), 1)
+        self.assertEquals(models.OrderLine.objects.get().quantity, 2)
+
+    def test_create_order_keeps_one_line_per_product(self):
+        prod1 = factories.ProductFactory(price=Decimal("10.00"))
+        user1 = factories.UserFactory()
+        address = factories.AddressFactory(user=user1)
+
+        basket = models.Basket.objects.create(user=user1)
+        models.BasketLine.objects.create(
+            basket=basket, product=prod1, quantity=40
+        )
+        order = basket.create_order(
+            billing_address=address, shipping_address=address
+        )
+
+        # Changing the price afterwards won't affect the order
+        prod1.price = Decimal("99.00")
+        prod1.save()
+
+        line = order.lines.get()
+        self.assertEquals(line.quantity, 40)
+        self.assertEquals(line.price, Decimal("10.00"))
+        self.assertEquals(line.total, Decimal("400.00"))
+
+    def test_basket_summary_is_maintained(self):
+        prod1 = factories.ProductFactory(price=Decimal("10.00"))
+        prod2 = factories.ProductFactory(price=Decimal("2.50"))
+
+        basket = models.Basket.objects.create()
+        self.assertTrue(basket.is_empty())
+
+        line = models.BasketLine.objects.create(
+            basket=basket, product=prod1, quantity=2
+        )
+        models.BasketLine.objects.create(basket=basket, product=prod2)
+
+        basket.refresh_from_db()
+        self.assertFalse(basket.is_empty())
+        self.assertEquals(basket.count(), 3)
+        self.assertEquals(basket.line_count, 2)
+        self.assertEquals(basket.total, Decimal("22.50"))
+
+        line.delete()
+
+        basket.refresh_from_db()
+        self.assertEquals(basket.count(), 1)
+        self.assertEquals(basket.line_count, 1)
+        self.assertEquals(basket.total, Decimal("2.50"))
+
+    def test_basket_saves_leave_the_summary_alone(self):
+        product = factories.ProductFactory(price=Decimal("10.00"))
+        user = factories.UserFactory()
+        address = factories.AddressFactory(user=user)
+
+        basket = models.Basket.objects.create(user=user)
+        stale_basket = models.Basket.objects.get(pk=basket.pk)
+        basket.add_product(product, quantity=2)
+
+        # e.g. the status edited in the admin with an old copy
+        stale_basket.save()
+        basket.refresh_from_db()
+        self.assertEquals(basket.count(), 2)
+        self.assertEquals(basket.total, Decimal("20.00"))
+
+        stale_basket.create_order(
+            billing_address=address, shipping_address=address
+        )
+        basket.refresh_from_db()
+        self.assertEquals(basket.status, models.Basket.SUBMITTED)
+        self.assertEquals(basket.count(), 2)
+
+    def test_basket_totals_follow_the_prices(self):
+        product = factories.ProductFactory(price=Decimal("10.00"))
+        other = factories.ProductFactory(price=Decimal("1.00"))
+        baskets = [models.Basket.objects.create() for _ in range(2)]
+        submitted = models.Basket.objects.create(
+            status=models.Basket.SUBMITTED
+        )
+        for basket in [*baskets, submitted]:
+            basket.add_product(product, quantity=2)
+        baskets[0].add_product(other)
+
+        product = models.Product.objects.get(pk=product.pk)
+        product.price = Decimal("12.00")
+        product.save()
+
+        totals = models.Basket.objects.order_by("id").values_list(
+            "total", flat=True
+        )
+        self.assertEquals(
+            list(totals),
+            [Decimal("25.00"), Decimal("24.00"), Decimal("20.00")],
+        )
+
+        # Other changes to the product don't touch the baskets
+        with CaptureQueriesContext(connection) as ctx:
+            product.name = "Renamed"
+            product.save()
+        self.assertFalse(
+            any("main_basket" in q["sql"] for q in ctx.captured_queries)
+        )
+
+    def fill_basket(self, basket, products, quantity=1):
+        models.BasketLine.objects.bulk_create(
+            [
+                models.BasketLine(
+                    basket=basket, product=product, quantity=quantity
+                )
+                for product in products
+            ]
+        )
+        models.Basket.objects.refresh_summary(basket.id)
+
+    def test_basket_merge_combines_products(self):
+        user = factories.UserFactory()
+        prod1, prod2, prod3 = factories.ProductFactory.create_batch(
+            3, price=Decimal("10.00")
+        )
+        older = models.Basket.objects.create(user=user)
+        newest = models.Basket.objects.create(user=user)
+        anonymous = models.Basket.objects.create()
+        self.fill_basket(older, [prod1])
+        self.fill_basket(newest, [prod1, prod2], quantity=2)
+        self.fill_basket(anonymous, [prod2, prod3])
+
+        basket = models.Basket.objects.merge(anonymous, user)
+
+        self.assertEqual(basket, newest)
+        self.assertEqual(
+            list(models.Basket.objects.values_list("id", flat=True)),
+            [newest.id],
+        )
+        self.assertEqual(
+            sorted(
+                basket.basketline_set.values_list("product_id", "quantity")
+            ),
+            [(prod1.id, 3), (prod2.id, 3), (prod3.id, 1)],
+        )
+        self.assertEqual(basket.count(), 7)
+        self.assertEqual(basket.line_count, 3)
+        self.assertEqual(basket.total, Decimal("70.00"))
+
+    @override_settings(MAX_BASKET_QUANTITY=5)
+    def test_basket_merge_caps_the_quantities(self):
+        user = factories.UserFactory()
+        prod1, prod2 = factories.ProductFactory.create_batch(
+            2, price=Decimal("10.00")
+        )
+        newest = models.Basket.objects.create(user=user)
+        anonymous = models.Basket.objects.create()
+        self.fill_basket(newest, [prod1, prod2], quantity=4)
+        self.fill_basket(anonymous, [prod1], quantity=3)
+
+        basket = models.Basket.objects.merge(anonymous, user)
+
+        self.assertEqual(
+            sorted(
+                basket.basketline_set.values_list("product_id", "quantity")
+            ),
+            [(prod1.id, 5), (prod2.id, 4)],
+        )
+        self.assertEqual(basket.count(), 9)
+        self.assertEqual(basket.total, Decimal("90.00"))
+
+    def test_basket_merge_assigns_anonymous_basket(self):
+        user = factories.UserFactory()
+        anonymous = models.Basket.objects.create()
+        models.Basket.objects.create(user=user, status=models.Basket.SUBMITTED)
+
+        basket = models.Basket.objects.merge(anonymous, user)
+
+        self.assertEqual(basket, anonymous)
+        anonymous.refresh_from_db()
+        self.assertEqual(anonymous.user, user)
+
+    def test_basket_merge_cost_stays_flat_as_lines_grow(self):
+        user = factories.UserFactory()
+        products = factories.ProductFactory.create_batch(20)
+
+        def merge_queries(count):
+            models.Basket.objects.all().delete()
+            self.fill_basket(
+                models.Basket.objects.create(user=user), products[:count]
+            )
+            anonymous = models.Basket.objects.create()
+            self.fill_basket(anonymous, products[:count])
+
+            with CaptureQueriesContext(connection) as ctx:
+                models.Basket.objects.merge(anonymous, user)
+
+            return len(ctx.captured_queries)
+
+        self.assertEqual(merge_queries(20), merge_queries(2))
+
+    def test_tag_slug_cache_is_bounded(self):
+        manager = models.ProductTag.objects
+        manager.slug_cache.clear()
+        for slug in ["a", "b", "c"]:
+            models.ProductTag.objects.create(name=slug, slug=slug)
+
+        with patch.object(manager, "SLUG_CACHE_SIZE", 2):
+            for slug in ["a", "b", "a", "c"]:
+                manager.get_by_slug_cached(slug)
+            with self.assertRaises(models.ProductTag.DoesNotExist):
+                manager.get_by_slug_cached("nope")
+
+        # The least recently used tag made room, misses aren't kept
+        self.assertEqual(list(manager.slug_cache), ["a", "c"])
+        with self.assertNumQueries(0):
+            self.assertEqual(manager.get_by_slug_cached("a").slug, "a")
+
+    def test_user_roles_are_cached_until_groups_change(self):
+        cache.clear()
+        employees = Group.objects.create(name="Employees")
+        dispatchers = Group.objects.create(name="Dispatchers")
+
+        user1 = factories.UserFactory(is_staff=True)
+        user1.groups.add(employees)
+
+        # A new instance for every request, the groups are loaded only once
+        user1 = models.User.objects.get(pk=user1.pk)
+        with self.assertNumQueries(1):
+            self.assertTrue(user1.is_employee)
+            self.assertFalse(user1.is_dispatcher)
+
+        user1 = models.User.objects.get(pk=user1.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(user1.is_employee)
+
+        dispatchers.user_set.add(user1)
+        user1 = models.User.objects.get(pk=user1.pk)
+        self.assertTrue(user1.is_dispatcher)
+
+        user1.groups.remove(employees)
+        self.assertFalse(user1.is_employee)
+
+        employees.user_set.add(user1)
+        employees.user_set.clear()
+        self.assertFalse(models.User.objects.get(pk=user1.pk).is_employee)
+
+
+class TestDailyStats(TransactionTestCase):
+    """
+    The daily stats and sales are updated on commit (hence no `TestCase`).
+    """
+
+    def test_order_daily_stats_follow_orders(self):
+        user = factories.UserFactory()
+        address = factories.AddressFactory(user=user, country="uk")
+        product = factories.ProductFactory(price=Decimal("4.50"))
+
+        basket = models.Basket.objects.create(user=user)
+        basket.add_product(product, quantity=3)
+        order = basket.create_order(
+            billing_address=address, shipping_address=address
+        )
+
+        stats = models.OrderDailyStats.objects.get()
+        self.assertEqual(stats.day, timezone.localdate(order.date_added))
+        self.assertEqual(stats.country, "uk")
+        self.assertEqual(stats.orders, 1)
+        self.assertEqual(stats.lines, 1)
+        self.assertEqual(stats.revenue, Decimal("13.50"))
+
+        line = order.lines.get()
+        line.quantity = 1
+        line.save()
+
+        stats = models.OrderDailyStats.objects.get()
+        self.assertEqual(stats.revenue, Decimal("4.50"))
+
+        # The rebuild gets the very same numbers
+        models.OrderDailyStats.objects.update(orders=9)
+        call_command("rebuild_order_stats", stdout=StringIO())
+
+        rebuilt = models.OrderDailyStats.objects.get()
+        self.assertEqual(
+            (rebuilt.orders, rebuilt.lines, rebuilt.revenue),
+            (1, 1, Decimal("4.50")),
+        )
+
+        order.delete()
+        stats = models.OrderDailyStats.objects.get()
+        self.assertEqual(
+            (stats.orders, stats.lines, stats.revenue), (0, 0, Decimal("0"))
+        )
+        self.assertEqual(models.ProductDailySales.objects.get().quantity, 0)
+
+    def test_top_products_keeps_same_named_products_apart(self):
+        first = factories.ProductFactory(name="Twin")
+        second = factories.ProductFactory(name="Twin")
+        other = factories.ProductFactory(name="Other")
+        order = factories.OrderFactory()
+
+        factories.OrderLineFactory(order=order, product=first, quantity=2)
+        factories.OrderLineFactory(order=order, product=second, quantity=5)
+        factories.OrderLineFactory(order=order, product=other, quantity=1)
+
+        today = timezone.localdate()
+        with CaptureQueriesContext(connection) as ctx:
+            top = models.ProductDailySales.objects.top_products(
+                start=today, end=today, n=2
+            )
+        self.assertEqual(top, [(second, 5), (first, 2)])
+
+        # The database picks the top ones, not Python
+        self.assertIn("LIMIT 2", ctx.captured_queries[0]["sql"])
+
+        yesterday = today - timedelta(days=1)
+        self.assertEqual(
+            models.ProductDailySales.objects.top_products(
+                start=yesterday, end=yesterday
+            ),
+            [],
+        )
+
+    def test_top_products_of_a_year_read_the_monthly_sales(self):
+        first = factories.ProductFactory()
+        second = factories.ProductFactory()
+        end = timezone.localdate()
+        start = end - timedelta(days=364)
+
+        for days_ago, product, quantity in [
+            (400, first, 50),
+            (364, first, 3),
+            (200, second, 4),
+            (45, first, 2),
+            (0, second, 2),
+        ]:
+            order = factories.OrderFactory()
+            factories.OrderLineFactory(
+                order=order, product=product, quantity=quantity
+            )
+            models.Order.objects.filter(pk=order.pk).update(
+                date_added=timezone.now() - timedelta(days=days_ago)
+            )
+        call_command("rebuild_order_stats", stdout=StringIO())
+
+        with CaptureQueriesContext(connection) as ctx:
+            top = models.ProductDailySales.objects.top_products(
+                start=start, end=end
+            )
+        self.assertEqual(top, [(second, 6), (first, 5)])
+
+        # Whole months from the monthly sales, the ends from the daily ones
+        sql = " ".join(query["sql"] for query in ctx.captured_queries)
+        self.assertIn("main_productmonthlysales", sql)
+        self.assertIn("main_productdailysales", sql)
+
+    def checkout(self, product, quantity=1):
+        user = factories.UserFactory()
+        address = factories.AddressFactory(user=user, country="uk")
+        basket = models.Basket.objects.create(user=user)
+        basket.add_product(product, quantity=quantity)
+
+        return basket.create_order(
+            billing_address=address, shipping_address=address
+        )
+
+    def test_orders_of_the_same_day_add_up_after_the_commit(self):
+        product = factories.ProductFactory(price=Decimal("2.00"))
+
+        self.checkout(product)
+        with transaction.atomic():
+            self.checkout(product, quantity=2)
+            self.checkout(product, quantity=3)
+
+            # Nothing in the checkout transaction
+            stats = models.OrderDailyStats.objects.get()
+            self.assertEqual(stats.orders, 1)
+
+        stats = models.OrderDailyStats.objects.get()
+        self.assertEqual(
+            (stats.orders, stats.lines, stats.revenue),
+            (3, 3, Decimal("12.00")),
+        )
+        sales = models.ProductDailySales.objects.get()
+        self.assertEqual(sales.quantity, 6)
+
+    def test_status_changes_leave_the_rollups_alone(self):
+        product = factories.ProductFactory(price=Decimal("2.00"))
+        order = self.checkout(product, quantity=2)
+        line = order.lines.get()
+
+        with CaptureQueriesContext(connection) as ctx:
+            line.status = models.OrderLine.SENT
+            line.save()
+            order.status = models.Order.PAID
+            order.save()
+
+        self.assertFalse(
+            any("daily" in query["sql"] for query in ctx.captured_queries)
+        )
+
+        line.quantity = 5
+        line.save()
+        self.assertEqual(models.ProductDailySales.objects.get().quantity, 5)
+
+    def rollups(self):
+        stats = models.OrderDailyStats.objects.exclude(orders=0)
+        sales = models.ProductDailySales.objects.exclude(quantity=0)
+
+        return (
+            sorted(stats.values_list("day", "country", "lines", "revenue")),
+            sorted(sales.values_list("day", "product", "quantity")),
+        )
+
+    def test_deltas_add_up_to_a_rebuild(self):
+        cheap = factories.ProductFactory(price=Decimal("2.00"))
+        dear = factories.ProductFactory(price=Decimal("9.00"))
+        first = self.checkout(cheap, quantity=2)
+        second = self.checkout(dear)
+
+        line = first.lines.get()
+        line.quantity = 4
+        line.save()
+        factories.OrderLineFactory(order=second, product=cheap, quantity=3)
+
+        # The order moves to another day and country, its lines along
+        first.date_added -= timedelta(days=2)
+        first.shipping_country = "fr"
+        first.save()
+
+        # A line moves to another order, a deferred one changes
+        line.order = second
+        line.save()
+        deferred = models.OrderLine.objects.defer("quantity").get(
+            order=second, product=dear
+        )
+        deferred.quantity = 7
+        deferred.save()
+
+        for rolled_back in (
+            lambda: self.checkout(dear, quantity=5),
+            lambda: factories.OrderLineFactory(order=second, product=dear),
+        ):
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    rolled_back()
+                    raise RuntimeError
+
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    factories.OrderLineFactory(order=first, product=dear)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            factories.OrderLineFactory(order=first, product=cheap)
+
+        self.checkout(cheap).delete()
+
+        incremental = self.rollups()
+        call_command("rebuild_order_stats", stdout=StringIO())
+        self.assertEqual(incremental, self.rollups())
@@ -0,0 +1,163 @@
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth.models import Group
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from main import factories
+from main import models
+from main import presence
+
+
+class FakeRedis:
+    async def zrangebyscore(self, room, min):
+        return ["owner@booktime.com"]
+
+
+class TestPresence(TestCase):
+    def setUp(self):
+        self.presence = presence.Presence(
+            backend=presence.InMemoryPresence()
+        )
+
+    def test_members_time_out(self):
+        with patch("main.presence.time.time", return_value=1000):
+            async_to_sync(self.presence.heartbeat)("room", "a@booktime.com")
+
+        with patch("main.presence.time.time", return_value=1020):
+            async_to_sync(self.presence.heartbeat)("room", "b@booktime.com")
+            online = async_to_sync(self.presence.online)("room")
+        self.assertEqual(online, ["a@booktime.com", "b@booktime.com"])
+
+        with patch("main.presence.time.time", return_value=1040):
+            online = async_to_sync(self.presence.online)("room")
+        self.assertEqual(online, ["b@booktime.com"])
+
+        async_to_sync(self.presence.leave)("room", "b@booktime.com")
+        self.assertEqual(async_to_sync(self.presence.online)("room"), [])
+
+    def test_heartbeats_are_coalesced(self):
+        heartbeat = async_to_sync(self.presence.heartbeat)
+
+        with patch.object(
+            self.presence.backend,
+            "touch",
+            wraps=self.presence.backend.touch,
+        ) as mock_touch:
+            with patch("main.presence.time.time", return_value=1000):
+                self.assertTrue(heartbeat("room", "a@booktime.com"))
+                self.assertFalse(heartbeat("room", "a@booktime.com"))
+                self.assertTrue(heartbeat("other", "a@booktime.com"))
+
+            with patch("main.presence.time.time", return_value=1010):
+                self.assertTrue(heartbeat("room", "a@booktime.com"))
+
+        self.assertEqual(mock_touch.call_count, 3)
+
+    def test_old_heartbeats_are_forgotten(self):
+        heartbeat = async_to_sync(self.presence.heartbeat)
+
+        with patch("main.presence.time.time", return_value=1000):
+            for order_id in range(100):
+                heartbeat(presence.room_name(order_id), "a@booktime.com")
+
+        # Those sockets dropped, without leaving
+        with patch("main.presence.time.time", return_value=1010):
+            heartbeat("room", "b@booktime.com")
+
+        self.assertEqual(
+            self.presence.last_written, {("room", "b@booktime.com"): 1010}
+        )
+
+    def test_failed_redis_connections_are_retried(self):
+        backend = presence.RedisPresence()
+        attempts = []
+
+        async def create_redis_pool(*args, **kwargs):
+            attempts.append(args)
+            if len(attempts) == 1:
+                raise ConnectionRefusedError
+            return FakeRedis()
+
+        with patch(
+            "main.presence.aioredis.create_redis_pool",
+            side_effect=create_redis_pool,
+        ):
+            with self.assertRaises(ConnectionRefusedError):
+                presence.run_sync(backend.online("room", since=0))
+
+            for _ in range(2):
+                self.assertEqual(
+                    presence.run_sync(backend.online("room", since=0)),
+                    ["owner@booktime.com"],
+                )
+
+        self.assertEqual(len(attempts), 2)
+
+
+class TestPresenceView(TestCase):
+    def setUp(self):
+        presence.get_presence.cache_clear()
+        self.addCleanup(presence.get_presence.cache_clear)
+
+        self.owner = factories.UserFactory(email="owner@booktime.com")
+        self.order = factories.OrderFactory(user=self.owner)
+
+        async_to_sync(presence.get_presence().heartbeat)(
+            presence.room_name(self.order.id), "owner@booktime.com"
+        )
+
+    def get_presence(self):
+        return self.client.get(
+            path=reverse(
+                viewname="main:customer_service_presence",
+                kwargs={"order_id": self.order.id},
+            )
+        )
+
+    def test_owner_and_employees_see_who_is_online(self):
+        employee = factories.UserFactory(
+            email="employee@booktime.com", is_staff=True
+        )
+        employee.groups.add(Group.objects.create(name="Employees"))
+
+        for user in [self.owner, employee]:
+            self.client.force_login(user)
+            response = self.get_presence()
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.json(),
+                {"order": self.order.id, "online": ["owner@booktime.com"]},
+            )
+
+    def test_other_users_are_refused(self):
+        self.client.force_login(
+            models.User.objects.create_user(
+                email="stranger@booktime.com", password="abcabcabc"
+            )
+        )
+
+        self.assertEqual(self.get_presence().status_code, 403)
+
+    @override_settings(PRESENCE_BACKEND="main.presence.RedisPresence")
+    def test_requests_share_one_redis_pool(self):
+        async def create_redis_pool(*args, **kwargs):
+            return FakeRedis()
+
+        presence.get_presence.cache_clear()
+        self.client.force_login(self.owner)
+
+        with patch(
+            "main.presence.aioredis.create_redis_pool",
+            side_effect=create_redis_pool,
+        ) as mock_create:
+            for _ in range(3):
+                response = self.get_presence()
+                self.assertEqual(
+                    response.json()["online"], ["owner@booktime.com"]
+                )
+
+        self.assertEqual(mock_create.call_count, 1)
@@ -0,0 +1,293 @@
+from collections import namedtuple
+from decimal import Decimal
+import shutil
+import tempfile
+
+from django.contrib.auth.models import Group, Permission
+from django.test import TestCase, override_settings
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+
+from main import admin
+from main import factories
+from main import models
+
+from .budgets import BUDGETS, SCALE, QueryBudgetExceeded, query_budget
+
+ADMIN_SITES = (
+    admin.main_admin,
+    admin.central_office_admin,
+    admin.dispatchers_admin,
+)
+
+# The pages Django's admin brings along, nothing of ours is on them
+STOCK_ADMIN_PAGES = (
+    "login",
+    "logout",
+    "password_change",
+    "password_change_done",
+    "jsi18n",
+    "app_list",
+    "autocomplete",
+    "view_on_site",
+    "auth_user_password_change",
+)
+STOCK_MODEL_ADMIN_PAGES = ("delete", "history", "autocomplete")
+
+Page = namedtuple("Page", ["user", "args", "data", "method"])
+Page.__new__.__defaults__ = ((), None, "get")
+
+
+def url_names(patterns, namespace):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from url_names(pattern.url_patterns, namespace)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield f"{namespace}:{pattern.name}"
+
+
+def page_names():
+    """
+    The named pages of the storefront and the admin sites.
+    """
+    main = get_resolver("main.urls").url_patterns
+    names = set(url_names(main, "main"))
+
+    for site in ADMIN_SITES:
+        for name in url_names(site.get_urls(), site.name):
+            page = name.split(":")[1]
+            if page in STOCK_ADMIN_PAGES:
+                continue
+            if page.startswith("main_") and page.endswith(
+                STOCK_MODEL_ADMIN_PAGES
+            ):
+                continue
+            names.add(name)
+
+    return names
+
+
+class TestQueryBudgets(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_root_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_root_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_root_override.disable()
+        shutil.rmtree(cls.media_root)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = factories.UserFactory(email="customer@booktime.com")
+        cls.owner = factories.UserFactory(
+            email="owner@booktime.com", is_staff=True, is_superuser=True
+        )
+        cls.employee = factories.UserFactory(
+            email="employee@booktime.com", is_staff=True
+        )
+        cls.dispatcher = factories.UserFactory(
+            email="dispatcher@booktime.com", is_staff=True
+        )
+        permissions = Permission.objects.filter(content_type__app_label="main")
+        for user, group_name in (
+            (cls.employee, "Employees"),
+            (cls.dispatcher, "Dispatchers"),
+        ):
+            group = Group.objects.create(name=group_name)
+            group.permissions.set(permissions)
+            user.groups.add(group)
+
+        cls.tags = factories.ProductTagFactory.create_batch(SCALE)
+        cls.products = factories.ProductFactory.create_batch(
+            SCALE, price=Decimal("10.00")
+        )
+        cls.product = cls.products[0]
+        for product in cls.products:
+            product.tags.add(*cls.tags)
+        models.ProductImage.objects.bulk_create(
+            [
+                models.ProductImage(
+                    product=cls.product,
+                    image=f"product-images/{i}.jpg",
+                    thumbnail=f"product-thumbnails/{i}.jpg",
+                )
+                for i in range(SCALE)
+            ]
+        )
+
+        cls.addresses = [
+            models.Address.objects.create(
+                user=cls.customer,
+                name=f"Customer {i}",
+                address1="1 Main Street",
+                postal_code="12345",
+                city="London",
+                country="uk",
+            )
+            for i in range(SCALE)
+        ]
+        cls.address = cls.addresses[0]
+
+        cls.basket = factories.BasketFactory(user=cls.customer)
+        for product in cls.products:
+            cls.basket.add_product(product, quantity=2)
+        for product in cls.products:
+            factories.BasketLineFactory(product=product)
+
+        cls.orders = [
+            cls.create_order(lines=SCALE if i == 0 else 2)
+            for i in range(SCALE)
+        ]
+        cls.order = cls.orders[0]
+        cls.order_line = cls.order.lines.first()
+
+        models.ChatMessage.objects.bulk_create(
+            [
+                models.ChatMessage(
+                    order=cls.order, user=cls.customer, message=f"Hello {i}"
+                )
+                for i in range(SCALE)
+            ]
+        )
+
+    @classmethod
+    def create_order(cls, lines):
+        basket = factories.BasketFactory(user=cls.customer)
+        for product in cls.products[:lines]:
+            basket.add_product(product)
+
+        order = basket.create_order(cls.address, cls.address)
+        models.Order.objects.filter(pk=order.pk).update(
+            status=models.Order.PAID
+        )
+
+        return order
+
+    def pages(self):
+        """
+        How each page is requested: by whom, with which arguments and data.
+        """
+        customer, owner = self.customer, self.owner
+        order, product = self.order, self.product
+
+        pages = {
+            "main:index": Page(customer),
+            "main:about_us": Page(customer),
+            "main:contact_us": Page(customer),
+            "main:signup": Page(None),
+            "main:login": Page(None),
+            "main:checkout_done": Page(customer),
+            "main:add_to_basket": Page(
+                customer, data={"product_id": product.id}
+            ),
+            "main:basket": Page(customer),
+            "main:products": Page(customer, ("all",)),
+            "main:product": Page(customer, (product.slug,)),
+            "main:address_list": Page(customer),
+            "main:address_create": Page(customer),
+            "main:address_update": Page(customer, (self.address.id,)),
+            "main:address_delete": Page(customer, (self.address.id,)),
+            "main:address_select": Page(customer),
+            "main:order_dashboard": Page(owner),
+            "main:order_export": Page(owner, ("lines", "csv")),
+            "main:api-root": Page(owner),
+            "main:orderline-list": Page(owner),
+            "main:orderline-detail": Page(owner, (self.order_line.id,)),
+            "main:orderline-bulk-status": Page(
+                owner,
+                data={
+                    "ids": list(order.lines.values_list("id", flat=True)),
+                    "status": models.OrderLine.PROCESSING,
+                },
+                method="patch",
+            ),
+            "main:order-list": Page(owner),
+            "main:order-detail": Page(owner, (order.id,)),
+            "main:customer_service_chat": Page(customer, (order.id,)),
+            "main:customer_service_presence": Page(customer, (order.id,)),
+            "main:customer_service_history": Page(customer, (order.id,)),
+        }
+
+        users = {
+            admin.main_admin: owner,
+            admin.central_office_admin: self.employee,
+            admin.dispatchers_admin: self.dispatcher,
+        }
+        objects = {
+            models.Product: product,
+            models.ProductTag: self.tags[0],
+            models.ProductImage: product.productimage_set.first(),
+            models.User: customer,
+            models.Address: self.address,
+            models.Basket: self.basket,
+            models.Order: order,
+        }
+
+        for site, user in users.items():
+            name = site.name
+            pages[f"{name}:index"] = Page(user)
+            pages[f"{name}:orders_per_day"] = Page(user)
+            pages[f"{name}:most_bought_products"] = Page(user)
+            if isinstance(site, admin.InvoiceMixin):
+                pages[f"{name}:invoice"] = Page(user, (order.id,))
+
+            for model in site._registry:
+                prefix = f"{name}:main_{model._meta.model_name}"
+                pages[f"{prefix}_changelist"] = Page(user)
+                pages[f"{prefix}_add"] = Page(user)
+                pages[f"{prefix}_change"] = Page(user, (objects[model].pk,))
+
+        return pages
+
+    def request(self, name, page):
+        if page.user is None:
+            self.client.logout()
+        else:
+            self.client.force_login(page.user)
+
+        url = reverse(name, args=page.args)
+
+        with query_budget(BUDGETS.get(name, 0), label=name):
+            if page.method == "get":
+                response = self.client.get(url, data=page.data)
+            else:
+                response = getattr(self.client, page.method)(
+                    url, data=page.data, content_type="application/json"
+                )
+
+            if response.streaming:
+                b"".join(response.streaming_content)
+
+        return response
+
+    def test_exceeded_budget_shows_the_queries(self):
+        @query_budget(1, label="Listing")
+        def list_products():
+            list(models.Product.objects.all())
+            list(models.ProductTag.objects.all())
+
+        with self.assertRaisesRegex(
+            QueryBudgetExceeded, r"(?s)Listing ran 2 queries.*main_producttag"
+        ):
+            list_products()
+
+    def test_every_page_has_a_budget(self):
+        self.assertEqual(sorted(page_names() - set(BUDGETS)), [])
+
+    def test_budgets_stay_below_a_query_per_row(self):
+        # Even with their headroom, a query per fixture row blows them
+        self.assertLess(max(BUDGETS.values()), SCALE)
+
+    def test_every_page_is_requested(self):
+        self.assertEqual(sorted(page_names() - set(self.pages())), [])
+
+    def test_pages_stay_within_their_budget(self):
+        for name, page in sorted(self.pages().items()):
+            with self.subTest(page=name):
+                response = self.request(name, page)
+
+                self.assertLess(response.status_code, 400)
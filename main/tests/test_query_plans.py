@@ -0,0 +1,101 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from main import factories
+from main import models
+
+
+class TestQueryPlan(TestCase):
+    """
+    Make sure the hot queries of the site are answered by an index.
+
+    The tables are tiny in the tests, PostgreSQL would happily scan them
+    sequentially, so we turn that option off for the planner first.
+    """
+
+    def setUp(self):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan TO off")
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        plan = queryset.explain()
+
+        if index_name:
+            self.assertIn(index_name, plan)
+        elif connection.vendor == "sqlite":
+            self.assertIn("USING", plan)
+            self.assertIn("INDEX", plan)
+        else:
+            self.assertIn("Index", plan)
+
+    def test_active_products_by_name(self):
+        factories.ProductFactory.create_batch(3)
+
+        self.assertUsesIndex(
+            models.Product.objects.active().order_by("name", "id")[:4],
+            index_name="product_active_name_idx",
+        )
+
+    def test_product_by_slug(self):
+        product = factories.ProductFactory()
+
+        self.assertUsesIndex(
+            models.Product.objects.filter(slug=product.slug)
+        )
+
+    def test_tag_by_slug(self):
+        models.ProductTag.objects.create(name="Tag", slug="tag")
+
+        self.assertUsesIndex(
+            models.ProductTag.objects.filter(slug="tag")
+        )
+
+    def test_products_by_tag(self):
+        tag = models.ProductTag.objects.create(name="Tag", slug="tag")
+        factories.ProductFactory().tags.add(tag)
+
+        products = models.Product.objects.active_with_tag(tag)
+
+        self.assertUsesIndex(
+            products.order_by("name", "id")[:4],
+            index_name="product_active_name_idx",
+        )
+
+    def test_orders_by_status_and_date(self):
+        factories.OrderFactory.create_batch(2)
+
+        self.assertUsesIndex(
+            models.Order.objects.filter(
+                status=models.Order.PAID,
+                date_added__gt=timezone.now() - timedelta(days=30),
+            ),
+            index_name="order_status_date_added_idx",
+        )
+
+    def test_open_basket_of_user(self):
+        user = factories.UserFactory()
+        models.Basket.objects.create(user=user)
+
+        self.assertUsesIndex(
+            models.Basket.objects.filter(
+                user=user, status=models.Basket.OPEN
+            ),
+            index_name="basket_user_status_idx",
+        )
+
+    def test_chat_history_of_order(self):
+        order = factories.OrderFactory()
+        models.ChatMessage.objects.create(
+            order=order, user=order.user, message="Hello"
+        )
+
+        self.assertUsesIndex(
+            models.ChatMessage.objects.filter(order=order).order_by(
+                "-created", "-id"
+            )[:50],
+            index_name="chatmessage_order_idx",
+        )
@@ -1,8 +1,21 @@
 from decimal import Decimal
-from django.test import TestCase
+from io import BytesIO
+from unittest.mock import patch
+import shutil
+import tempfile
+
+from PIL import Image
+
+from django.db import connection, transaction
+from django.forms import inlineformset_factory
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.core.files.images import ImageFile
+from django.urls import reverse
 
+from main import factories
 from main import models
+from main import renditions
 
 
 class TestSignal(TestCase):
@@ -10,37 +23,227 @@ class TestSignal(TestCase):
     TEST_PROD_PRICE = Decimal("10.00")
     TEST_PROD_FILENAME = "purple-rose-hand-embroidery"
 
-    def test_thumbnails_are_generated_on_save(self):
-        """
-        This test has a small problem: the test pic won't be deleted if the
-        test fails to pass.
-        """
-        product = models.Product(
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_root_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_root_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_root_override.disable()
+        shutil.rmtree(cls.media_root)
+
+    def setUp(self):
+        self.product = models.Product.objects.create(
             name=self.TEST_PROD_NAME, price=self.TEST_PROD_PRICE
         )
-        product.save()
 
+    def save_image(self, name="testpic_testsignal.jpg"):
         with open(
             file=f"main/fixtures/{self.TEST_PROD_FILENAME}.jpg", mode="rb"
         ) as f:
             image = models.ProductImage(
-                product=product,
-                image=ImageFile(f, name="testpic_testsignal.jpg"),
+                product=self.product, image=ImageFile(f, name=name),
             )
+            image.save()
 
-            with self.assertLogs("main", level="INFO") as cm:
-                image.save()
+        return image
+
+    @override_settings(RENDITIONS_EAGER=True)
+    def test_thumbnails_are_generated_on_save(self):
+        """
+        The renditions are stored under the digest of the image (the media
+        root is a temporary directory, nothing is left behind).
+        """
+        with self.assertLogs("main", level="INFO") as cm:
+            image = self.save_image()
 
         self.assertGreaterEqual(len(cm.output), 1)
         image.refresh_from_db()
 
-        with open(
-            file=f"main/fixtures/{self.TEST_PROD_FILENAME}.thumb.jpg",
-            mode="rb",
-        ) as f:
-            expected_content = f.read()
+        self.assertEqual(len(image.digest), 64)
+        self.assertEqual(
+            image.thumbnail.name,
+            renditions.rendition_path(image.digest, "thumbnail"),
+        )
+
+        thumbnail = Image.open(BytesIO(image.thumbnail.read()))
+        self.assertEqual(thumbnail.format, "JPEG")
+        self.assertLessEqual(max(thumbnail.size), 300)
+
+        medium = image.rendition_url("medium-webp")
+        self.assertTrue(medium.endswith(".webp"))
+
+    @override_settings(RENDITIONS_EAGER=True)
+    def test_identical_images_are_processed_once(self):
+        with patch.object(
+            renditions, "render", wraps=renditions.render
+        ) as mock_render:
+            first = self.save_image(name="first.jpg")
+            second = self.save_image(name="second.jpg")
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+
+        self.assertEqual(first.thumbnail.name, second.thumbnail.name)
+        self.assertEqual(mock_render.call_count, len(renditions.RENDITIONS))
+
+    @override_settings(RENDITIONS_EAGER=True)
+    def test_renditions_of_png_images(self):
+        png = BytesIO()
+        Image.new(mode="RGBA", size=(640, 480)).save(png, format="PNG")
+
+        image = models.ProductImage(
+            product=self.product, image=ImageFile(png, name="pic.png")
+        )
+        image.save()
+        image.refresh_from_db()
+
+        thumbnail = Image.open(BytesIO(image.thumbnail.read()))
+        self.assertEqual(thumbnail.format, "JPEG")
+        self.assertEqual(thumbnail.size, (300, 225))
+
+    def test_save_only_queues_the_renditions(self):
+        with patch.object(renditions, "generate_renditions") as mock_generate:
+            image = self.save_image()
+
+        mock_generate.assert_not_called()
+        image.refresh_from_db()
+        self.assertFalse(image.thumbnail)
+
+    @override_settings(RENDITIONS_EAGER=True)
+    def test_product_page_serves_the_webp_renditions(self):
+        self.product.slug = "cathedral-bazaar"
+        self.product.save()
+        image = self.save_image()
+        image.refresh_from_db()
+
+        response = self.client.get(
+            reverse("main:product", kwargs={"slug": self.product.slug})
+        )
+
+        self.assertContains(response, f'"image": "{image.image.url}"')
+        self.assertContains(response, f'"image_webp": "{image.webp_url}"')
+        self.assertContains(
+            response, f'"thumbnail_webp": "{image.thumbnail_webp_url}"'
+        )
+        self.assertTrue(image.thumbnail_webp_url.endswith(".webp"))
+
+
+class TestOrderStatusReconciler(TransactionTestCase):
+    """
+    The reconciliation happens on commit (hence no `TestCase`).
+    """
+
+    def setUp(self):
+        self.product = factories.ProductFactory()
+
+    def create_lines(self, order, count, status=models.OrderLine.NEW):
+        return [
+            factories.OrderLineFactory(
+                order=order, product=self.product, status=status
+            )
+            for _ in range(count)
+        ]
+
+    def order_updates(self, queries):
+        return [
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith('UPDATE "main_order"')
+        ]
+
+    def test_orders_are_reconciled_once_on_commit(self):
+        order = factories.OrderFactory(status=models.Order.PAID)
+        other = factories.OrderFactory(status=models.Order.PAID)
+        lines = self.create_lines(order, 20) + self.create_lines(other, 2)
+
+        with CaptureQueriesContext(connection) as ctx:
+            with transaction.atomic():
+                for line in lines[:-1]:
+                    line.status = models.OrderLine.SENT
+                    line.save()
+
+                order.refresh_from_db()
+                self.assertEqual(order.status, models.Order.PAID)
+
+        self.assertEqual(len(self.order_updates(ctx.captured_queries)), 1)
+        order.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(order.status, models.Order.DONE)
+        self.assertEqual(other.status, models.Order.PAID)
+
+    def test_done_orders_are_left_alone(self):
+        order = factories.OrderFactory(status=models.Order.DONE)
+        date_updated = order.date_updated
+
+        self.create_lines(order, 2, status=models.OrderLine.SENT)
+
+        order.refresh_from_db()
+        self.assertEqual(order.date_updated, date_updated)
+
+    def test_rolled_back_lines_do_not_count(self):
+        order = factories.OrderFactory(status=models.Order.PAID)
+        (line,) = self.create_lines(order, 1)
+
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                line.status = models.OrderLine.SENT
+                line.save()
+                raise RuntimeError
+
+        self.create_lines(order, 1, status=models.OrderLine.SENT)
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, models.Order.PAID)
+
+    def formset(self, order, lines, **changes):
+        """
+        The lines of the order as posted by the central office inline.
+        """
+        formset_class = inlineformset_factory(
+            models.Order,
+            models.OrderLine,
+            fields=("quantity", "status"),
+            extra=0,
+        )
+        data = {
+            "lines-TOTAL_FORMS": len(lines),
+            "lines-INITIAL_FORMS": len(lines),
+        }
+        for i, line in enumerate(lines):
+            fields = {"quantity": line.quantity, "status": line.status}
+            fields.update(changes)
+            data[f"lines-{i}-id"] = line.id
+            data[f"lines-{i}-order"] = order.id
+            for name, value in fields.items():
+                data[f"lines-{i}-{name}"] = value
+
+        formset = formset_class(data, instance=order)
+        self.assertTrue(formset.is_valid(), formset.errors)
+
+        return formset
+
+    def test_formset_of_50_lines_costs_an_update_per_line(self):
+        order = factories.OrderFactory(status=models.Order.PAID)
+        lines = self.create_lines(order, 50)
+
+        # The update of each line, then the reconciliation (and BEGIN)
+        formset = self.formset(order, lines, status=models.OrderLine.SENT)
+        with self.assertNumQueries(1 + 50 + 1):
+            with transaction.atomic():
+                formset.save()
 
-            assert image.thumbnail.read() == expected_content
+        order.refresh_from_db()
+        self.assertEqual(order.status, models.Order.DONE)
 
-        image.thumbnail.delete(save=False)
-        image.image.delete(save=False)
+        # Plus the day of the order, then the daily stats, daily and monthly
+        # sales of that day, created if need be and updated once (in their
+        # transaction)
+        formset = self.formset(order, order.lines.all(), quantity=2)
+        with self.assertNumQueries(1 + 50 + 1 + 7 + 1):
+            with transaction.atomic():
+                formset.save()
@@ -1,10 +1,16 @@
+from datetime import timedelta
 from decimal import Decimal
 from unittest.mock import patch
 
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib import auth
+from django.utils import timezone
 
+from main import caching
+from main import factories
 from main import forms
 from main import models
 
@@ -264,3 +270,295 @@ class TestPage(TestCase):
 
         basket = models.Basket.objects.get(user=user1)
         self.assertEquals(basket.count(), 3)
+
+    def test_product_pages_do_not_query_baskets(self):
+        basket = models.Basket.objects.create()
+        session = self.client.session
+        session["basket_id"] = basket.id
+        session.save()
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(
+                path=reverse("main:products", kwargs={"tag": "all"})
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(
+            [q for q in ctx.captured_queries if "main_basket" in q["sql"]]
+        )
+
+    def test_basket_resolves_with_several_open_baskets(self):
+        user1 = models.User.objects.create_user(
+            email=self.TEST_SIGNUP_EMAIL, password=self.TEST_SIGNUP_PASSWORD
+        )
+        prod1 = models.Product.objects.create(
+            name="Zero to One", slug="zero-to-one", price=Decimal("13.50"),
+        )
+        models.Basket.objects.create(user=user1)
+        newest = models.Basket.objects.create(user=user1)
+        models.BasketLine.objects.create(basket=newest, product=prod1)
+
+        self.client.force_login(user=user1)
+        response = self.client.get(path=reverse(viewname="main:basket"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.basket, newest)
+        self.assertEqual(self.client.session["basket_id"], newest.id)
+
+    def test_add_to_basket_with_quantity_returns_json_for_xhr(self):
+        prod1 = models.Product.objects.create(
+            name="Zero to One", slug="zero-to-one", price=Decimal("13.50"),
+        )
+
+        response = self.client.get(
+            path=reverse(viewname=self.URL_ADD_TO_BASKET),
+            data={"product_id": prod1.id, "quantity": 2},
+            HTTP_X_REQUESTED_WITH="XMLHttpRequest",
+        )
+        self.assertEqual(response.status_code, 200)
+
+        data = response.json()
+        self.assertEqual(data["item_count"], 2)
+        self.assertEqual(data["line_count"], 1)
+        self.assertEqual(data["total"], "27.00")
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(
+                path=reverse(viewname=self.URL_ADD_TO_BASKET),
+                data={"product_id": prod1.id},
+                HTTP_X_REQUESTED_WITH="XMLHttpRequest",
+            )
+
+        self.assertEqual(response.json()["item_count"], 3)
+        self.assertEqual(models.BasketLine.objects.get().quantity, 3)
+        self.assertFalse(
+            [q for q in ctx.captured_queries if "INSERT" in q["sql"]]
+        )
+
+    def test_add_to_basket_rejects_invalid_quantity(self):
+        prod1 = models.Product.objects.create(
+            name="Zero to One", slug="zero-to-one", price=Decimal("13.50"),
+        )
+
+        for quantity in ("0", "-1", "many", "101", "10" * 20):
+            response = self.client.get(
+                path=reverse(viewname=self.URL_ADD_TO_BASKET),
+                data={"product_id": prod1.id, "quantity": quantity},
+            )
+            self.assertEqual(response.status_code, 400)
+
+        self.assertFalse(models.BasketLine.objects.exists())
+
+    @override_settings(MAX_BASKET_QUANTITY=5)
+    def test_add_to_basket_caps_the_copies_of_a_product(self):
+        prod1 = models.Product.objects.create(
+            name="Zero to One", slug="zero-to-one", price=Decimal("13.50"),
+        )
+        url = reverse(viewname=self.URL_ADD_TO_BASKET)
+
+        for quantity, status_code in ((3, 302), (2, 302), (1, 400)):
+            response = self.client.get(
+                path=url, data={"product_id": prod1.id, "quantity": quantity}
+            )
+            self.assertEqual(response.status_code, status_code)
+
+        basket = models.Basket.objects.get()
+        self.assertEqual(basket.basketline_set.get().quantity, 5)
+        self.assertEqual(basket.item_count, 5)
+        self.assertEqual(basket.total, Decimal("67.50"))
+
+    @override_settings(PRODUCT_LIST_PAGE_SIZE=3)
+    def test_products_page_walks_pages_with_cursors(self):
+        for name in "GFEDCBA":
+            models.Product.objects.create(
+                name=f"Book {name}", slug=f"book-{name}", price=Decimal(1)
+            )
+        url = reverse("main:products", kwargs={"tag": "all"})
+
+        def names(response):
+            return [p.name[-1] for p in response.context["object_list"]]
+
+        response = self.client.get(path=url)
+        self.assertEqual(names(response), ["A", "B", "C"])
+        self.assertIsNone(response.context["previous_cursor"])
+
+        response = self.client.get(
+            path=url, data={"after": response.context["next_cursor"]}
+        )
+        self.assertEqual(names(response), ["D", "E", "F"])
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(
+                path=url, data={"after": response.context["next_cursor"]}
+            )
+        self.assertEqual(names(response), ["G"])
+        self.assertIsNone(response.context["next_cursor"])
+        self.assertFalse(
+            [q for q in ctx.captured_queries if "OFFSET" in q["sql"]]
+        )
+
+        response = self.client.get(
+            path=url, data={"before": response.context["previous_cursor"]}
+        )
+        self.assertEqual(names(response), ["D", "E", "F"])
+
+        response = self.client.get(
+            path=url, data={"before": response.context["previous_cursor"]}
+        )
+        self.assertEqual(names(response), ["A", "B", "C"])
+        self.assertIsNone(response.context["previous_cursor"])
+
+        response = self.client.get(path=url, data={"after": "garbage"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_products_page_caches_tag_lookups(self):
+        prod1 = models.Product.objects.create(
+            name="Purple Rose Hand Embroidery",
+            slug="purple-rose-hand-embroidery",
+            price=Decimal(23.16),
+        )
+        prod1.tags.create(name="magnificent", slug="magnificent")
+        url = reverse(viewname="main:products", kwargs={"tag": "magnificent"})
+
+        self.client.get(path=url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(path=url)
+
+        self.assertEqual(list(response.context["object_list"]), [prod1])
+        self.assertFalse(
+            [
+                q
+                for q in ctx.captured_queries
+                if 'FROM "main_producttag"' in q["sql"]
+            ]
+        )
+
+        response = self.client.get(
+            path=reverse(viewname="main:products", kwargs={"tag": "nope"})
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_product_page_is_cached_for_anonymous_visitors(self):
+        caching.get_cache().clear()
+        prod1 = models.Product.objects.create(
+            name="Zero to One", slug="zero-to-one", price=Decimal("13.50"),
+        )
+        url = reverse(viewname="main:product", args=(prod1.slug,))
+
+        response = self.client.get(path=url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "No tags available")
+
+        with self.assertNumQueries(0):
+            response = self.client.get(path=url)
+        self.assertContains(response, "Zero to One")
+
+        # Saving the product and changing its tags both invalidate the page
+        prod1.name = "Zero to Two"
+        prod1.save()
+        self.assertContains(self.client.get(path=url), "Zero to Two")
+
+        prod1.tags.create(name="startups", slug="startups")
+        self.assertContains(self.client.get(path=url), "startups")
+
+        tag = models.ProductTag.objects.get(slug="startups")
+        tag.name = "business"
+        tag.save()
+        self.assertContains(self.client.get(path=url), "business")
+
+        # Nothing is left at the old address of a renamed product
+        prod1.slug = "zero-to-two"
+        prod1.save()
+        self.assertEqual(self.client.get(path=url).status_code, 404)
+
+    @override_settings(CHAT_HISTORY_SIZE=2)
+    def test_chat_history_is_paginated_backwards(self):
+        owner = models.User.objects.create_user(
+            email=self.TEST_SIGNUP_EMAIL, password=self.TEST_SIGNUP_PASSWORD
+        )
+        order = factories.OrderFactory(user=owner)
+        start = timezone.now()
+        models.ChatMessage.objects.bulk_create(
+            [
+                models.ChatMessage(
+                    order=order,
+                    user=owner,
+                    message=f"Message {i}",
+                    created=start + timedelta(seconds=i),
+                )
+                for i in range(5)
+            ]
+        )
+        url = reverse(
+            viewname="main:customer_service_history",
+            kwargs={"order_id": order.id},
+        )
+
+        self.assertEqual(self.client.get(path=url).status_code, 302)
+        self.client.force_login(owner)
+
+        pages = []
+        data = {}
+        while True:
+            response = self.client.get(path=url, data=data).json()
+            pages.append([m["message"] for m in response["messages"]])
+
+            if response["before"] is None:
+                break
+            data = {"before": response["before"]}
+
+        self.assertEqual(
+            pages,
+            [
+                ["Message 3", "Message 4"],
+                ["Message 1", "Message 2"],
+                ["Message 0"],
+            ],
+        )
+        self.assertEqual(
+            self.client.get(path=url, data={"before": "soon"}).status_code,
+            400,
+        )
+
+    @override_settings(CHAT_HISTORY_SIZE=2)
+    def test_chat_history_pages_split_messages_of_the_same_moment(self):
+        owner = models.User.objects.create_user(
+            email=self.TEST_SIGNUP_EMAIL, password=self.TEST_SIGNUP_PASSWORD
+        )
+        order = factories.OrderFactory(user=owner)
+        # Written by the same flush of the buffer
+        created = timezone.now()
+        models.ChatMessage.objects.bulk_create(
+            [
+                models.ChatMessage(
+                    order=order,
+                    user=owner,
+                    message=f"Message {i}",
+                    created=created,
+                )
+                for i in range(5)
+            ]
+        )
+        url = reverse(
+            viewname="main:customer_service_history",
+            kwargs={"order_id": order.id},
+        )
+        self.client.force_login(owner)
+
+        messages = []
+        data = {}
+        while True:
+            response = self.client.get(path=url, data=data).json()
+            messages = [m["message"] for m in response["messages"]] + messages
+
+            if response["before"] is None:
+                break
+            data = {"before": response["before"]}
+
+        self.assertEqual(messages, [f"Message {i}" for i in range(5)])
+
+        # A bare moment is before all of its messages
+        response = self.client.get(
+            path=url, data={"before": created.isoformat()}
+        )
+        self.assertEqual(response.json()["messages"], [])
@@ -1,11 +1,10 @@
 from django.urls import path, include
-from django.views.generic import TemplateView, DetailView
+from django.views.generic import TemplateView
 from django.contrib.auth import views as auth_views
 
 from rest_framework import routers as rest_routers
 
 from main import views, forms
-from main import models
 from main import endpoints
 
 app_name = "main"
@@ -28,7 +27,7 @@ urlpatterns = [
     ),
     path(
         route="product/<slug:slug>/",
-        view=DetailView.as_view(model=models.Product),
+        view=views.ProductDetailView.as_view(),
         name="product",
     ),
     # Product Address
@@ -63,6 +62,11 @@ urlpatterns = [
         view=views.OrderView.as_view(),
         name="order_dashboard",
     ),
+    path(
+        route="order-export/<slug:dataset>.<slug:fmt>",
+        view=views.OrderExportView.as_view(),
+        name="order_export",
+    ),
     path(
         route="order/done/",
         view=TemplateView.as_view(template_name="order_done.html"),
@@ -85,6 +89,16 @@ urlpatterns = [
         view=views.room,
         name="customer_service_chat",
     ),
+    path(
+        route="customer-service/<int:order_id>/presence/",
+        view=views.order_presence,
+        name="customer_service_presence",
+    ),
+    path(
+        route="customer-service/<int:order_id>/history/",
+        view=views.order_chat_history,
+        name="customer_service_history",
+    ),
     path(
         route="contact-us/",
         view=views.ContactUsView.as_view(),
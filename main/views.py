@@ -1,5 +1,9 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import json
 import logging
 
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic.edit import (
     FormView,
@@ -8,20 +12,36 @@ from django.views.generic.edit import (
     DeleteView,
 )
 
+from django.views.generic.base import View
+from django.views.generic.detail import DetailView
 from django.views.generic.list import ListView
 from django.shortcuts import get_object_or_404, render
 from django.contrib.auth import login, authenticate
 from django.contrib import messages
 from django.urls import reverse_lazy, reverse
-from django.http import HttpResponseRedirect
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.core.exceptions import PermissionDenied
+from django.utils.dateparse import parse_datetime
 from django import forms as django_forms
 from django.db import models as django_models
 
 import django_filters
 from django_filters.views import FilterView
 
+from main import caching
+from main import chat
+from main import exceptions
+from main import exports
 from main import forms
 from main import models
+from main.presence import get_presence, room_name, run_sync
 
 
 logger = logging.getLogger(name=__name__)
@@ -42,32 +62,143 @@ class ContactUsView(FormView):
         return super().form_valid(form)
 
 
+def encode_cursor(product):
+    """
+    A cursor is the position of a product in the `(name, id)` ordering.
+    """
+    position = json.dumps([product.name, product.id]).encode()
+    return urlsafe_b64encode(position).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        name, pk = json.loads(urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError):
+        raise Http404("Invalid cursor")
+
+    if not isinstance(name, str) or not isinstance(pk, int):
+        raise Http404("Invalid cursor")
+
+    return name, pk
+
+
 class ProductListView(ListView):
     """
     This view could be used for displaying products by kind or simply all.
 
     [Note]
-    You might found that there are lots of never-appeared variable names in
-    the templates, it actually all derived from the pagination part, the
-    file is: 'YOUR_ENV/lib/python3.?/site-packages/Django/core/paginator.py'.
+    Instead of page numbers (OFFSET), the pages are addressed by a cursor, i.e.
+    the `(name, id)` of the first or last product shown. The database never
+    needs to count or skip over rows, a deep page costs the same as page 1.
     """
 
     template_name = "product_list.html"
-    paginate_by = 3
+
+    def get_page_size(self):
+        return settings.PRODUCT_LIST_PAGE_SIZE
 
     def get_queryset(self):
         arg_tag = self.kwargs["tag"]
         self.tag = None
 
         if arg_tag != "all":
-            self.tag = get_object_or_404(models.ProductTag, slug=arg_tag)
+            try:
+                self.tag = models.ProductTag.objects.get_by_slug_cached(
+                    arg_tag
+                )
+            except models.ProductTag.DoesNotExist:
+                raise Http404("No tag matches the given query.")
 
         if self.tag:
-            products = models.Product.objects.active().filter(tags=self.tag)
+            products = models.Product.objects.active_with_tag(self.tag)
         else:
             products = models.Product.objects.active()
 
-        return products.order_by("name")
+        return products.order_by("name", "id")
+
+    def paginate_by_cursor(self, queryset):
+        """
+        Fetch one more product than needed to know whether there is another
+        page in the direction we are heading to.
+        """
+        page_size = self.get_page_size()
+        after = self.request.GET.get("after")
+        before = self.request.GET.get("before")
+
+        if before:
+            name, pk = decode_cursor(before)
+            queryset = queryset.filter(
+                django_models.Q(name__lt=name)
+                | django_models.Q(name=name, id__lt=pk)
+            ).order_by("-name", "-id")
+        elif after:
+            name, pk = decode_cursor(after)
+            queryset = queryset.filter(
+                django_models.Q(name__gt=name)
+                | django_models.Q(name=name, id__gt=pk)
+            )
+
+        products = list(queryset[: page_size + 1])
+        has_more = len(products) > page_size
+        products = products[:page_size]
+
+        if before:
+            products.reverse()
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = bool(after), has_more
+
+        previous_cursor = None
+        next_cursor = None
+        if products and has_previous:
+            previous_cursor = encode_cursor(products[0])
+        if products and has_next:
+            next_cursor = encode_cursor(products[-1])
+
+        return products, previous_cursor, next_cursor
+
+    def get_context_data(self, **kwargs):
+        products, previous_cursor, next_cursor = self.paginate_by_cursor(
+            self.object_list
+        )
+
+        kwargs["object_list"] = products
+        kwargs["previous_cursor"] = previous_cursor
+        kwargs["next_cursor"] = next_cursor
+
+        return super().get_context_data(**kwargs)
+
+
+class ProductDetailView(DetailView):
+    """
+    The whole page is cached for anonymous visitors (most of the catalog
+    traffic), they won't need the database at all on a cache hit.
+
+    Pages carrying flash messages are personal, those are never cached.
+    """
+
+    model = models.Product
+
+    def is_cacheable(self, request):
+        return (
+            request.method == "GET"
+            and not request.user.is_authenticated
+            and not len(messages.get_messages(request))
+        )
+
+    def get(self, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return super().get(request, *args, **kwargs)
+
+        content = caching.get_product_page(self.kwargs["slug"])
+        if content is not None:
+            return HttpResponse(content)
+
+        response = super().get(request, *args, **kwargs)
+        response.render()
+        caching.set_product_page(self.object, response.content)
+
+        return response
 
 
 class SignupView(FormView):
@@ -190,21 +321,37 @@ class AddressSelectonView(LoginRequiredMixin, FormView):
         return kwargs
 
     def form_valid(self, form):
-        del self.request.session["basket_id"]
-
         basket = self.request.basket
         basket.create_order(
             billing_address=form.cleaned_data["billing_address"],
             shipping_address=form.cleaned_data["shipping_address"],
         )
 
+        # The basket is resolved lazily, forget about it only after using it.
+        self.request.session.pop("basket_id", None)
+
         return super().form_valid(form)
 
 
 def add_to_basket(request):
+    """
+    Add the product to the basket (`quantity` copies of it, default to one).
+
+    XHR clients get a small JSON summary of the basket back, the others are
+    redirected to the product page just like before.
+    """
     product = get_object_or_404(
         models.Product, pk=request.GET.get("product_id")
     )
+
+    try:
+        quantity = int(request.GET.get("quantity", 1))
+    except ValueError:
+        quantity = 0
+
+    if not 1 <= quantity <= settings.MAX_BASKET_QUANTITY:
+        return HttpResponseBadRequest("Invalid quantity")
+
     basket = request.basket
 
     if not request.basket:
@@ -216,13 +363,22 @@ def add_to_basket(request):
         basket = models.Basket.objects.create(user=user)
         request.session["basket_id"] = basket.id
 
-    basketline, created = models.BasketLine.objects.get_or_create(
-        basket=basket, product=product
-    )
+    try:
+        basket.add_product(product=product, quantity=quantity)
+    except exceptions.BasketException as e:
+        return HttpResponseBadRequest(str(e))
+
+    if request.is_ajax():
+        basket.refresh_from_db(fields=["item_count", "line_count", "total"])
 
-    if not created:
-        basketline.quantity += 1
-        basketline.save()
+        return JsonResponse(
+            {
+                "basket_id": basket.id,
+                "item_count": basket.item_count,
+                "line_count": basket.line_count,
+                "total": str(basket.total),
+            }
+        )
 
     return HttpResponseRedirect(
         redirect_to=reverse(viewname="main:product", args=(product.slug,))
@@ -238,15 +394,20 @@ def manage_basket(request):
             context={"formset": None},
         )
 
+    # The page shows the product of each line
+    lines = models.BasketLine.objects.select_related("product")
+
     if request.method == "POST":
         formset = forms.BasketLineFormSet(
-            request.POST, instance=request.basket
+            request.POST, instance=request.basket, queryset=lines
         )
 
         if formset.is_valid():
             formset.save()
     else:
-        formset = forms.BasketLineFormSet(instance=request.basket)
+        formset = forms.BasketLineFormSet(
+            instance=request.basket, queryset=lines
+        )
 
     # Do "have" basket but nothing was added yet
     if request.basket.is_empty():
@@ -302,11 +463,45 @@ class OrderView(UserPassesTestMixin, FilterView):
     """
 
     filterset_class = OrderFilter  # attribute of FilterView
+    # The table shows the users of each order
+    queryset = models.Order.objects.select_related("user", "last_spoken_to")
+    login_url = reverse_lazy(viewname="main:login")
+
+    def test_func(self):
+        return self.request.user.is_staff is True
+
+
+class OrderExportView(UserPassesTestMixin, View):
+    """
+    Stream all the orders (or their lines) matching the filters of the
+    dashboard, e.g. '/order-export/lines.csv?status=20&date_added__gt=...'.
+    """
+
     login_url = reverse_lazy(viewname="main:login")
 
     def test_func(self):
         return self.request.user.is_staff is True
 
+    def get(self, request, dataset, fmt):
+        if dataset not in exports.DATASETS or fmt not in exports.FORMATS:
+            raise Http404("No such export")
+
+        filterset = OrderFilter(
+            data=request.GET, queryset=models.Order.objects.all()
+        )
+        if not filterset.is_valid():
+            return HttpResponseBadRequest("Invalid filters")
+
+        response = StreamingHttpResponse(
+            streaming_content=exports.export(dataset, fmt, filterset.qs),
+            content_type=exports.FORMATS[fmt][1],
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="{dataset}.{fmt}"'
+        )
+
+        return response
+
 
 def room(request, order_id):
     return render(
@@ -314,3 +509,79 @@ def room(request, order_id):
         template_name="chat_room.html",
         context={"room_name_json": str(order_id)},
     )
+
+
+def get_chat_order(request, order_id):
+    """
+    The order, if the user may join its customer-service chat (employees and
+    the owner of the order).
+    """
+    order = get_object_or_404(models.Order, pk=order_id)
+
+    if not (request.user.is_employee or order.user_id == request.user.id):
+        raise PermissionDenied
+
+    return order
+
+
+@login_required
+def order_presence(request, order_id):
+    """
+    Who is online in the customer-service chat of an order.
+    """
+    get_chat_order(request, order_id)
+
+    online = run_sync(get_presence().online(room_name(order_id)))
+
+    return JsonResponse({"order": order_id, "online": online})
+
+
+def decode_history_cursor(cursor):
+    """
+    The `(created, id)` of a cursor of the chat history, None if invalid.
+    """
+    created, _, pk = cursor.partition(",")
+
+    try:
+        created = parse_datetime(created)
+        # Before all the messages of that moment
+        pk = int(pk) if pk else 0
+    except ValueError:
+        return None
+
+    if created is None:
+        return None
+
+    return created, pk
+
+
+@login_required
+def order_chat_history(request, order_id):
+    """
+    The messages of the customer-service chat of an order, a page at a time
+    starting from the latest one, `?before=<the before of a page>` gives the
+    page before it. The cursor is the `<created>,<id>` of the oldest message
+    of the page (a bare `<created>` is still understood).
+    """
+    get_chat_order(request, order_id)
+
+    before = None
+    if "before" in request.GET:
+        before = decode_history_cursor(request.GET["before"])
+
+        if before is None:
+            return HttpResponseBadRequest("Invalid cursor")
+
+    messages, has_more = chat.history(order_id, before=before)
+
+    return JsonResponse(
+        {
+            "order": order_id,
+            "messages": [chat.serialize(message) for message in messages],
+            "before": (
+                f"{messages[0].created.isoformat()},{messages[0].id}"
+                if has_more
+                else None
+            ),
+        }
+    )